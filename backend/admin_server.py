@@ -12,6 +12,9 @@ import os
 import uuid
 from datetime import datetime
 import subprocess
+import urllib.request
+
+from metrics import instrument, register_stats, stage
 
 app = FastAPI(title="ECLA Admin API")
 
@@ -24,11 +27,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Durée de chaque étape : en-tête Server-Timing + /metrics (Prometheus)
+instrument(app, "admin")
+
 # === CHEMINS DES FICHIERS ===
 DOCUMENTS_FILE = "ecla_chunks_classified.jsonl"
 APARTMENTS_FILE = "apartments_ecla_real.jsonl"
 COLORS_CONFIG_FILE = "chat_colors_config.json"
 
+# Serveur de recherche à prévenir après chaque ré-indexation (rechargement du catalogue)
+SEARCH_SERVER_URL = os.getenv("SEARCH_SERVER_URL", "http://localhost:8000")
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "")  # Même valeur que sur le serveur de recherche
+
 # === ÉTAT DE L'INDEXATION ===
 indexing_status = {
     "in_progress": False,
@@ -113,25 +123,41 @@ def save_colors_config(config: dict):
 
 # === FONCTIONS DE RÉ-INDEXATION ===
 
+def notify_search_server(kind: str):
+    """Prévenir le serveur de recherche qu'une ré-indexation vient de se terminer"""
+    try:
+        request = urllib.request.Request(
+            f"{SEARCH_SERVER_URL}/internal/reindex",
+            data=json.dumps({"kind": kind}).encode("utf-8"),
+            headers={"Content-Type": "application/json", "X-Internal-Token": INTERNAL_API_TOKEN},
+            method="POST"
+        )
+        with stage("notify_search"), urllib.request.urlopen(request, timeout=30) as response:
+            print(f"[REINDEX] Serveur de recherche notifié ({kind}): {response.status}")
+    except Exception as e:
+        print(f"[WARNING] Impossible de notifier le serveur de recherche: {e}")
+
 def reindex_documents():
     """Ré-indexer les documents en arrière-plan"""
     indexing_status["in_progress"] = True
     indexing_status["last_action"] = "Ré-indexation documents..."
     try:
         print("[REINDEX] Démarrage ré-indexation documents...")
-        result = subprocess.run(
-            ["python", "ingest_qdrant.py"],
-            cwd="/app",
-            capture_output=True,
-            text=True,
-            timeout=300
-        )
+        with stage("reindex_documents"):
+            result = subprocess.run(
+                ["python", "ingest_qdrant.py"],
+                cwd="/app",
+                capture_output=True,
+                text=True,
+                timeout=300
+            )
         
         if result.returncode == 0:
             indexing_status["last_update"] = datetime.now().isoformat()
             indexing_status["documents_count"] = count_documents()
             indexing_status["last_action"] = "Documents ré-indexés avec succès"
             print("[REINDEX] Documents ré-indexés avec succès")
+            notify_search_server("documents")
         else:
             error_msg = result.stderr if result.stderr else "Erreur inconnue"
             indexing_status["last_action"] = f"Erreur: {error_msg}"
@@ -148,19 +174,21 @@ def reindex_apartments():
     indexing_status["last_action"] = "Ré-indexation appartements..."
     try:
         print("[REINDEX] Démarrage ré-indexation appartements...")
-        result = subprocess.run(
-            ["python", "ingest_apartments.py"],
-            cwd="/app",
-            capture_output=True,
-            text=True,
-            timeout=300
-        )
+        with stage("reindex_apartments"):
+            result = subprocess.run(
+                ["python", "ingest_apartments.py"],
+                cwd="/app",
+                capture_output=True,
+                text=True,
+                timeout=300
+            )
         
         if result.returncode == 0:
             indexing_status["last_update"] = datetime.now().isoformat()
             indexing_status["apartments_count"] = count_apartments()
             indexing_status["last_action"] = "Appartements ré-indexés avec succès"
             print("[REINDEX] Appartements ré-indexés avec succès")
+            notify_search_server("apartments")
         else:
             error_msg = result.stderr if result.stderr else "Erreur inconnue"
             indexing_status["last_action"] = f"Erreur: {error_msg}"
@@ -185,6 +213,14 @@ def count_apartments() -> int:
     with open(APARTMENTS_FILE, "r", encoding="utf-8") as f:
         return sum(1 for _ in f)
 
+def admin_metrics():
+    """État de l'indexation pour /metrics"""
+    yield ("admin_indexing_in_progress", "Ré-indexation en cours", "gauge", {}, int(indexing_status["in_progress"]))
+    yield ("admin_indexed_items", "Éléments indexés", "gauge", {"kind": "documents"}, indexing_status["documents_count"])
+    yield ("admin_indexed_items", "Éléments indexés", "gauge", {"kind": "apartments"}, indexing_status["apartments_count"])
+
+register_stats(admin_metrics)
+
 # === ENDPOINTS DE STATUT ===
 
 @app.get("/")
@@ -575,7 +611,8 @@ async def upload_document_file(
         file_content = await file.read()
         
         # Extraire et découper en chunks
-        chunks = extract_and_chunk_file(file.filename, file_content, max_chunk_length=500)
+        with stage("extract"):
+            chunks = extract_and_chunk_file(file.filename, file_content, max_chunk_length=500)
         
         if not chunks:
             raise HTTPException(400, "Aucun texte exploitable dans le fichier")
@@ -0,0 +1,75 @@
+"""
+Cards d'appartements calculées une fois pour toutes à l'ingestion
+Le payload Qdrant d'un appartement contient la card prête à servir ("card") et le nom de typologie :
+le serveur de recherche n'a plus qu'à y ajouter la description et le score
+"""
+
+# Valeurs par défaut des champs de card absents des métadonnées
+CARD_DEFAULTS = {
+    "typologie_id": "",
+    "city": "",
+    "rooms": 1,
+    "surface_m2": 0,
+    "surface_min": 0,
+    "surface_max": 0,
+    "furnished": False,
+    "rent_cc_eur": 0,
+    "availability_date": "",
+    "energy_label": "",
+    "postal_code": "",
+    "floor": 0,
+    "orientation": "Nord",
+    "bed_size": 140,
+    "has_ac": False,
+    "application_fee": 100,
+    "deposit_months": 1,
+    "is_typologie": False,
+}
+
+# Champs gardés à la racine du payload : filtres Qdrant (index de payload) et catalogue en mémoire
+FILTER_FIELDS = ("city", "rooms", "surface_m2", "rent_cc_eur", "furnished", "availability_date", "typologie_id")
+
+
+def typologie_label(rooms: int, surface_m2: float) -> str:
+    """Nom de la typologie : Colocation (0 pièce), Studio/T1 (seuil 23 m²), T2, T3..."""
+    if rooms == 0:
+        return "Colocation"
+    if rooms == 1:
+        return "Studio" if surface_m2 < 23 else "T1"
+    return f"T{rooms}"
+
+
+def build_card(apartment_id: str, metadata: dict) -> dict:
+    """Card canonique (sans description ni score), champs manquants complétés par les valeurs par défaut"""
+    return {"id": apartment_id, **{field: metadata.get(field, default) for field, default in CARD_DEFAULTS.items()}}
+
+
+def apartment_payload(apt: dict) -> dict:
+    """Payload Qdrant d'un appartement du JSONL ({"id", "text", "metadata"})"""
+    metadata = apt["metadata"]
+    card = build_card(apt["id"], metadata)
+    return {
+        "content": apt["text"],
+        "type": "appartement",  # Important pour filtrer par type
+        "apartment_id": apt["id"],
+        "url": f"mailto:contact@uxco-management.com?subject=Appartement {apt['id']}",
+        "lang": "fr",
+        "typologie_label": typologie_label(card["rooms"], card["surface_m2"]),
+        "card": card,
+        **{field: card[field] for field in FILTER_FIELDS},
+    }
+
+
+# Fourchette de surface : présente seulement dans les cards de la recherche élargie
+BROADENED_ONLY_FIELDS = ("surface_min", "surface_max")
+
+
+def card_from_payload(payload: dict, broadened: bool = False) -> dict:
+    """
+    Card d'un point Qdrant ; les points indexés avant les cards précalculées sont convertis à la volée
+    Mêmes champs que les cards construites par la recherche : principale, ou élargie (`broadened`)
+    """
+    card = payload.get("card") or build_card(payload.get("apartment_id", ""), payload)
+    if broadened:
+        return card
+    return {field: value for field, value in card.items() if field not in BROADENED_ONLY_FIELDS}
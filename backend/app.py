@@ -7,7 +7,7 @@ from urllib.parse import urljoin, urlparse
 from langdetect import detect
 from flask import Flask, render_template_string, request
 import os
-from openai import OpenAI
+from openai_transport import make_openai_client
 from dotenv import load_dotenv
 import time
 
@@ -62,7 +62,7 @@ def classify_chunks(file_path, output_path):
     with open(file_path, 'r', encoding='utf-8') as f:
         chunks = [json.loads(line) for line in f]
 
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    client = make_openai_client(api_key=os.getenv("OPENAI_API_KEY"))
     batch_size = 10
     enriched_chunks = []
 
@@ -0,0 +1,276 @@
+"""
+Test de charge hors ligne de /search (aucun appel réseau externe)
+1. Lance le faux serveur OpenAI (bench/stub_openai.py) avec les latences demandées
+2. Remplit un Qdrant embarqué à partir des JSONL du dépôt (bench/seed_qdrant.py)
+3. Lance search_server sur ces deux stand-ins
+4. Rejoue des conversations multi-tours (bench/conversations.json) au débit cible
+5. Affiche p50/p95/p99 et débit, au total et par étape (en-tête Server-Timing)
+
+Pour lancer : python bench/run_bench.py --rps 5 --duration 30
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+
+class Conversation:
+    """Conversation rejouée tour par tour, l'historique reprenant les réponses du serveur"""
+
+    def __init__(self, turns: list[str]):
+        self.turns = turns
+        self.index = 0
+        self.history: list[dict] = []
+        self.busy = False
+
+    @property
+    def finished(self) -> bool:
+        return self.index >= len(self.turns)
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Percentile par rang le plus proche"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def parse_server_timing(header: str) -> dict:
+    """"intent_llm;dur=12.3, total;dur=40.1" -> {"intent_llm": 12.3, "total": 40.1}"""
+    timings = {}
+    for entry in filter(None, (e.strip() for e in (header or "").split(","))):
+        name, *params = entry.split(";")
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                timings[name.strip()] = float(value)
+    return timings
+
+
+async def send_search(client: httpx.AsyncClient, conversation: Conversation, endpoint: str) -> dict:
+    query = conversation.turns[conversation.index]
+    body = {"query": query, "summarize": True, "conversation_history": conversation.history}
+    start = time.perf_counter()
+    result = {"turn": conversation.index, "status": 0, "stages": {}}
+
+    if endpoint == "/search/stream":
+        answer = ""
+        async with client.stream("POST", endpoint, json=body) as response:
+            result["status"] = response.status_code
+            event = None
+            async for line in response.aiter_lines():
+                now = (time.perf_counter() - start) * 1000
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                    # Durées côté client jusqu'au premier événement de chaque type
+                    result["stages"].setdefault(f"first_{event}", now)
+                elif line.startswith("data: ") and event == "done":
+                    answer = json.loads(line[len("data: "):]).get("answer", "")
+                elif line.startswith("data: ") and event == "error":
+                    result["status"] = 599
+    else:
+        response = await client.post(endpoint, json=body)
+        result["status"] = response.status_code
+        result["stages"] = parse_server_timing(response.headers.get("server-timing", ""))
+        result["stages"].pop("total", None)
+        answer = response.json().get("answer", "") if response.status_code == 200 else ""
+
+    result["latency"] = (time.perf_counter() - start) * 1000
+    conversation.history.extend([
+        {"role": "user", "content": query},
+        {"role": "assistant", "content": answer},
+    ])
+    return result
+
+
+async def replay(base_url: str, conversations: list[list[str]], rps: float, duration: float,
+                 endpoint: str, timeout: float) -> tuple[list[dict], float]:
+    """
+    Charge en boucle ouverte : une requête toutes les 1/rps secondes (arrivées de Poisson),
+    tour suivant d'une conversation en attente, ou nouvelle conversation
+    """
+    results: list[dict] = []
+    active: list[Conversation] = []
+    tasks = set()
+
+    async def run(client, conversation):
+        try:
+            results.append(await send_search(client, conversation, endpoint))
+        except Exception as e:
+            results.append({"turn": conversation.index, "status": 0, "error": repr(e),
+                            "latency": timeout * 1000, "stages": {}})
+        finally:
+            conversation.index += 1
+            conversation.busy = False
+
+    limits = httpx.Limits(max_connections=1000, max_keepalive_connections=100)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        next_at = start
+        while time.perf_counter() - start < duration:
+            active = [c for c in active if not c.finished]
+            conversation = next((c for c in active if not c.busy), None)
+            if conversation is None:
+                conversation = Conversation(random.choice(conversations))
+                active.append(conversation)
+            conversation.busy = True
+            task = asyncio.create_task(run(client, conversation))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+            next_at += random.expovariate(rps)
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+        elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def build_report(results: list[dict], elapsed: float, target_rps: float) -> dict:
+    ok = [r for r in results if r["status"] == 200]
+    stages: dict[str, list[float]] = {}
+    for r in ok:
+        for name, duration in r["stages"].items():
+            stages.setdefault(name, []).append(duration)
+    stages["total (client)"] = [r["latency"] for r in ok]
+
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "elapsed_s": round(elapsed, 2),
+        "target_rps": target_rps,
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "stages": {
+            name: {
+                "count": len(values),
+                "p50_ms": round(percentile(values, 50), 1),
+                "p95_ms": round(percentile(values, 95), 1),
+                "p99_ms": round(percentile(values, 99), 1),
+                "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+            }
+            for name, values in stages.items()
+        },
+    }
+
+
+def print_report(report: dict):
+    print("\n" + "=" * 72)
+    print(f"Requêtes: {report['requests']}  Erreurs: {report['errors']}  "
+          f"Durée: {report['elapsed_s']}s  Débit: {report['throughput_rps']} req/s (cible {report['target_rps']})")
+    print("=" * 72)
+    print(f"{'Etape':<22}{'N':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'req/s':>9}")
+    for name, s in report["stages"].items():
+        print(f"{name:<22}{s['count']:>7}{s['p50_ms']:>11}{s['p95_ms']:>11}{s['p99_ms']:>11}{s['throughput_rps']:>9}")
+
+
+def wait_for(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Le processus s'est arrêté (code {process.returncode}), voir les logs")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.3)
+    raise RuntimeError(f"{url} ne répond pas après {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge hors ligne de /search")
+    parser.add_argument("--rps", type=float, default=5.0, help="Débit cible (requêtes/s)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Durée de l'injection (s)")
+    parser.add_argument("--endpoint", default="/search", choices=["/search", "/search/stream"])
+    parser.add_argument("--conversations", default=os.path.join(BENCH_DIR, "conversations.json"))
+    parser.add_argument("--chat-latency", default="lognormal:900:2500")
+    parser.add_argument("--embedding-latency", default="lognormal:120:400")
+    parser.add_argument("--token-delay-ms", type=float, default=20)
+    parser.add_argument("--layout", default="single", choices=["single", "partitioned"])
+    parser.add_argument("--stub-port", type=int, default=8900)
+    parser.add_argument("--search-port", type=int, default=8901)
+    parser.add_argument("--search-url", help="Serveur de recherche déjà lancé (pas de stub ni de Qdrant embarqué)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Ecrire le rapport JSON dans ce fichier")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    with open(args.conversations, "r", encoding="utf-8") as f:
+        conversations = json.load(f)
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    processes = []
+    try:
+        base_url = args.search_url
+        if not base_url:
+            stub = subprocess.Popen(
+                [sys.executable, os.path.join(BENCH_DIR, "stub_openai.py"), "--port", str(args.stub_port),
+                 "--chat-latency", args.chat_latency, "--embedding-latency", args.embedding_latency,
+                 "--token-delay-ms", str(args.token_delay_ms)],
+                cwd=BACKEND_DIR
+            )
+            processes.append(stub)
+
+            os.environ["QDRANT_LAYOUT"] = args.layout
+            from bench.seed_qdrant import seed
+            print(f"[BENCH] Qdrant embarqué: {seed(os.path.join(workdir, 'qdrant'))}")
+
+            env = {
+                **os.environ,
+                "OPENAI_API_KEY": "stub",
+                "OPENAI_BASE_URL": f"http://127.0.0.1:{args.stub_port}/v1",
+                "QDRANT_PATH": os.path.join(workdir, "qdrant"),
+                "QDRANT_LAYOUT": args.layout,
+                "CACHE_DIR": os.path.join(workdir, "cache"),
+            }
+            env.pop("QDRANT_URL", None)
+            log = open(os.path.join(workdir, "search_server.log"), "w")
+            server = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "search_server:app", "--host", "127.0.0.1",
+                 "--port", str(args.search_port), "--log-level", "warning"],
+                cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+            )
+            processes.append(server)
+            base_url = f"http://127.0.0.1:{args.search_port}"
+
+            wait_for(f"http://127.0.0.1:{args.stub_port}/stats", stub)
+            wait_for(f"{base_url}/ready", server)
+
+        print(f"[BENCH] {args.rps} req/s pendant {args.duration}s sur {base_url}{args.endpoint}")
+        results, elapsed = asyncio.run(
+            replay(base_url, conversations, args.rps, args.duration, args.endpoint, args.timeout)
+        )
+        report = build_report(results, elapsed, args.rps)
+        print_report(report)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+    finally:
+        for process in processes:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Qdrant embarqué (mode local, sans serveur) rempli à partir des JSONL du dépôt
+Mêmes payloads que ingest_qdrant.py / ingest_apartments.py, vecteurs du faux serveur OpenAI
+
+Pour lancer : python bench/seed_qdrant.py /tmp/qdrant-bench
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from qdrant_schema import BRAND_FILES, ensure_collections  # noqa: E402
+from apartment_cards import apartment_payload  # noqa: E402
+from lexical_index import chunk_id  # noqa: E402
+from bench.stub_openai import stub_embedding  # noqa: E402
+
+
+def generate_id(text):
+    return int(hashlib.md5(text.encode('utf-8')).hexdigest(), 16) % (10 ** 12)
+
+
+def read_jsonl(filename: str) -> list[dict]:
+    with open(os.path.join(BACKEND_DIR, filename), "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def seed(path: str, apartments_file: str = "typologies_ecla.jsonl", brands: list[str] | None = None) -> dict:
+    """Créer les collections du layout courant (QDRANT_LAYOUT) dans `path` et les remplir"""
+    client = QdrantClient(path=path)
+    counts = {}
+    try:
+        collections = ensure_collections(client, ["apartments", "knowledge"])
+        collection_name = collections["apartments"]
+        points = [
+            PointStruct(
+                id=generate_id(apt["text"] + apt["id"]),
+                vector=stub_embedding(apt["text"]),
+                payload=apartment_payload(apt)
+            )
+            for apt in read_jsonl(apartments_file)
+        ]
+        client.upsert(collection_name=collection_name, points=points)
+        counts["apartments"] = len(points)
+
+        collection_name = collections["knowledge"]
+        for brand in brands or ["ecla"]:
+            points = [
+                PointStruct(
+                    id=chunk_id(chunk["content"], brand),
+                    vector=stub_embedding(chunk["content"]),
+                    payload={"content": chunk["content"], **chunk["metadata"], "brand": brand}
+                )
+                for chunk in read_jsonl(BRAND_FILES[brand])
+                if isinstance(chunk, dict) and "content" in chunk and "metadata" in chunk
+            ]
+            client.upsert(collection_name=collection_name, points=points)
+            counts[brand] = len(points)
+    finally:
+        client.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remplir un Qdrant embarqué pour les benchmarks")
+    parser.add_argument("path", help="Dossier du Qdrant embarqué")
+    parser.add_argument("--apartments", default="typologies_ecla.jsonl")
+    parser.add_argument("--brands", nargs="*", default=["ecla"])
+    args = parser.parse_args()
+    print(f"[SEED] {seed(args.path, args.apartments, args.brands)}")
+
+
+if __name__ == "__main__":
+    main()
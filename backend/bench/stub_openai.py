@@ -0,0 +1,195 @@
+"""
+Faux serveur OpenAI (API compatible) pour les benchmarks hors ligne
+- POST /v1/chat/completions : réponses d'intention (appel de fonction) et réponses commerciales, streaming compris
+- POST /v1/embeddings : vecteurs déterministes (hachage des mots : des textes proches ont des vecteurs proches)
+Les latences suivent des distributions configurables, ex: --chat-latency lognormal:900:2500
+
+Pour lancer : python bench/stub_openai.py --port 8900
+Puis : OPENAI_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_KEY=stub uvicorn search_server:app
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fast_intent import fold, parse_intent  # noqa: E402
+
+EMBEDDING_DIMENSIONS = 1536
+
+ANSWER = (
+    "Je vous montre les typologies disponibles, du Studio au T4, avec des loyers charges comprises. "
+    "Chaque résidence propose des espaces de coworking, une salle de sport et des événements toute l'année. "
+    "Quelle typologie vous intéresse ?"
+)
+
+
+class Latency:
+    """
+    Distribution de latence (en secondes) décrite par une chaîne :
+    "none", "fixed:MS", "uniform:MIN_MS:MAX_MS" ou "lognormal:MEDIANE_MS:P95_MS"
+    """
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, *values = spec.split(":")
+        self.kind = kind
+        self.values = [float(v) / 1000 for v in values]
+        if kind == "lognormal":
+            median, p95 = self.values
+            self.mu = math.log(median)
+            self.sigma = (math.log(p95) - self.mu) / 1.645
+        elif kind not in ("none", "fixed", "uniform"):
+            raise ValueError(f"Distribution de latence inconnue: {spec}")
+
+    def sample(self) -> float:
+        if self.kind == "none":
+            return 0.0
+        if self.kind == "fixed":
+            return self.values[0]
+        if self.kind == "uniform":
+            return random.uniform(*self.values)
+        return random.lognormvariate(self.mu, self.sigma)
+
+
+config = {
+    "chat": Latency(os.getenv("STUB_CHAT_LATENCY", "lognormal:900:2500")),
+    "embeddings": Latency(os.getenv("STUB_EMBEDDING_LATENCY", "lognormal:120:400")),
+    "token_delay": float(os.getenv("STUB_TOKEN_DELAY_MS", "20")) / 1000,
+}
+stats = {"chat": 0, "embeddings": 0}
+
+app = FastAPI(title="Stub OpenAI")
+
+
+def stub_embedding(text: str) -> list[float]:
+    """Sac de mots haché dans 1536 dimensions, normalisé"""
+    vector = np.zeros(EMBEDDING_DIMENSIONS, dtype=np.float32)
+    for word in fold(text).split():
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % EMBEDDING_DIMENSIONS
+        vector[index] += 1.0 if digest[4] % 2 else -1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+def intent_answer(messages: list[dict]) -> str:
+    """Réponse de l'agent d'intention, obtenue avec les règles locales"""
+    query = messages[-1]["content"].replace("Question actuelle : ", "")
+    history = [m for m in messages[1:-1] if m.get("role") in ("user", "assistant")]
+    result = parse_intent(query, history)
+    if result is None:
+        result = {
+            "is_apartment_search": False,
+            "criteria": {key: None for key in ("max_budget", "min_budget", "city", "furnished",
+                                               "min_surface", "max_surface", "rooms", "max_results")},
+            "reasoning": "Question générale",
+            "confidence": 0.9,
+        }
+    return json.dumps(result, ensure_ascii=False)
+
+
+def completion_id() -> str:
+    return f"chatcmpl-stub{random.getrandbits(48):012x}"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["chat"] += 1
+    messages = body.get("messages", [])
+    model = body.get("model", "gpt-4")
+    is_intent = "agent d'analyse" in messages[0].get("content", "") if messages else False
+    content = intent_answer(messages) if is_intent else ANSWER
+    created = int(time.time())
+
+    await asyncio.sleep(config["chat"].sample())
+
+    if not body.get("stream"):
+        message = {"role": "assistant", "content": content}
+        finish_reason = "stop"
+        if body.get("tools"):
+            name = body["tools"][0]["function"]["name"]
+            message = {"role": "assistant", "content": None, "tool_calls": [{
+                "id": f"call_{random.getrandbits(48):012x}", "type": "function",
+                "function": {"name": name, "arguments": content},
+            }]}
+            finish_reason = "tool_calls"
+        return {
+            "id": completion_id(),
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    async def chunks():
+        chunk_id = completion_id()
+        tokens = content.split(" ")
+        for i, token in enumerate(tokens):
+            delta = {"content": token if i == 0 else f" {token}"}
+            if i == 0:
+                delta["role"] = "assistant"
+            chunk = {
+                "id": chunk_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(config["token_delay"])
+        last = {
+            "id": chunk_id, "object": "chat.completion.chunk", "created": created, "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        yield f"data: {json.dumps(last)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(chunks(), media_type="text/event-stream")
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    stats["embeddings"] += 1
+    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    await asyncio.sleep(config["embeddings"].sample())
+    return {
+        "object": "list",
+        "data": [{"object": "embedding", "index": i, "embedding": stub_embedding(text)} for i, text in enumerate(inputs)],
+        "model": body.get("model", "text-embedding-3-small"),
+        "usage": {"prompt_tokens": 0, "total_tokens": 0},
+    }
+
+
+@app.get("/stats")
+def get_stats():
+    return {**stats, "chat_latency": config["chat"].spec, "embedding_latency": config["embeddings"].spec}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Faux serveur OpenAI pour les benchmarks")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--chat-latency", default=config["chat"].spec)
+    parser.add_argument("--embedding-latency", default=config["embeddings"].spec)
+    parser.add_argument("--token-delay-ms", type=float, default=config["token_delay"] * 1000)
+    args = parser.parse_args()
+
+    config["chat"] = Latency(args.chat_latency)
+    config["embeddings"] = Latency(args.embedding_latency)
+    config["token_delay"] = args.token_delay_ms / 1000
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
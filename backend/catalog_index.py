@@ -0,0 +1,238 @@
+"""
+Catalogue des appartements/typologies en mémoire
+Index par champ (ville, zone, pièces, typologie, meublé, loyer, surface, disponibilité)
+pour répondre aux recherches d'appartements sans passer par Qdrant
+
+Avec plusieurs workers, le catalogue est partagé via un instantané sur disque (CACHE_DIR/catalog) :
+le worker qui le construit écrit les vecteurs (.npy, projetés en mémoire par les autres : une seule copie
+dans le cache de pages du nœud) et les payloads (.json), puis bascule le pointeur "current" de façon atomique
+"""
+
+import bisect
+import json
+import os
+import time
+from typing import Optional
+
+import numpy as np
+from qdrant_client.models import ScoredPoint
+
+from apartment_cards import typologie_label
+
+SNAPSHOT_POINTER = "current"
+SNAPSHOT_BUILD_LOCK = "building.lock"
+SNAPSHOT_BUILD_TIMEOUT = float(os.getenv("CATALOG_BUILD_TIMEOUT", "60"))  # Verrou abandonné au-delà
+
+
+def snapshot_generation(directory: str) -> Optional[str]:
+    """Génération de l'instantané courant (None s'il n'y en a pas)"""
+    try:
+        with open(os.path.join(directory, SNAPSHOT_POINTER), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def clear_snapshot(directory: str):
+    """Invalider l'instantané (nouveau déploiement : le premier worker le reconstruit depuis Qdrant)"""
+    for name in (SNAPSHOT_POINTER, SNAPSHOT_BUILD_LOCK):
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+
+def claim_snapshot_build(directory: str) -> bool:
+    """Un seul worker reconstruit l'instantané ; un verrou plus vieux que SNAPSHOT_BUILD_TIMEOUT est repris"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, SNAPSHOT_BUILD_LOCK)
+    try:
+        if time.time() - os.path.getmtime(path) > SNAPSHOT_BUILD_TIMEOUT:
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        return False
+
+
+def release_snapshot_build(directory: str):
+    try:
+        os.remove(os.path.join(directory, SNAPSHOT_BUILD_LOCK))
+    except FileNotFoundError:
+        pass
+
+
+class ApartmentCatalog:
+    """Index en mémoire des points "appartement" de Qdrant (payload + vecteur)"""
+
+    def __init__(self, zone_mapping: dict[str, list[str]]):
+        self.zone_mapping = zone_mapping
+        self._clear()
+
+    def _clear(self):
+        self.ids: list = []
+        self.payloads: list[dict] = []
+        self.vectors: Optional[np.ndarray] = None
+        self.by_city: dict[str, set[int]] = {}
+        self.by_zone: dict[str, set[int]] = {}
+        self.by_rooms: dict[int, set[int]] = {}
+        self.by_typologie: dict[str, set[int]] = {}
+        self.by_furnished: dict[bool, set[int]] = {}
+        self.rents: list[tuple[float, int]] = []  # trié par loyer
+        self.surfaces: list[tuple[float, int]] = []  # trié par surface
+        self.availabilities: list[tuple[str, int]] = []  # trié par date (ISO)
+        self.generation: Optional[str] = None  # Instantané partagé chargé (ou écrit) par ce worker
+
+    @property
+    def ready(self) -> bool:
+        return len(self.payloads) > 0
+
+    def __len__(self) -> int:
+        return len(self.payloads)
+
+    def load(self, points: list):
+        """Construire les index à partir de points Qdrant (id, payload, vector)"""
+        vectors = [point.vector for point in points if point.vector is not None]
+        matrix = None
+        if vectors and len(vectors) == len(points):
+            matrix = np.asarray(vectors, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.where(norms == 0, 1, norms)
+        self._build([point.id for point in points], [point.payload or {} for point in points], matrix)
+
+    def _build(self, ids: list, payloads: list[dict], vectors: Optional[np.ndarray]):
+        """Index par champ ; `vectors` déjà normalisés (une ligne par payload) ou None"""
+        self._clear()
+        self.ids = list(ids)
+        self.payloads = payloads
+        self.vectors = vectors
+        for position, payload in enumerate(payloads):
+            city = payload.get("city", "")
+            rooms = payload.get("rooms", 1)
+            self.by_city.setdefault(city, set()).add(position)
+            self.by_rooms.setdefault(rooms, set()).add(position)
+            label = payload.get("typologie_label") or typologie_label(rooms, payload.get("surface_m2", 0))
+            self.by_typologie.setdefault(label, set()).add(position)
+            self.by_furnished.setdefault(bool(payload.get("furnished", False)), set()).add(position)
+            self.rents.append((payload.get("rent_cc_eur", 0), position))
+            self.surfaces.append((payload.get("surface_m2", 0), position))
+            self.availabilities.append((payload.get("availability_date", ""), position))
+
+        for zone, cities in self.zone_mapping.items():
+            self.by_zone[zone] = set().union(*(self.by_city.get(c, set()) for c in cities))
+
+        self.rents.sort()
+        self.surfaces.sort()
+        self.availabilities.sort()
+
+    def save_snapshot(self, directory: str) -> str:
+        """Écrire l'instantané partagé puis le publier (pointeur remplacé atomiquement) ; retourne sa génération"""
+        os.makedirs(directory, exist_ok=True)
+        generation = str(time.time_ns())
+        if self.vectors is not None:
+            # Fichier temporaire puis renommage : un lecteur ne voit jamais un fichier à moitié écrit
+            with open(os.path.join(directory, f"vectors-{generation}.tmp"), "wb") as f:
+                np.save(f, self.vectors)
+            os.replace(os.path.join(directory, f"vectors-{generation}.tmp"),
+                       os.path.join(directory, f"vectors-{generation}.npy"))
+        with open(os.path.join(directory, f"payloads-{generation}.json"), "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "payloads": self.payloads, "has_vectors": self.vectors is not None}, f,
+                      ensure_ascii=False)
+        pointer = os.path.join(directory, f"{SNAPSHOT_POINTER}.{generation}.tmp")
+        with open(pointer, "w", encoding="utf-8") as f:
+            f.write(generation)
+        os.replace(pointer, os.path.join(directory, SNAPSHOT_POINTER))
+        self.generation = generation
+        self._remove_old_snapshots(directory, keep=2)
+        return generation
+
+    def load_snapshot(self, directory: str) -> bool:
+        """Charger l'instantané courant (vecteurs projetés en mémoire, lecture seule) ; False s'il n'existe pas"""
+        generation = snapshot_generation(directory)
+        if generation is None:
+            return False
+        try:
+            with open(os.path.join(directory, f"payloads-{generation}.json"), encoding="utf-8") as f:
+                data = json.load(f)
+            vectors = None
+            if data["has_vectors"]:
+                vectors = np.load(os.path.join(directory, f"vectors-{generation}.npy"), mmap_mode="r")
+        except FileNotFoundError:
+            # Génération supprimée entre-temps par un worker plus récent
+            return False
+        self._build(data["ids"], data["payloads"], vectors)
+        self.generation = generation
+        return True
+
+    @staticmethod
+    def _remove_old_snapshots(directory: str, keep: int):
+        """Garder les `keep` dernières générations (un worker peut encore lire la précédente)"""
+        generations = sorted({
+            name.split("-", 1)[1].split(".", 1)[0]
+            for name in os.listdir(directory)
+            if name.startswith(("vectors-", "payloads-")) and not name.endswith(".tmp")
+        }, key=int)
+        for generation in generations[:-keep]:
+            for name in (f"vectors-{generation}.npy", f"payloads-{generation}.json"):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pass
+
+    @staticmethod
+    def _range(index: list[tuple[float, int]], low_value: Optional[float], high_value: Optional[float]) -> set[int]:
+        """Positions dont la valeur est comprise entre low_value et high_value (bornes incluses)"""
+        low = bisect.bisect_left(index, (low_value, -1)) if low_value is not None else 0
+        high = bisect.bisect_right(index, (high_value, len(index))) if high_value is not None else len(index)
+        return {position for _, position in index[low:high]}
+
+    def _available_by(self, date: str) -> set[int]:
+        high = bisect.bisect_right(self.availabilities, (date, len(self.availabilities)))
+        return {position for _, position in self.availabilities[:high]}
+
+    def search(self, vector: Optional[list[float]] = None, city: Optional[str] = None, zone: Optional[str] = None,
+               rooms: Optional[int] = None, typologie: Optional[str] = None, furnished: Optional[bool] = None,
+               min_rent: Optional[float] = None, max_rent: Optional[float] = None,
+               min_surface: Optional[float] = None, max_surface: Optional[float] = None,
+               available_by: Optional[str] = None, limit: int = 20) -> list[ScoredPoint]:
+        """
+        Intersection des index demandés, triée par similarité cosinus avec `vector`
+        (même score que Qdrant sur une collection COSINE), ou par loyer croissant sans vecteur
+        """
+        candidates = set(range(len(self.payloads)))
+        if city is not None:
+            candidates &= self.by_city.get(city, set())
+        if zone is not None:
+            candidates &= self.by_zone.get(zone, set())
+        if rooms is not None:
+            candidates &= self.by_rooms.get(rooms, set())
+        if typologie is not None:
+            candidates &= self.by_typologie.get(typologie, set())
+        if furnished is not None:
+            candidates &= self.by_furnished.get(furnished, set())
+        if min_rent is not None or max_rent is not None:
+            candidates &= self._range(self.rents, min_rent, max_rent)
+        if min_surface is not None or max_surface is not None:
+            candidates &= self._range(self.surfaces, min_surface, max_surface)
+        if available_by is not None:
+            candidates &= self._available_by(available_by)
+
+        if not candidates:
+            return []
+
+        positions = sorted(candidates)
+        if vector is not None and self.vectors is not None:
+            query = np.asarray(vector, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            scores = self.vectors[positions] @ (query / norm if norm else query)
+            ranked = sorted(zip(positions, scores.tolist()), key=lambda item: item[1], reverse=True)
+        else:
+            ranked = sorted(((p, 0.0) for p in positions), key=lambda item: self.payloads[item[0]].get("rent_cc_eur", 0))
+
+        return [
+            ScoredPoint(id=self.ids[p], version=0, score=score, payload=self.payloads[p])
+            for p, score in ranked[:limit]
+        ]
@@ -1,14 +1,15 @@
 # backend/classify_chunks.py
 
 import json
-import openai
 import argparse
 from tqdm import tqdm
 from dotenv import load_dotenv
 import os
 
+from openai_transport import make_openai_client
+
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+client = make_openai_client(api_key=os.getenv("OPENAI_API_KEY"))
 
 def classify_chunk(text):
     system_prompt = "Tu es un classifieur de contenu. Tu dois attribuer un 'type' parmi : residence, faq, reglement, contact, services, autres."
@@ -23,7 +24,7 @@ def classify_chunk(text):
 Contenu : '''{text}'''"""
 
     try:
-        response = openai.ChatCompletion.create(
+        response = client.chat.completions.create(
             model="gpt-4",
             temperature=0,
             messages=[
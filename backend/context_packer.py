@@ -0,0 +1,113 @@
+"""
+Sélection des chunks envoyés dans le prompt de l'agent commercial
+- Dédoublonnage des chunks quasi identiques (mêmes pages crawlées, menus répétés)
+- Sous-ensemble pertinent ET varié (MMR : pertinence Qdrant vs similarité aux chunks déjà retenus)
+- Budget de tokens mesuré avec le tokenizer du modèle (tiktoken, sinon estimation)
+"""
+
+import os
+import re
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken absent : estimation ~4 caractères par token
+    tiktoken = None
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "600"))
+CONTEXT_CHUNK_CHARS = int(os.getenv("CONTEXT_CHUNK_CHARS", "200"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+
+# Encodage par modèle (None : fichier BPE indisponible, estimation)
+# tiktoken télécharge le fichier BPE au premier usage : l'image Docker le précharge dans TIKTOKEN_CACHE_DIR
+_encodings = {}
+
+
+def _load_encoding(model: str):
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # Conteneur hors ligne sans cache tiktoken : pas d'échec à chaque requête
+        print(f"[WARNING] Tokenizer '{model}' indisponible, estimation ~4 caractères par token: {e!r}")
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    """Nombre de tokens de `text` pour `model`"""
+    if tiktoken is not None and model not in _encodings:
+        _encodings[model] = _load_encoding(model)
+    encoding = _encodings.get(model)
+    if encoding is None:
+        return max(1, round(len(text) / 4)) if text else 0
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(messages: list[dict], model: str = "gpt-4") -> int:
+    """Tokens d'un prompt chat (contenu + ~4 tokens de structure par message)"""
+    return sum(count_tokens(m.get("content", ""), model) + 4 for m in messages) + 2
+
+
+def render_chunk(chunk: dict) -> str:
+    """Ligne du prompt pour un chunk (même format que build_commercial_prompt)"""
+    return f"- {chunk['content'][:CONTEXT_CHUNK_CHARS]}"
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _similarity(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def pack_chunks(chunks: list[dict], token_budget: int = CONTEXT_TOKEN_BUDGET, model: str = "gpt-4",
+                mmr_lambda: float = CONTEXT_MMR_LAMBDA,
+                dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD) -> list[dict]:
+    """
+    Chunks à mettre dans le prompt, par ordre de sélection (pertinence puis diversité),
+    dans la limite de `token_budget` tokens de contexte
+    """
+    if not chunks:
+        return []
+
+    # Le texte comparé est celui qui part dans le prompt
+    shingles = [_shingles(chunk["content"][:CONTEXT_CHUNK_CHARS]) for chunk in chunks]
+    scores = [chunk.get("score") or 0.0 for chunk in chunks]
+    low, high = min(scores), max(scores)
+    relevance = [(s - low) / (high - low) if high > low else 1.0 for s in scores]
+
+    selected: list[int] = []
+    remaining = list(range(len(chunks)))
+    used_tokens = 0
+
+    while remaining:
+        best, best_score, best_redundancy = None, None, 0.0
+        for i in remaining:
+            redundancy = max((_similarity(shingles[i], shingles[j]) for j in selected), default=0.0)
+            score = mmr_lambda * relevance[i] - (1 - mmr_lambda) * redundancy
+            if best_score is None or score > best_score:
+                best, best_score, best_redundancy = i, score, redundancy
+        remaining.remove(best)
+
+        # Quasi-doublon d'un chunk déjà retenu
+        if best_redundancy >= dedup_threshold:
+            continue
+
+        tokens = count_tokens(render_chunk(chunks[best]), model) + 1
+        if used_tokens + tokens > token_budget:
+            if selected:
+                continue
+            # Toujours garder au moins le chunk le plus pertinent
+        selected.append(best)
+        used_tokens += tokens
+
+    # Ordre du prompt : pertinence décroissante
+    return [chunks[i] for i in sorted(selected, key=lambda i: scores[i], reverse=True)]
@@ -0,0 +1,72 @@
+"""
+Cache des embeddings de requêtes à deux niveaux
+- Niveau 1 : LRU en mémoire avec TTL (réponses répétées, quick replies)
+- Niveau 2 : SQLite sur disque, conservé entre deux redémarrages
+"""
+
+import os
+import re
+import time
+import unicodedata
+from array import array
+from typing import Optional
+
+from local_cache import MemoryCache, SqliteCache
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "3600"))
+EMBEDDING_CACHE_DISK_TTL = float(os.getenv("EMBEDDING_CACHE_DISK_TTL", str(30 * 24 * 3600)))
+EMBEDDING_CACHE_DISK_SIZE = int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", "100000"))
+
+
+def normalize_query(text: str) -> str:
+    """Normaliser une requête pour le cache : unicode NFC, minuscules, espaces compactés"""
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class EmbeddingCache:
+    """Cache des vecteurs de requêtes, indexé par modèle + requête normalisée"""
+
+    def __init__(self):
+        self.memory = MemoryCache(max_entries=EMBEDDING_CACHE_SIZE, ttl=EMBEDDING_CACHE_TTL)
+        self.disk = SqliteCache("embeddings.sqlite3", max_entries=EMBEDDING_CACHE_DISK_SIZE, ttl=EMBEDDING_CACHE_DISK_TTL)
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    @staticmethod
+    def _key(model: str, text: str) -> str:
+        return f"{model}:{normalize_query(text)}"
+
+    def get(self, model: str, text: str) -> Optional[list[float]]:
+        key = self._key(model, text)
+
+        vector = self.memory.get(key)
+        if vector is not None:
+            self.stats["memory_hits"] += 1
+            return vector
+
+        entry = self.disk.get_entry(key)
+        if entry is not None:
+            blob, expires_at = entry
+            vector = array("f", blob).tolist()
+            # Copie en mémoire sans survivre à l'entrée disque
+            self.memory.set(key, vector, ttl=min(self.memory.ttl, expires_at - time.time()))
+            self.stats["disk_hits"] += 1
+            return vector
+
+        self.stats["misses"] += 1
+        return None
+
+    def set(self, model: str, text: str, vector: list[float]):
+        key = self._key(model, text)
+        self.memory.set(key, vector)
+        self.disk.set(key, array("f", vector).tobytes())
+
+    def get_stats(self) -> dict:
+        total = sum(self.stats.values())
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        return {
+            **self.stats,
+            "hit_rate": round(hits / total, 3) if total else 0.0,
+            "memory_entries": len(self.memory),
+        }
@@ -0,0 +1,209 @@
+"""
+Analyse d'intention locale (sans GPT) pour les quick replies et les requêtes simples
+Ex: "Paris", "flexible", "Tous", "T2", "800", "T1 à Lyon moins de 600€"
+Retourne le même format JSON que l'agent GPT, avec un score de confiance
+"""
+
+import os
+import re
+import unicodedata
+from typing import Optional
+
+FAST_INTENT_MIN_CONFIDENCE = float(os.getenv("FAST_INTENT_MIN_CONFIDENCE", "0.75"))
+
+# Zones géographiques (voir ZONE_MAPPING dans search_server.py)
+ZONES = {
+    "paris": "Paris",
+    "geneve": "Genève",
+}
+
+# Villes connues : résidences ECLA + grandes villes étudiantes
+CITIES = {
+    "massy palaiseau": "Massy-Palaiseau",
+    "massy": "Massy-Palaiseau",
+    "palaiseau": "Massy-Palaiseau",
+    "saclay": "Massy-Palaiseau",
+    "villejuif": "Villejuif",
+    "noisy le grand": "Noisy-le-Grand",
+    "noisy": "Noisy-le-Grand",
+    "archamps": "Archamps",
+    "lille": "Lille",
+    "bordeaux": "Bordeaux",
+    "lyon": "Lyon",
+    "marseille": "Marseille",
+    "toulouse": "Toulouse",
+    "nantes": "Nantes",
+    "rennes": "Rennes",
+    "montpellier": "Montpellier",
+    "strasbourg": "Strasbourg",
+    "nice": "Nice",
+    "grenoble": "Grenoble",
+}
+
+APARTMENT_WORDS = {
+    "logement", "logements", "appartement", "appartements", "appart", "apparts",
+    "chambre", "chambres", "toit", "location", "louer", "loger", "hebergement", "typologie", "typologies",
+}
+
+# Mots sans influence sur l'intention
+FILLER_WORDS = {
+    "je", "j", "cherche", "recherche", "voudrais", "veux", "souhaite", "besoin", "trouver", "aimerais",
+    "un", "une", "des", "le", "la", "les", "l", "a", "au", "aux", "en", "de", "du", "d", "pour", "sur",
+    "dans", "vers", "pres", "proche", "ville", "mois", "par", "svp", "merci", "et", "avec", "ou",
+    "pas", "cher", "moi", "me", "montre", "montrez", "voir", "suis", "bonjour", "disponible", "disponibles",
+    "mon", "ma", "budget", "max", "maximum", "euros", "euro", "eur", "cc", "charges", "comprises",
+}
+
+ROOMS_BY_LABEL = {"studio": 1, "colocation": 0, "coloc": 0}
+
+_NUMBER = r"(\d+(?:[.,]\d+)?)"
+_CURRENCY = r"\s*(?:€|euros?\b|eur\b)?"
+_SURFACE_UNIT = r"\s*(?:m2|m²|metres? carres?)"
+
+
+def fold(text: str) -> str:
+    """Minuscules, sans accents, ponctuation remplacée par des espaces"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = text.replace("'", " ").replace("’", " ").replace("-", " ")
+    text = re.sub(r"[^\w€²<>\s.,]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _number(value: str) -> float:
+    return float(value.replace(",", "."))
+
+
+def parse_message(text: str) -> dict:
+    """
+    Analyser un message isolé
+    Retourne {"criteria": {...}, "apartment": bool, "signals": int, "unknown": [...]}
+    Les critères explicitement remis à zéro ("Tous") sont présents avec la valeur None
+    """
+    text = fold(text)
+    criteria: dict = {}
+    signals = 0
+    apartment = False
+
+    def consume(pattern: str, handler):
+        nonlocal text, signals
+        for match in list(re.finditer(pattern, text)):
+            handler(match)
+            signals += 1
+        text = re.sub(pattern, " ", text)
+
+    # Surfaces (avant les budgets : "moins de 30 m2" n'est pas un budget)
+    def surface(m):
+        qualifier, value = m.group(1) or "", _number(m.group(2))
+        if qualifier.startswith(("moins", "max", "jusqu")):
+            criteria["max_surface"] = value
+        else:
+            criteria["min_surface"] = value
+    consume(r"(plus de|au moins|minimum|min|moins de|maximum|max|jusqu a)?\s*" + _NUMBER + _SURFACE_UNIT, surface)
+
+    # Fourchette de budget
+    def budget_range(m):
+        criteria["min_budget"] = int(_number(m.group(1)))
+        criteria["max_budget"] = int(_number(m.group(2)))
+    consume(r"entre\s*" + _NUMBER + _CURRENCY + r"\s*et\s*" + _NUMBER + _CURRENCY, budget_range)
+
+    # Budget max / min avec qualificatif
+    def max_budget(m):
+        criteria["max_budget"] = int(_number(m.group(1)))
+    consume(r"(?:moins de|max(?:imum)?|jusqu a|pas plus de|budget(?: de| max)?|inferieur a|<)\s*" + _NUMBER + _CURRENCY, max_budget)
+
+    def min_budget(m):
+        criteria["min_budget"] = int(_number(m.group(1)))
+    consume(r"(?:plus de|au moins|minimum|a partir de|>)\s*" + _NUMBER + _CURRENCY, min_budget)
+
+    # Montant avec devise, ou nombre seul (quick reply de budget)
+    consume(_NUMBER + r"\s*(?:€|euros?\b|eur\b)", max_budget)
+    if re.fullmatch(r"\s*\d{3,5}\s*", text):
+        consume(r"(\d{3,5})", max_budget)
+
+    # Meublé / non meublé
+    def not_furnished(m):
+        criteria["furnished"] = False
+    consume(r"\bnon meuble(?:e|s|es)?\b", not_furnished)
+
+    def furnished(m):
+        criteria["furnished"] = True
+    consume(r"\bmeuble(?:e|s|es)?\b", furnished)
+
+    # Typologies
+    def typology(m):
+        nonlocal apartment
+        label = m.group(1)
+        criteria["rooms"] = ROOMS_BY_LABEL.get(label, int(label[1:]) if label[1:].isdigit() else None)
+        apartment = True
+    consume(r"\b(studio|colocation|coloc|[tf][1-6])s?\b", typology)
+
+    # "Tous" : toutes les typologies
+    def all_rooms(m):
+        criteria["rooms"] = None
+    consume(r"\b(?:tous|toutes|all|tout)\b", all_rooms)
+
+    # "Je suis flexible" : pas de critère de ville
+    consume(r"\bflexible\b", lambda m: None)
+
+    # Zones et villes (expressions multi-mots d'abord)
+    def place(m):
+        name = m.group(1)
+        criteria["city"] = ZONES.get(name) or CITIES[name]
+    places = sorted(list(ZONES) + list(CITIES), key=len, reverse=True)
+    consume(r"\b(" + "|".join(re.escape(p) for p in places) + r")\b", place)
+
+    words = text.split()
+    unknown = []
+    for word in words:
+        if word in APARTMENT_WORDS:
+            apartment = True
+            signals += 1
+        elif word not in FILLER_WORDS:
+            unknown.append(word)
+
+    return {"criteria": criteria, "apartment": apartment, "signals": signals, "unknown": unknown}
+
+
+def _confidence(parsed: dict) -> float:
+    total = parsed["signals"] + len(parsed["unknown"])
+    return parsed["signals"] / total if total else 1.0
+
+
+def parse_intent(query: str, conversation_history: list[dict] | None = None,
+                 base_criteria: dict | None = None) -> Optional[dict]:
+    """
+    Analyser la question actuelle et les derniers messages utilisateur de l'historique
+    `base_criteria` : critères déjà connus (session serveur), complétés / remplacés par ceux des messages
+    Retourne un dict au format de l'agent GPT (+ "confidence"), ou None si les règles ne suffisent pas
+    """
+    messages = [m.get("content", "") for m in (conversation_history or [])[-6:] if m.get("role") == "user"]
+    messages.append(query)
+
+    parsed_messages = [parse_message(text) for text in messages]
+    if parsed_messages[-1]["signals"] == 0:
+        # Rien de reconnu dans la question actuelle : laisser GPT décider
+        return None
+
+    # Les critères des messages récents remplacent ceux des plus anciens
+    criteria: dict = {k: v for k, v in (base_criteria or {}).items() if v is not None and k != "max_results"}
+    for parsed in parsed_messages:
+        criteria.update(parsed["criteria"])
+    confidence = min(_confidence(parsed) for parsed in parsed_messages)
+
+    # Seuls les vocabulaires logement / critères sont reconnus : une requête comprise est une recherche d'appartement
+    return {
+        "is_apartment_search": True,
+        "criteria": {
+            "max_budget": criteria.get("max_budget"),
+            "min_budget": criteria.get("min_budget"),
+            "city": criteria.get("city"),
+            "furnished": criteria.get("furnished"),
+            "min_surface": criteria.get("min_surface"),
+            "max_surface": criteria.get("max_surface"),
+            "rooms": criteria.get("rooms"),
+            "max_results": None,
+        },
+        "reasoning": f"Analyse locale (règles) : {', '.join(f'{k}={v}' for k, v in criteria.items()) or 'aucun critère'}",
+        "confidence": round(confidence, 2),
+    }
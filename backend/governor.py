@@ -0,0 +1,246 @@
+"""
+Régulation des appels OpenAI du serveur de recherche (admission control)
+- Par modèle : nombre maximal d'appels simultanés + budget de tokens par minute (token bucket)
+- File d'attente bornée, avec temps d'attente maximal ; au-delà la requête est refusée (503 + Retry-After)
+- Priorité aux tours courts (quick replies) sur les questions libres
+
+Configuration (variables d'environnement, "modèle=valeur" séparés par des virgules) :
+GOVERNOR_CONCURRENCY="gpt-4=8,gpt-4o-mini=32"  GOVERNOR_TPM="gpt-4=40000"
+GOVERNOR_DEFAULT_CONCURRENCY, GOVERNOR_QUEUE_SIZE, GOVERNOR_MAX_WAIT, GOVERNOR_ENABLED
+Les limites sont celles du nœud : avec SEARCH_WORKERS workers (fixé par startup.py), chacun en reçoit une part
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from metrics import observe_queue_wait
+
+PRIORITY_QUICK_REPLY = 0
+PRIORITY_FREE_TEXT = 1
+
+# Priorité de la requête HTTP en cours (fixée par le handler /search)
+request_priority: ContextVar[int] = ContextVar("request_priority", default=PRIORITY_FREE_TEXT)
+
+
+def _parse_limits(value: str) -> dict[str, float]:
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        model, _, limit = item.partition("=")
+        limits[model.strip()] = float(limit)
+    return limits
+
+
+GOVERNOR_ENABLED = os.getenv("GOVERNOR_ENABLED", "true").lower() == "true"
+GOVERNOR_DEFAULT_CONCURRENCY = int(os.getenv("GOVERNOR_DEFAULT_CONCURRENCY", "16"))
+GOVERNOR_CONCURRENCY = _parse_limits(os.getenv("GOVERNOR_CONCURRENCY", "gpt-4=8,gpt-4o-mini=32,text-embedding-3-small=32"))
+GOVERNOR_TPM = _parse_limits(os.getenv("GOVERNOR_TPM", "gpt-4=40000,gpt-4o-mini=200000,text-embedding-3-small=1000000"))
+GOVERNOR_QUEUE_SIZE = int(os.getenv("GOVERNOR_QUEUE_SIZE", "100"))
+GOVERNOR_MAX_WAIT = float(os.getenv("GOVERNOR_MAX_WAIT", "5"))
+SEARCH_WORKERS = max(1, int(os.getenv("SEARCH_WORKERS", "1")))
+
+
+class Saturated(Exception):
+    """Plus de capacité pour ce modèle : la requête doit être refusée rapidement"""
+
+    def __init__(self, model: str, reason: str, retry_after: int):
+        super().__init__(f"{model} saturé ({reason}), réessayer dans {retry_after}s")
+        self.model = model
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Budget de tokens par minute, rechargé en continu (capacité = une minute de budget)"""
+
+    def __init__(self, tokens_per_minute: float):
+        self.rate = tokens_per_minute / 60
+        self.capacity = tokens_per_minute
+        self.tokens = tokens_per_minute
+        self.updated_at = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def can_take(self, cost: float) -> bool:
+        # Un appel plus gros que la capacité passe quand le seau est plein
+        return self.tokens >= min(cost, self.capacity)
+
+    def delay_for(self, cost: float) -> float:
+        return max(0.0, (min(cost, self.capacity) - self.tokens) / self.rate)
+
+
+class _Waiter:
+    def __init__(self, cost: float):
+        self.cost = cost
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.perf_counter()
+
+
+class ModelGate:
+    """Appels simultanés + budget de tokens d'un modèle, avec file d'attente prioritaire"""
+
+    def __init__(self, model: str, concurrency: int, tokens_per_minute: float | None,
+                 queue_size: int, max_wait: float):
+        self.model = model
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.active = 0
+        self._queue: list[tuple[int, int, _Waiter]] = []
+        self._sequence = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+        self._hold_seconds = 1.0  # Durée moyenne d'un appel (moyenne mobile)
+        self.stats = {"admitted": 0, "queued": 0, "shed_queue_full": 0, "shed_timeout": 0, "wait_seconds": 0.0}
+
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, waiter in self._queue if not waiter.future.done())
+
+    def retry_after(self) -> int:
+        """Estimation du temps pour écouler la file actuelle"""
+        return max(1, math.ceil(self._hold_seconds * (self.queue_depth() + 1) / self.concurrency))
+
+    def saturated(self) -> bool:
+        return self.queue_depth() >= self.queue_size
+
+    def _available(self, cost: float) -> bool:
+        if self.active >= self.concurrency:
+            return False
+        if self.bucket is None:
+            return True
+        self.bucket.refill()
+        return self.bucket.can_take(cost)
+
+    def _grant(self, cost: float):
+        self.active += 1
+        self.stats["admitted"] += 1
+        if self.bucket is not None:
+            self.bucket.tokens -= cost
+
+    def _dispatch(self):
+        """Servir les requêtes en attente, par priorité puis ordre d'arrivée"""
+        self._timer = None
+        while self._queue:
+            _, _, waiter = self._queue[0]
+            if waiter.future.done():
+                heapq.heappop(self._queue)
+                continue
+            if self.active >= self.concurrency:
+                return
+            if not self._available(waiter.cost):
+                # Budget de tokens épuisé : réessayer quand le seau sera assez rechargé
+                delay = self.bucket.delay_for(waiter.cost)
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self._queue)
+            self._grant(waiter.cost)
+            waiter.future.set_result(None)
+
+    async def acquire(self, cost: float, priority: int):
+        if self.queue_depth() == 0 and self._available(cost):
+            self._grant(cost)
+            return
+
+        if self.saturated():
+            self.stats["shed_queue_full"] += 1
+            raise Saturated(self.model, "queue_full", self.retry_after())
+
+        waiter = _Waiter(cost)
+        heapq.heappush(self._queue, (priority, next(self._sequence), waiter))
+        self.stats["queued"] += 1
+        if self._timer is None:
+            self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            if not waiter.future.done():
+                waiter.future.cancel()
+                self.stats["shed_timeout"] += 1
+                raise Saturated(self.model, "timeout", self.retry_after())
+        except asyncio.CancelledError:
+            # Client parti pendant l'attente : rendre la place si elle venait d'être accordée
+            if not waiter.future.cancel():
+                self.release(0.0)
+            raise
+        finally:
+            wait = time.perf_counter() - waiter.enqueued_at
+            self.stats["wait_seconds"] += wait
+            observe_queue_wait(self.model, wait)
+
+    def release(self, held_seconds: float):
+        self.active -= 1
+        if held_seconds:
+            self._hold_seconds = 0.9 * self._hold_seconds + 0.1 * held_seconds
+        self._dispatch()
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "active": self.active,
+            "concurrency": self.concurrency,
+            "queue_depth": self.queue_depth(),
+            "tokens_available": round(self.bucket.tokens) if self.bucket else None,
+            "avg_wait_seconds": round(self.stats["wait_seconds"] / self.stats["queued"], 3) if self.stats["queued"] else 0.0,
+        }
+
+
+class Governor:
+    """Ensemble des files par modèle"""
+
+    def __init__(self, enabled: bool = GOVERNOR_ENABLED, concurrency: dict | None = None, tpm: dict | None = None,
+                 default_concurrency: int = GOVERNOR_DEFAULT_CONCURRENCY, queue_size: int = GOVERNOR_QUEUE_SIZE,
+                 max_wait: float = GOVERNOR_MAX_WAIT, workers: int = SEARCH_WORKERS):
+        self.enabled = enabled
+        self.workers = workers
+        self.concurrency = GOVERNOR_CONCURRENCY if concurrency is None else concurrency
+        self.tpm = GOVERNOR_TPM if tpm is None else tpm
+        self.default_concurrency = default_concurrency
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.gates: dict[str, ModelGate] = {}
+
+    def gate(self, model: str) -> ModelGate:
+        if model not in self.gates:
+            # Part de ce worker dans les limites du nœud (au moins un appel à la fois)
+            concurrency = max(1, int(self.concurrency.get(model, self.default_concurrency)) // self.workers)
+            tpm = self.tpm.get(model)
+            self.gates[model] = ModelGate(
+                model, concurrency, tpm / self.workers if tpm else None, self.queue_size, self.max_wait
+            )
+        return self.gates[model]
+
+    def check(self, *models: str):
+        """Refus immédiat à l'entrée d'une requête si la file d'un des modèles est déjà pleine"""
+        if not self.enabled:
+            return
+        for model in models:
+            gate = self.gate(model)
+            if gate.saturated():
+                gate.stats["shed_queue_full"] += 1
+                raise Saturated(model, "queue_full", gate.retry_after())
+
+    @asynccontextmanager
+    async def slot(self, model: str, cost: float = 0.0):
+        """`async with governor.slot("gpt-4", cost=tokens):` autour d'un appel OpenAI"""
+        if not self.enabled:
+            yield
+            return
+        gate = self.gate(model)
+        await gate.acquire(cost, request_priority.get())
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            gate.release(time.perf_counter() - start)
+
+    def get_stats(self) -> dict:
+        return {model: gate.get_stats() for model, gate in self.gates.items()}
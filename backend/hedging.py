@@ -0,0 +1,112 @@
+"""
+Requêtes "hedgées" (doublées) pour couper la traîne de latence des appels OpenAI
+Si un appel n'a pas répondu après le percentile HEDGE_PERCENTILE des latences récentes de son site,
+un second appel identique est lancé : le premier qui répond gagne, l'autre est annulé.
+Le nombre d'appels doublés est plafonné à HEDGE_MAX_EXTRA des appels (surcoût maximal).
+
+Désactivé par défaut (HEDGE_ENABLED=true pour l'activer) ; sites concernés : HEDGE_SITES
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_SITES = [site.strip() for site in os.getenv("HEDGE_SITES", "intent,commercial,embedding").split(",") if site.strip()]
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MAX_EXTRA = float(os.getenv("HEDGE_MAX_EXTRA", "0.05"))  # Appels en plus / appels, par site
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))
+
+
+class Hedger:
+    """Latences récentes et compteurs par site d'appel (intent:gpt-4o-mini, embedding:...)"""
+
+    def __init__(self, enabled: bool = HEDGE_ENABLED, sites: list[str] | None = None,
+                 percentile: float = HEDGE_PERCENTILE, max_extra: float = HEDGE_MAX_EXTRA,
+                 min_samples: int = HEDGE_MIN_SAMPLES, window: int = HEDGE_WINDOW, min_delay: float = HEDGE_MIN_DELAY):
+        self.enabled = enabled
+        self.sites = HEDGE_SITES if sites is None else sites
+        self.percentile = percentile
+        self.max_extra = max_extra
+        self.min_samples = min_samples
+        self.window = window
+        self.min_delay = min_delay
+        self._latencies: dict[str, deque] = {}
+        self.stats: dict[str, dict] = {}
+
+    def delay(self, key: str) -> float | None:
+        """Délai avant le second appel (None tant que l'historique est trop court)"""
+        latencies = self._latencies.get(key)
+        if not latencies or len(latencies) < self.min_samples:
+            return None
+        ordered = sorted(latencies)
+        index = min(len(ordered) - 1, max(0, math.ceil(self.percentile / 100 * len(ordered)) - 1))
+        return max(self.min_delay, ordered[index])
+
+    def _record(self, key: str, seconds: float):
+        self._latencies.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    async def run(self, site: str, model: str, call: Callable[[], Awaitable]):
+        """Exécuter `call()` (fabrique de coroutine), doublé si la réponse tarde"""
+        if not self.enabled or site not in self.sites:
+            return await call()
+
+        key = f"{site}:{model}"
+        stats = self.stats.setdefault(key, {"calls": 0, "fired": 0, "won": 0, "suppressed": 0})
+        stats["calls"] += 1
+        delay = self.delay(key)
+        if delay is None:
+            start = time.perf_counter()
+            result = await call()
+            self._record(key, time.perf_counter() - start)
+            return result
+
+        primary = asyncio.ensure_future(call())
+        started = {primary: time.perf_counter()}
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if not done:
+                # Le ratio appels doublés / appels ne dépasse jamais le plafond
+                if stats["fired"] + 1 <= self.max_extra * stats["calls"]:
+                    stats["fired"] += 1
+                    started[asyncio.ensure_future(call())] = time.perf_counter()
+                else:
+                    stats["suppressed"] += 1
+
+            pending = set(started)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled() or task.exception() is not None:
+                        continue
+                    if task is not primary:
+                        stats["won"] += 1
+                    # Latence de l'appel principal uniquement : sa durée réelle, ou (doublon gagnant) une borne
+                    # basse arrêtée à la réponse du doublon. Ne garder que les gagnants ferait baisser le
+                    # percentile, donc le délai, et doublerait de plus en plus d'appels
+                    self._record(key, time.perf_counter() - started[primary])
+                    return task.result()
+            # Tous les appels ont échoué : l'erreur de l'appel principal est remontée
+            return primary.result()
+        finally:
+            for task in started:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # Erreur du perdant : éviter l'avertissement asyncio
+
+    def get_stats(self) -> dict:
+        return {
+            key: {
+                **stats,
+                "extra_ratio": round(stats["fired"] / stats["calls"], 3) if stats["calls"] else 0.0,
+                "win_rate": round(stats["won"] / stats["fired"], 3) if stats["fired"] else 0.0,
+                "delay_seconds": self.delay(key),
+            }
+            for key, stats in self.stats.items()
+        }
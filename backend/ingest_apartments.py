@@ -2,12 +2,14 @@ import json
 import os
 from qdrant_client import QdrantClient
 from qdrant_client.models import PointStruct
-from openai import OpenAI
+from openai_transport import make_openai_client
 from dotenv import load_dotenv
 import hashlib
+from qdrant_schema import ensure_collection
+from apartment_cards import apartment_payload
 
 load_dotenv()
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+openai_client = make_openai_client(api_key=os.getenv("OPENAI_API_KEY"))
 
 # Configuration Qdrant adaptable (local vs cloud)
 qdrant_url = os.getenv("QDRANT_URL")
@@ -18,7 +20,9 @@ if qdrant_url:
 else:
     qdrant = QdrantClient(host=os.getenv("QDRANT_HOST", "localhost"), port=int(os.getenv("QDRANT_PORT", "6333")))
 
-COLLECTION_NAME = "chunks"
+# Collection des appartements ("chunks", ou "apartments" en layout partitionné),
+# avec ses index de payload pour les filtres de recherche (type, ville, pièces, loyer, surface, meublé)
+COLLECTION_NAME = ensure_collection(qdrant, "apartments")
 
 def generate_id(text):
     return int(hashlib.md5(text.encode('utf-8')).hexdigest(), 16) % (10 ** 12)
@@ -52,39 +56,22 @@ points = []
 for i, apt in enumerate(lines, 1):
     # Le texte descriptif est déjà dans le champ "text"
     content = apt["text"]
-    metadata = apt["metadata"]
-    
+
+    # Card servie telle quelle par le serveur de recherche + nom de typologie, calculés une seule fois
+    payload = apartment_payload(apt)
+    card = payload["card"]
+
     # Afficher la progression
-    city = metadata.get('city', 'N/A')
-    rooms = metadata.get('rooms', 'N/A')
-    rent = metadata.get('rent_cc_eur', 'N/A')
-    
-    # Déterminer le nom de la typologie
-    if rooms == 0:
-        typologie = "Colocation"
-    elif rooms == 1:
-        surface = metadata.get('surface_m2', 0)
-        typologie = "Studio" if surface < 23 else "T1"
-    else:
-        typologie = f"T{rooms}"
-    
-    print(f"  [{i}/{len(lines)}] {city} - {typologie} - {rent} EUR/mois")
+    print(f"  [{i}/{len(lines)}] {card['city']} - {payload['typologie_label']} - {card['rent_cc_eur']} EUR/mois")
     
     # Générer l'embedding
     vector = embed(content)
     
-    # Créer le point pour Qdrant avec toutes les métadonnées enrichies
+    # Créer le point pour Qdrant : card + champs filtrés à la racine (city, rooms, rent_cc_eur, etc.)
     point = PointStruct(
         id=generate_id(content + apt['id']),
         vector=vector,
-        payload={
-            "content": content,
-            "type": "appartement",  # Important pour filtrer par type
-            "apartment_id": apt['id'],
-            "url": f"mailto:contact@uxco-management.com?subject=Appartement {apt['id']}",
-            "lang": "fr",
-            **metadata  # Ajoute toutes les métadonnées (city, rooms, rent_cc_eur, etc.)
-        }
+        payload=payload
     )
     points.append(point)
 
@@ -1,13 +1,15 @@
 import json
 import os
 from qdrant_client import QdrantClient
-from qdrant_client.models import VectorParams, Distance, PointStruct
-from openai import OpenAI
+from qdrant_client.models import PointStruct, Filter, FieldCondition, MatchValue, FilterSelector
+from openai_transport import make_openai_client
 from dotenv import load_dotenv
-import hashlib
+import sys
+from qdrant_schema import BRAND_FILES, current_brand, ensure_collection
+from lexical_index import build_brand_index, chunk_id
 
 load_dotenv()
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+openai_client = make_openai_client(api_key=os.getenv("OPENAI_API_KEY"))
 
 # Configuration Qdrant adaptable (local vs cloud)
 qdrant_url = os.getenv("QDRANT_URL")
@@ -18,17 +20,9 @@ if qdrant_url:
 else:
     qdrant = QdrantClient(host=os.getenv("QDRANT_HOST", "localhost"), port=int(os.getenv("QDRANT_PORT", "6333")))
 
-COLLECTION_NAME = "chunks"
-
-# Crée la collection si elle n'existe pas
-if COLLECTION_NAME not in [c.name for c in qdrant.get_collections().collections]:
-    qdrant.recreate_collection(
-        collection_name=COLLECTION_NAME,
-        vectors_config=VectorParams(size=1536, distance=Distance.COSINE),
-    )
-
-def generate_id(text):
-    return int(hashlib.md5(text.encode('utf-8')).hexdigest(), 16) % (10 ** 12)
+# Crée la collection des chunks si elle n'existe pas ("chunks", ou "knowledge" en layout partitionné),
+# avec ses index de payload pour les filtres de recherche
+COLLECTION_NAME = ensure_collection(qdrant, "knowledge")
 
 def embed(text):
     response = openai_client.embeddings.create(
@@ -37,46 +31,60 @@ def embed(text):
     )
     return response.data[0].embedding
 
-# Charge les chunks
-with open("ecla_chunks_classified.jsonl", "r", encoding="utf-8") as f:
-    lines = [json.loads(line) for line in f]
+# Marques à ingérer (en argument, sinon la marque du déploiement) : python ingest_qdrant.py ecla uxco
+brands = sys.argv[1:] or [current_brand()]
 
-points = []
+for brand in brands:
+    # Charge les chunks de la marque
+    with open(BRAND_FILES[brand], "r", encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f if line.strip()]
 
-for i, chunk in enumerate(lines):
-    try:
-        if not isinstance(chunk, dict):
-            print(f"⚠️ Ligne {i+1} ignorée: format invalide")
-            continue
-            
-        if "content" not in chunk:
-            print(f"⚠️ Ligne {i+1} ignorée: pas de champ 'content'")
-            continue
-            
-        if "metadata" not in chunk:
-            print(f"⚠️ Ligne {i+1} ignorée: pas de champ 'metadata'")
+    points = []
+
+    for i, chunk in enumerate(lines):
+        try:
+            if not isinstance(chunk, dict):
+                print(f"⚠️ Ligne {i+1} ignorée: format invalide")
+                continue
+
+            if "content" not in chunk:
+                print(f"⚠️ Ligne {i+1} ignorée: pas de champ 'content'")
+                continue
+
+            if "metadata" not in chunk:
+                print(f"⚠️ Ligne {i+1} ignorée: pas de champ 'metadata'")
+                continue
+
+            content = chunk["content"]
+            metadata = chunk["metadata"]
+            vector = embed(content)
+            point = PointStruct(
+                id=chunk_id(content, brand),  # Marque incluse : pas d'écrasement entre marques en layout "single"
+                vector=vector,
+                payload={
+                    "content": content,
+                    **metadata,
+                    "brand": brand
+                }
+            )
+            points.append(point)
+        except Exception as e:
+            print(f"⚠️ Erreur ligne {i+1}: {e}")
             continue
-            
-        content = chunk["content"]
-        metadata = chunk["metadata"]
-        vector = embed(content)
-        point = PointStruct(
-            id=generate_id(content),
-            vector=vector,
-            payload={
-                "content": content,
-                **metadata
-            }
-        )
-        points.append(point)
-    except Exception as e:
-        print(f"⚠️ Erreur ligne {i+1}: {e}")
-        continue
 
-# Envoi dans Qdrant
-qdrant.upsert(
-    collection_name=COLLECTION_NAME,
-    points=points
-)
+    # Envoi dans Qdrant
+    # Remplace les chunks de la marque (les autres marques et les appartements ne sont pas touchés)
+    qdrant.delete(
+        collection_name=COLLECTION_NAME,
+        points_selector=FilterSelector(filter=Filter(must=[FieldCondition(key="brand", match=MatchValue(value=brand))]))
+    )
+    qdrant.upsert(
+        collection_name=COLLECTION_NAME,
+        points=points
+    )
+
+    print(f"Ingeste {len(points)} chunks {brand} dans Qdrant ({COLLECTION_NAME})")
 
-print(f"Ingeste {len(points)} chunks dans Qdrant")
+    # Index lexical (BM25) construit à partir du même fichier, lu par le serveur de recherche
+    lexical = build_brand_index(brand, lines)
+    print(f"Index lexical {brand} : {len(lexical)} chunks")
@@ -0,0 +1,183 @@
+"""
+Index lexical (BM25) des chunks de la base de connaissances
+Construit à l'ingestion à partir des mêmes fichiers JSONL que Qdrant (voir ingest_qdrant.py),
+reconstruit par le serveur si le fichier est absent ou plus ancien que le JSONL
+
+- Tokenisation adaptée au français : accents repliés ("éligibilité" = "eligibilite"), élisions
+  ("l'appartement"), mots vides, pluriels simples ("laveries" = "laverie")
+- Confiance lexicale : part des termes de la question connus de l'index et distinctifs, et part
+  des meilleurs résultats qui les contiennent tous. Une question courte et bien couverte ("laverie", "APL", "caution")
+  peut être servie sans embedding
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Optional
+
+from local_cache import CACHE_DIR
+from qdrant_schema import BRAND_FILES
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60  # Constante de la fusion par rangs réciproques (valeur usuelle)
+LEXICAL_SKIP_CONFIDENCE = float(os.getenv("LEXICAL_SKIP_CONFIDENCE", "0.8"))
+LEXICAL_MAX_QUERY_TERMS = int(os.getenv("LEXICAL_MAX_QUERY_TERMS", "4"))  # Au-delà, la question est "rédigée"
+LEXICAL_CONFIDENCE_TOP_K = 5
+LEXICAL_COMMON_TERM_RATIO = 0.3  # Terme présent dans plus de 30% des chunks ("ecla", "residence") : peu distinctif
+
+# Mots vides (sans accents : comparés après repli)
+STOPWORDS = {
+    "a", "au", "aux", "avec", "c", "ce", "ces", "cet", "cette", "chez", "comment", "combien", "d", "dans", "de",
+    "des", "du", "elle", "elles", "en", "est", "et", "etre", "avoir", "ai", "as", "avez", "ont", "il", "ils", "j",
+    "je", "l", "la", "le", "les", "leur", "leurs", "lui", "m", "ma", "me", "mes", "moi", "mon", "n", "ne", "nos",
+    "notre", "nous", "on", "ou", "par", "pas", "peut", "peux", "plus", "pour", "qu", "que", "quel", "quelle",
+    "quelles", "quels", "qui", "quoi", "s", "sa", "sans", "se", "ses", "son", "sont", "sur", "t", "ta", "te",
+    "tes", "ton", "tu", "un", "une", "vos", "votre", "vous", "y", "svp", "bonjour", "merci", "fait", "faire",
+}
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def fold(text: str) -> str:
+    """Minuscules sans accents ni ligatures : "Œuvre à Genève" -> "oeuvre a geneve" """
+    text = text.lower().replace("œ", "oe").replace("æ", "ae")
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+def stem(token: str) -> str:
+    """Pluriels simples : "laveries" -> "laverie", "bureaux" -> "bureau" (les sigles courts restent intacts)"""
+    if len(token) > 4 and token.endswith("x"):
+        return token[:-1]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list[str]:
+    # Les apostrophes séparent les élisions ("l'appartement" -> "l", "appartement")
+    return [stem(token) for token in _TOKEN.findall(fold(text)) if token not in STOPWORDS]
+
+
+def chunk_id(content: str, brand: str) -> int:
+    """Identifiant du point Qdrant du chunk : la marque en fait partie (un même texte sur deux sites = deux points)"""
+    return int(hashlib.md5(f"{brand}:{content}".encode("utf-8")).hexdigest(), 16) % (10 ** 12)
+
+
+class LexicalIndex:
+    """Index inversé BM25 : terme -> {position du document: fréquence}"""
+
+    def __init__(self, docs: list[dict]):
+        self.docs = docs  # {"id", "content", "url", "type"}
+        self.postings: dict[str, dict[int, int]] = {}
+        self.lengths: list[int] = []
+        for position, doc in enumerate(docs):
+            terms = Counter(tokenize(doc["content"]))
+            self.lengths.append(sum(terms.values()))
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, {})[position] = frequency
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+    @classmethod
+    def from_chunks(cls, chunks: list[dict], brand: str) -> "LexicalIndex":
+        """Index des lignes JSONL ({"content", "metadata"}) d'une marque retenues par l'ingestion Qdrant"""
+        return cls([
+            {
+                "id": chunk_id(chunk["content"], brand),
+                "content": chunk["content"],
+                "url": chunk["metadata"].get("url", ""),
+                "type": chunk["metadata"].get("type", ""),
+            }
+            for chunk in chunks
+            if isinstance(chunk, dict) and "content" in chunk and "metadata" in chunk
+        ])
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def _idf(self, term: str) -> float:
+        frequency = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.docs) - frequency + 0.5) / (frequency + 0.5))
+
+    def search(self, query: str, limit: int = 20) -> tuple[list[tuple[dict, float]], float]:
+        """Documents classés par score BM25, et confiance lexicale de la question (0 à 1)"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        scores: dict[int, float] = {}
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf(term)
+            for position, frequency in postings.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[position] / self.avg_length)
+                scores[position] = scores.get(position, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(self.docs[position], score) for position, score in ranked], self._confidence(terms, ranked)
+
+    def _confidence(self, terms: list[str], ranked: list[tuple[int, float]]) -> float:
+        if not terms or not ranked:
+            return 0.0
+        # Terme absent de l'index, ou présent presque partout : le classement BM25 ne dit rien
+        common = LEXICAL_COMMON_TERM_RATIO * len(self.docs)
+        coverage = sum(1 for term in terms if 0 < len(self.postings.get(term, ())) <= common) / len(terms)
+        top = ranked[:LEXICAL_CONFIDENCE_TOP_K]
+        complete = sum(1 for position, _ in top if all(position in self.postings.get(t, ()) for t in terms)) / len(top)
+        confidence = coverage * complete
+        if len(terms) > LEXICAL_MAX_QUERY_TERMS:
+            # Question longue : le sens compte plus que les mots-clés
+            confidence *= LEXICAL_MAX_QUERY_TERMS / len(terms)
+        return round(confidence, 3)
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump({"docs": self.docs}, f, ensure_ascii=False)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f)["docs"])
+
+
+def reciprocal_rank_fusion(rankings: list[list], key, k: int = RRF_K) -> list[tuple[object, float]]:
+    """Fusion de classements (RRF) : score = somme des 1 / (k + rang) ; `key` identifie un même document"""
+    scores: dict = {}
+    items: dict = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            item_key = key(item)
+            scores[item_key] = scores.get(item_key, 0.0) + 1 / (k + rank)
+            items.setdefault(item_key, item)
+    return sorted(((items[item_key], score) for item_key, score in scores.items()), key=lambda pair: pair[1], reverse=True)
+
+
+def index_path(brand: str) -> str:
+    return os.path.join(CACHE_DIR, "lexical", f"{brand}.json")
+
+
+def build_brand_index(brand: str, chunks: Optional[list[dict]] = None) -> LexicalIndex:
+    """Construire et enregistrer l'index d'une marque (chunks déjà lus, sinon son fichier JSONL)"""
+    if chunks is None:
+        with open(BRAND_FILES[brand], encoding="utf-8") as f:
+            chunks = [json.loads(line) for line in f if line.strip()]
+    index = LexicalIndex.from_chunks(chunks, brand)
+    index.save(index_path(brand))
+    return index
+
+
+def load_brand_index(brand: str) -> LexicalIndex:
+    """Index enregistré à l'ingestion, reconstruit s'il manque ou si le JSONL est plus récent"""
+    path = index_path(brand)
+    try:
+        if os.path.getmtime(path) >= os.path.getmtime(BRAND_FILES[brand]):
+            return LexicalIndex.load(path)
+    except FileNotFoundError:
+        pass
+    return build_brand_index(brand)
@@ -0,0 +1,91 @@
+"""
+Cache persistant des complétions GPT (intention, réponse commerciale, résumé)
+Les appels ont des entrées déterministes : un état de conversation identique renvoie la réponse en cache
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+
+from local_cache import MemoryCache, SqliteCache
+
+# TTL (secondes) par site d'appel
+LLM_CACHE_TTLS = {
+    "intent": float(os.getenv("LLM_CACHE_TTL_INTENT", str(24 * 3600))),
+    "commercial": float(os.getenv("LLM_CACHE_TTL_COMMERCIAL", "3600")),
+    "summary": float(os.getenv("LLM_CACHE_TTL_SUMMARY", "3600")),
+}
+LLM_CACHE_MEMORY_SIZE = int(os.getenv("LLM_CACHE_MEMORY_SIZE", "1024"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+DEFAULT_TTL = 3600
+
+
+def fingerprint(value) -> str:
+    """Hash court et stable d'une valeur sérialisable en JSON"""
+    raw = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def chunk_ids(chunks: list[dict]) -> list[str]:
+    """Identifiants stables des chunks (hash url + contenu)"""
+    return [fingerprint([c.get("url", ""), c.get("content", "")])[:16] for c in chunks]
+
+
+class CompletionCache:
+    """Cache à deux niveaux (mémoire + SQLite) des réponses du modèle, avec TTL par site d'appel"""
+
+    def __init__(self):
+        self.memory = MemoryCache(max_entries=LLM_CACHE_MEMORY_SIZE, ttl=DEFAULT_TTL)
+        self.disk = SqliteCache("completions.sqlite3", max_entries=LLM_CACHE_MAX_ENTRIES, ttl=DEFAULT_TTL)
+        self.stats = {site: {"hits": 0, "misses": 0} for site in LLM_CACHE_TTLS}
+
+    def key(self, site: str, model: str, messages: list[dict], params: dict,
+            history: list[dict] | None = None, chunks: list[dict] | None = None) -> str:
+        """Clé = site + modèle + prompt + paramètres + hash de l'historique et des chunks utilisés"""
+        return fingerprint({
+            "site": site,
+            "model": model,
+            "messages": messages,
+            "params": params,
+            "history": fingerprint(history or []),
+            "chunks": chunk_ids(chunks or []),
+        })
+
+    def _ttl(self, site: str) -> float:
+        return LLM_CACHE_TTLS.get(site, DEFAULT_TTL)
+
+    def get(self, site: str, key: str) -> Optional[str]:
+        stats = self.stats.setdefault(site, {"hits": 0, "misses": 0})
+        text = self.memory.get(key)
+        if text is None:
+            entry = self.disk.get_entry(key)
+            if entry is not None:
+                blob, expires_at = entry
+                text = blob.decode("utf-8")
+                # Copie en mémoire sans survivre à l'entrée disque
+                self.memory.set(key, text, ttl=min(self._ttl(site), expires_at - time.time()))
+        if text is None:
+            stats["misses"] += 1
+        else:
+            stats["hits"] += 1
+        return text
+
+    def set(self, site: str, key: str, text: str):
+        ttl = self._ttl(site)
+        if ttl <= 0:
+            return
+        self.memory.set(key, text, ttl=ttl)
+        self.disk.set(key, text.encode("utf-8"), ttl=ttl)
+
+    def clear(self):
+        self.memory.clear()
+        self.disk.clear()
+
+    def get_stats(self) -> dict:
+        result = {}
+        for site, stats in self.stats.items():
+            total = stats["hits"] + stats["misses"]
+            result[site] = {**stats, "hit_rate": round(stats["hits"] / total, 3) if total else 0.0}
+        return result
@@ -0,0 +1,251 @@
+"""
+Caches locaux réutilisables par le serveur de recherche
+- MemoryCache : LRU en mémoire avec expiration (TTL)
+- SqliteCache : stockage persistant sur disque (survit aux redémarrages), partagé par tous
+  les workers d'un même nœud (mode WAL : lectures concurrentes, écritures sérialisées par SQLite
+  et faites par un thread d'écriture, hors de la boucle asyncio)
+"""
+
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+# Attente maximale d'un verrou d'écriture tenu par un autre worker (millisecondes)
+CACHE_BUSY_TIMEOUT_MS = int(os.getenv("CACHE_BUSY_TIMEOUT_MS", "2000"))
+# Date de dernier accès (LRU) rafraîchie au plus une fois par intervalle : une lecture n'écrit presque jamais
+CACHE_TOUCH_INTERVAL = float(os.getenv("CACHE_TOUCH_INTERVAL", "300"))
+CACHE_TOUCH_BATCH = int(os.getenv("CACHE_TOUCH_BATCH", "64"))
+# Éviction (expirées + LRU au-delà de max_entries) toutes les N écritures, pas à chaque écriture
+CACHE_EVICT_EVERY = int(os.getenv("CACHE_EVICT_EVERY", "200"))
+
+
+class MemoryCache:
+    """Cache LRU en mémoire avec TTL par entrée"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def update(self, key: str, fn: Callable[[Optional[Any]], Any], ttl: Optional[float] = None) -> Any:
+        """Lecture-modification-écriture atomique : fn(valeur actuelle ou None) -> nouvelle valeur"""
+        with self._lock:
+            item = self._data.get(key)
+            value = fn(item[1] if item is not None and item[0] >= time.time() else None)
+            self._store(key, value, ttl)
+            return value
+
+    def _store(self, key: str, value: Any, ttl: Optional[float]):
+        self._data[key] = (time.time() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SqliteCache:
+    """
+    Cache clé/valeur persistant dans un fichier SQLite
+    Les entrées expirées sont ignorées, les moins récemment utilisées sont supprimées au-delà de max_entries
+
+    Les lectures (journal WAL) n'attendent jamais le verrou d'écriture d'un autre worker. Les écritures,
+    les dates de dernier accès (par lots) et l'éviction (toutes les `evict_every` écritures) passent par un
+    thread d'écriture dédié avec sa propre connexion : un appel depuis la boucle asyncio ne bloque pas
+    sur un autre worker. Les écritures en attente sont servies par get() dans le process qui les a faites
+    """
+
+    def __init__(self, filename: str, max_entries: int = 100_000, ttl: float = 30 * 24 * 3600,
+                 evict_every: int = CACHE_EVICT_EVERY):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        self.path = os.path.join(CACHE_DIR, filename)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evict_every = evict_every
+        self._lock = threading.Lock()  # Écritures et accès en attente
+        self._read_lock = threading.Lock()
+        self._write_lock = threading.Lock()  # Connexion d'écriture (thread d'écriture, clear, flush)
+        self._pending: dict[str, tuple[bytes, float]] = {}
+        self._touches: dict[str, float] = {}
+        self._writes_since_evict = 0
+        self._write_conn = self._connect()
+        self._write_conn.execute("PRAGMA journal_mode = WAL")
+        self._write_conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._write_conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_access ON cache(last_access)")
+        self._write_conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_expires_at ON cache(expires_at)")
+        self._write_conn.commit()
+        self._conn = self._connect()
+        self._wake = threading.Event()
+        threading.Thread(target=self._write_loop, name=f"sqlite-cache-{filename}", daemon=True).start()
+        atexit.register(self.flush)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=CACHE_BUSY_TIMEOUT_MS / 1000)
+        conn.execute(f"PRAGMA busy_timeout = {CACHE_BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key: str) -> Optional[tuple[bytes, float]]:
+        """Valeur et date d'expiration (pour copier l'entrée dans un cache mémoire sans prolonger sa durée de vie)"""
+        now = time.time()
+        with self._lock:
+            pending = self._pending.get(key)
+        if pending is not None:
+            return pending if pending[1] >= now else None
+
+        with self._read_lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at, last_access FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        value, expires_at, last_access = row
+        if expires_at < now:
+            return None  # Supprimée à la prochaine éviction
+        if now - last_access >= CACHE_TOUCH_INTERVAL:
+            with self._lock:
+                self._touches[key] = now
+                if len(self._touches) >= CACHE_TOUCH_BATCH:
+                    self._wake.set()
+        return value, expires_at
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._pending[key] = (value, expires_at)
+        self._wake.set()
+
+    def update(self, key: str, fn: Callable[[Optional[bytes]], bytes], ttl: Optional[float] = None) -> bytes:
+        """
+        Lecture-modification-écriture atomique, y compris entre workers : fn(valeur actuelle ou None) -> nouvelle valeur
+        Écrite tout de suite dans une transaction BEGIN IMMEDIATE (appel bloquant, à faire hors de la boucle asyncio)
+        """
+        with self._write_lock:
+            now = time.time()
+            with self._lock:
+                pending = self._pending.pop(key, None)
+            try:
+                self._write_conn.execute("BEGIN IMMEDIATE")
+                if pending is not None:
+                    current = pending[0] if pending[1] >= now else None
+                else:
+                    row = self._write_conn.execute(
+                        "SELECT value FROM cache WHERE key = ? AND expires_at >= ?", (key, now)
+                    ).fetchone()
+                    current = row[0] if row is not None else None
+                value = fn(current)
+                self._write_conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                    (key, value, now + (self.ttl if ttl is None else ttl), now)
+                )
+                self._write_conn.commit()
+            except BaseException:
+                self._write_conn.rollback()
+                if pending is not None:
+                    with self._lock:
+                        self._pending.setdefault(key, pending)
+                raise
+            return value
+
+    def _write_loop(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"[WARNING] Écriture du cache {os.path.basename(self.path)} reportée: {e}")
+                time.sleep(CACHE_BUSY_TIMEOUT_MS / 1000)
+                self._wake.set()
+
+    def flush(self):
+        """Écrire les entrées et dates d'accès en attente (une transaction), puis évincer si c'est le moment"""
+        with self._write_lock:
+            with self._lock:
+                writes = dict(self._pending)
+                touches, self._touches = self._touches, {}
+            if not writes and not touches:
+                return
+            now = time.time()
+            try:
+                with self._write_conn:
+                    self._write_conn.executemany(
+                        "INSERT OR REPLACE INTO cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                        [(key, value, expires_at, now) for key, (value, expires_at) in writes.items()]
+                    )
+                    self._write_conn.executemany(
+                        "UPDATE cache SET last_access = ? WHERE key = ?",
+                        [(accessed_at, key) for key, accessed_at in touches.items() if key not in writes]
+                    )
+                    self._writes_since_evict += len(writes)
+                    if self._writes_since_evict >= self.evict_every:
+                        self._writes_since_evict = 0
+                        self._evict()
+            except sqlite3.Error:
+                with self._lock:
+                    self._touches = {**touches, **self._touches}
+                raise
+            with self._lock:
+                # Une entrée réécrite entre-temps reste en attente
+                for key, item in writes.items():
+                    if self._pending.get(key) is item:
+                        del self._pending[key]
+
+    def _evict(self):
+        """Supprimer les entrées expirées puis les moins récemment utilisées au-delà de max_entries"""
+        self._write_conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+        count = self._write_conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if count > self.max_entries:
+            self._write_conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def clear(self):
+        with self._write_lock:
+            with self._lock:
+                self._pending.clear()
+                self._touches.clear()
+            with self._write_conn:
+                self._write_conn.execute("DELETE FROM cache")
+
+    def __len__(self) -> int:
+        with self._read_lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
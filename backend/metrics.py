@@ -0,0 +1,286 @@
+"""
+Instrumentation des serveurs (recherche et administration)
+- Durée de chaque étape d'une requête : en-tête `Server-Timing` + histogrammes Prometheus
+- Requêtes en cours, durée totale par route
+- Compteurs existants (stats des caches, fallback...) exposés sur `/metrics` au moment du scrape
+
+Plusieurs workers uvicorn (PROMETHEUS_MULTIPROC_DIR défini par startup.py) : histogrammes et compteurs
+agrégés entre workers (mode multi-process de prometheus_client) ; les statistiques calculées à la demande
+restent propres à chaque worker et sont exposées pour tous les workers avec un label "worker" (pid),
+à sommer côté Prometheus. Les endpoints JSON /*/stats ne décrivent que le worker qui répond (en-tête X-Worker-Pid)
+"""
+
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterable, Optional
+
+from fastapi import FastAPI, Request, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+# Fréquence d'écriture de l'instantané des statistiques de chaque worker (mode multi-process)
+STATS_SNAPSHOT_INTERVAL = float(os.getenv("STATS_SNAPSHOT_INTERVAL", "5"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+
+STAGE_SECONDS = Histogram(
+    "stage_duration_seconds", "Durée des étapes d'une requête", ["server", "stage"], buckets=LATENCY_BUCKETS
+)
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Durée des requêtes HTTP", ["server", "method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Requêtes HTTP en cours", ["server"], multiprocess_mode="livesum")
+STAGE_ERRORS = Counter("stage_errors_total", "Etapes terminées par une exception", ["server", "stage"])
+MODEL_SECONDS = Histogram(
+    "llm_request_duration_seconds", "Durée des appels aux modèles OpenAI", ["server", "site", "model"],
+    buckets=LATENCY_BUCKETS
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "openai_queue_wait_seconds", "Attente dans la file du régulateur d'appels OpenAI", ["server", "model"],
+    buckets=LATENCY_BUCKETS
+)
+
+_server_name = "app"
+_timings: ContextVar[Optional[dict]] = ContextVar("stage_timings", default=None)
+
+
+@contextmanager
+def stage(name: str):
+    """Chronométrer une étape : `with stage("embedding"): ...` (utilisable autour d'un await)"""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.labels(_server_name, name).inc()
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_SECONDS.labels(_server_name, name).observe(duration)
+        timings = _timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + duration
+
+
+@contextmanager
+def model_call(site: str, model: str):
+    """Chronométrer un appel au modèle, par site d'appel (intent, commercial...) et par modèle"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        MODEL_SECONDS.labels(_server_name, site, model).observe(time.perf_counter() - start)
+
+
+def observe_queue_wait(model: str, seconds: float):
+    QUEUE_WAIT_SECONDS.labels(_server_name, model).observe(seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings["queue_wait"] = timings.get("queue_wait", 0.0) + seconds
+
+
+def current_timings() -> dict:
+    """Copie des durées d'étapes déjà mesurées pour la requête en cours"""
+    return dict(_timings.get() or {})
+
+
+def share_timings(leader_timings: dict, waited: float):
+    """
+    Requête regroupée (single-flight) : reprendre les durées d'étapes du calcul partagé dans son Server-Timing,
+    plus une entrée "coalesced" (attente du résultat) ; les histogrammes ne les comptent qu'une fois
+    """
+    timings = _timings.get()
+    if timings is None:
+        return
+    for name, duration in leader_timings.items():
+        timings.setdefault(name, duration)
+    timings["coalesced"] = waited
+
+
+def server_timing_header(timings: dict, total: float) -> str:
+    """Valeur de l'en-tête Server-Timing (durées en millisecondes)"""
+    entries = [f"{name};dur={duration * 1000:.1f}" for name, duration in timings.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def _families(samples: Iterable[tuple]) -> list:
+    """Familles Prometheus à partir de tuples (nom, description, "counter" | "gauge", {labels}, valeur)"""
+    families = {}
+    for name, documentation, kind, labels, value in samples:
+        key = (name, kind)
+        if key not in families:
+            family_class = CounterMetricFamily if kind == "counter" else GaugeMetricFamily
+            families[key] = family_class(name, documentation, labels=sorted(labels))
+        families[key].add_metric([str(labels[label]) for label in sorted(labels)], value)
+    return list(families.values())
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class StatsCollector:
+    """
+    Collecteur Prometheus alimenté par des fonctions appelées à chaque scrape
+    Chaque fonction retourne des tuples (nom, description, "counter" | "gauge", {labels}, valeur)
+    """
+
+    def __init__(self):
+        self.sources: list[Callable[[], Iterable[tuple]]] = []
+
+    def samples(self) -> list[tuple]:
+        return [sample for source in self.sources for sample in source()]
+
+    def collect(self):
+        return _families(self.samples())
+
+
+class WorkerStatsCollector:
+    """
+    Mode multi-process : chaque worker écrit régulièrement ses statistiques dans `directory` ;
+    le scrape (servi par n'importe quel worker) les expose toutes, avec le label "worker"
+    """
+
+    def __init__(self, stats: StatsCollector, directory: str):
+        self.stats = stats
+        self.directory = directory
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"stats_{pid}.json")
+
+    def snapshot(self):
+        path = self._path(os.getpid())
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(self.stats.samples(), f, ensure_ascii=False)
+        os.replace(temporary, path)
+
+    def remove_snapshot(self):
+        try:
+            os.remove(self._path(os.getpid()))
+        except FileNotFoundError:
+            pass
+
+    def collect(self):
+        self.snapshot()  # Le worker qui répond est toujours à jour
+        samples = []
+        for path in glob.glob(os.path.join(self.directory, "stats_*.json")):
+            pid = int(os.path.basename(path)[len("stats_"):-len(".json")])
+            if not _alive(pid):
+                continue
+            try:
+                with open(path, encoding="utf-8") as f:
+                    worker_samples = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, documentation, kind, labels, value in worker_samples:
+                samples.append((name, documentation, kind, {**labels, "worker": str(pid)}, value))
+        return _families(samples)
+
+
+_stats_collector = StatsCollector()
+_worker_stats = WorkerStatsCollector(_stats_collector, PROMETHEUS_MULTIPROC_DIR) if PROMETHEUS_MULTIPROC_DIR else None
+if _worker_stats is None:
+    REGISTRY.register(_stats_collector)
+
+
+def metrics_registry():
+    """Registre servi par /metrics : celui du process, ou l'agrégat des workers en mode multi-process"""
+    if _worker_stats is None:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(_worker_stats)
+    return registry
+
+
+def _snapshot_loop():
+    while True:
+        time.sleep(STATS_SNAPSHOT_INTERVAL)
+        try:
+            _worker_stats.snapshot()
+        except Exception as e:
+            print(f"[WARNING] Instantané des statistiques non écrit: {e}")
+
+
+def register_stats(source: Callable[[], Iterable[tuple]]):
+    """Exposer sur /metrics des statistiques calculées à la demande"""
+    _stats_collector.sources.append(source)
+
+
+def instrument(app: FastAPI, server_name: str):
+    """
+    Ajouter à `app` le middleware de mesure et l'endpoint /metrics
+    Pour les réponses en streaming (SSE), l'en-tête ne contient que les étapes terminées avant le premier octet ;
+    les histogrammes, eux, couvrent toute la réponse
+    """
+    global _server_name
+    _server_name = server_name
+
+    if _worker_stats is not None:
+        threading.Thread(target=_snapshot_loop, name="stats-snapshot", daemon=True).start()
+
+        @app.on_event("shutdown")
+        def worker_exit():
+            # Jauges "livesum" et statistiques du worker arrêté retirées de l'agrégat
+            _worker_stats.remove_snapshot()
+            multiprocess.mark_process_dead(os.getpid())
+
+    @app.middleware("http")
+    async def timing_middleware(request: Request, call_next):
+        timings: dict = {}
+        token = _timings.set(timings)
+        in_flight = REQUESTS_IN_FLIGHT.labels(server_name)
+        in_flight.inc()
+        start = time.perf_counter()
+
+        def finish(status: int):
+            in_flight.dec()
+            route = request.scope.get("route")
+            REQUEST_SECONDS.labels(
+                server_name, request.method, getattr(route, "path", "unmatched"), str(status)
+            ).observe(time.perf_counter() - start)
+
+        try:
+            response = await call_next(request)
+        except BaseException:
+            finish(500)
+            raise
+        finally:
+            _timings.reset(token)
+
+        response.headers["Server-Timing"] = server_timing_header(timings, time.perf_counter() - start)
+        response.headers["Timing-Allow-Origin"] = "*"
+        response.headers["X-Worker-Pid"] = str(os.getpid())
+
+        # La requête reste "en cours" jusqu'au dernier octet du corps (réponses SSE comprises)
+        body_iterator = response.body_iterator
+
+        async def tracked_body():
+            try:
+                async for chunk in body_iterator:
+                    yield chunk
+            finally:
+                finish(response.status_code)
+
+        response.body_iterator = tracked_body()
+        return response
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return Response(generate_latest(metrics_registry()), media_type=CONTENT_TYPE_LATEST)
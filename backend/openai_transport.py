@@ -0,0 +1,265 @@
+"""
+Transport HTTP des clients OpenAI, avec un mode cassette (enregistrement / rejeu)
+- OPENAI_CASSETTE_MODE=record : les appels partent vers OpenAI, chaque paire requête → réponse est
+  enregistrée dans OPENAI_CASSETTE_DIR (corps, statut, latence, rythme des chunks en streaming)
+- OPENAI_CASSETTE_MODE=replay : les réponses enregistrées sont rejouées, sans réseau ni coût
+  (avec la latence enregistrée, sauf OPENAI_CASSETTE_LATENCY=none) ; une requête inconnue renvoie 404
+- OPENAI_CASSETTE_MODE=off (défaut) : client OpenAI standard
+
+Utilisation : `make_openai_client(api_key=...)` / `make_async_openai_client(api_key=...)`
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+
+def cassette_mode() -> str:
+    return os.getenv("OPENAI_CASSETTE_MODE", "off")
+
+
+def cassette_dir() -> str:
+    return os.getenv("OPENAI_CASSETTE_DIR", "cassettes")
+
+
+def replay_latency() -> bool:
+    return os.getenv("OPENAI_CASSETTE_LATENCY", "recorded") != "none"
+
+
+def request_key(request: httpx.Request) -> str:
+    """Clé d'une requête : méthode + chemin + corps JSON canonique (sans en-têtes ni clé API)"""
+    try:
+        body = json.dumps(json.loads(request.content or b"null"), sort_keys=True, ensure_ascii=False)
+    except ValueError:
+        body = request.content.decode("utf-8", errors="replace")
+    raw = f"{request.method} {request.url.path}\n{body}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def cassette_path(key: str) -> str:
+    return os.path.join(cassette_dir(), key[:2], f"{key}.json")
+
+
+def save_cassette(request: httpx.Request, response: httpx.Response, latency: float, chunks: list[tuple[float, str]]):
+    """Ecrire la cassette d'un échange (les chunks sont stockés avec leur délai depuis l'envoi)"""
+    key = request_key(request)
+    path = cassette_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        request_body = json.loads(request.content or b"null")
+    except ValueError:
+        request_body = request.content.decode("utf-8", errors="replace")
+    cassette = {
+        "request": {"method": request.method, "path": request.url.path, "body": request_body},
+        "response": {
+            "status": response.status_code,
+            "content_type": response.headers.get("content-type", "application/json"),
+            "latency_ms": round(latency * 1000, 1),
+            "chunks": [{"at_ms": round(at * 1000, 1), "data": text} for at, text in chunks],
+        },
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cassette, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def load_cassette(request: httpx.Request) -> dict | None:
+    path = cassette_path(request_key(request))
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def missing_response(request: httpx.Request) -> httpx.Response:
+    message = f"Aucune cassette pour {request.method} {request.url.path} (clé {request_key(request)[:12]})"
+    return httpx.Response(404, json={"error": {"message": message, "type": "cassette_miss"}}, request=request)
+
+
+def _headers(cassette: dict) -> dict:
+    return {"content-type": cassette["response"]["content_type"]}
+
+
+def _passthrough_headers(response: httpx.Response) -> dict:
+    """En-têtes de la réponse réelle, le corps étant renvoyé décodé (sans compression)"""
+    skipped = ("content-encoding", "content-length", "transfer-encoding")
+    return {k: v for k, v in response.headers.items() if k.lower() not in skipped}
+
+
+# === Transport synchrone (scripts d'ingestion, app.py, classify_chunks.py) ===
+
+class _RecordingStream(httpx.SyncByteStream):
+    def __init__(self, request, response, start, latency):
+        self.request, self.response, self.start, self.latency = request, response, start, latency
+        self.chunks: list[tuple[float, str]] = []
+        self.saved = False
+
+    def __iter__(self):
+        for text in self.response.iter_text():
+            self.chunks.append((time.perf_counter() - self.start, text))
+            yield text.encode("utf-8")
+        self.save()
+
+    def save(self):
+        if not self.saved:
+            self.saved = True
+            save_cassette(self.request, self.response, self.latency, self.chunks)
+
+    def close(self):
+        # Flux fermé sans avoir été itéré jusqu'au bout : la cassette est écrite à la fermeture
+        if not self.saved and not self.response.is_stream_consumed:
+            for text in self.response.iter_text():
+                self.chunks.append((time.perf_counter() - self.start, text))
+        self.save()
+        self.response.close()
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    def __init__(self, chunks: list[dict], latency_ms: float):
+        self.chunks, self.latency_ms = chunks, latency_ms
+
+    def __iter__(self):
+        elapsed_ms = self.latency_ms
+        for chunk in self.chunks:
+            if replay_latency() and chunk["at_ms"] > elapsed_ms:
+                time.sleep((chunk["at_ms"] - elapsed_ms) / 1000)
+                elapsed_ms = chunk["at_ms"]
+            yield chunk["data"].encode("utf-8")
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """Transport synchrone en mode "record" ou "replay" """
+
+    def __init__(self, mode: str, inner=None):
+        self.mode = mode
+        self.inner = inner or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.mode == "replay":
+            cassette = load_cassette(request)
+            if cassette is None:
+                return missing_response(request)
+            if replay_latency():
+                time.sleep(cassette["response"]["latency_ms"] / 1000)
+            return httpx.Response(
+                cassette["response"]["status"], headers=_headers(cassette),
+                stream=_ReplayStream(cassette["response"]["chunks"], cassette["response"]["latency_ms"]),
+                request=request
+            )
+
+        start = time.perf_counter()
+        response = self.inner.handle_request(request)
+        latency = time.perf_counter() - start
+        return httpx.Response(
+            response.status_code, headers=_passthrough_headers(response),
+            stream=_RecordingStream(request, response, start, latency), request=request
+        )
+
+    def close(self):
+        self.inner.close()
+
+
+# === Transport asynchrone (search_server) ===
+
+class _AsyncRecordingStream(httpx.AsyncByteStream):
+    def __init__(self, request, response, start, latency):
+        self.request, self.response, self.start, self.latency = request, response, start, latency
+        self.chunks: list[tuple[float, str]] = []
+        self.saved = False
+
+    async def __aiter__(self):
+        async for text in self.response.aiter_text():
+            self.chunks.append((time.perf_counter() - self.start, text))
+            yield text.encode("utf-8")
+        self.save()
+
+    def save(self):
+        if not self.saved:
+            self.saved = True
+            save_cassette(self.request, self.response, self.latency, self.chunks)
+
+    async def aclose(self):
+        if not self.saved and not self.response.is_stream_consumed:
+            async for text in self.response.aiter_text():
+                self.chunks.append((time.perf_counter() - self.start, text))
+        self.save()
+        await self.response.aclose()
+
+
+class _AsyncReplayStream(httpx.AsyncByteStream):
+    def __init__(self, chunks: list[dict], latency_ms: float):
+        self.chunks, self.latency_ms = chunks, latency_ms
+
+    async def __aiter__(self):
+        elapsed_ms = self.latency_ms
+        for chunk in self.chunks:
+            if replay_latency() and chunk["at_ms"] > elapsed_ms:
+                await asyncio.sleep((chunk["at_ms"] - elapsed_ms) / 1000)
+                elapsed_ms = chunk["at_ms"]
+            yield chunk["data"].encode("utf-8")
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    """Transport asynchrone en mode "record" ou "replay" """
+
+    def __init__(self, mode: str, inner=None):
+        self.mode = mode
+        self.inner = inner or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.mode == "replay":
+            cassette = load_cassette(request)
+            if cassette is None:
+                return missing_response(request)
+            if replay_latency():
+                await asyncio.sleep(cassette["response"]["latency_ms"] / 1000)
+            return httpx.Response(
+                cassette["response"]["status"], headers=_headers(cassette),
+                stream=_AsyncReplayStream(cassette["response"]["chunks"], cassette["response"]["latency_ms"]),
+                request=request
+            )
+
+        start = time.perf_counter()
+        response = await self.inner.handle_async_request(request)
+        latency = time.perf_counter() - start
+        return httpx.Response(
+            response.status_code, headers=_passthrough_headers(response),
+            stream=_AsyncRecordingStream(request, response, start, latency), request=request
+        )
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+# === Fabriques de clients ===
+
+def make_openai_client(**kwargs) -> OpenAI:
+    """Client OpenAI synchrone, branché sur les cassettes si OPENAI_CASSETTE_MODE le demande"""
+    mode = cassette_mode()
+    if mode in ("record", "replay"):
+        print(f"[OPENAI] Mode cassette '{mode}' ({cassette_dir()})")
+        kwargs["http_client"] = httpx.Client(transport=CassetteTransport(mode), timeout=kwargs.pop("timeout", 600))
+        if mode == "replay":
+            kwargs["api_key"] = kwargs.get("api_key") or "replay"
+            kwargs["max_retries"] = 0
+    return OpenAI(**kwargs)
+
+
+def make_async_openai_client(**kwargs) -> AsyncOpenAI:
+    """Client OpenAI asynchrone, branché sur les cassettes si OPENAI_CASSETTE_MODE le demande"""
+    mode = cassette_mode()
+    if mode in ("record", "replay"):
+        print(f"[OPENAI] Mode cassette '{mode}' ({cassette_dir()})")
+        kwargs["http_client"] = httpx.AsyncClient(
+            transport=AsyncCassetteTransport(mode), timeout=kwargs.pop("timeout", 600)
+        )
+        if mode == "replay":
+            kwargs["api_key"] = kwargs.get("api_key") or "replay"
+            kwargs["max_retries"] = 0
+    return AsyncOpenAI(**kwargs)
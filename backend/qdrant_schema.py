@@ -0,0 +1,111 @@
+"""
+Schéma Qdrant partagé par les scripts d'ingestion, le démarrage et le serveur de recherche
+- Layout des collections : "single" (tout dans "chunks", filtré par type)
+  ou "partitioned" (une collection par type de contenu, partitionnée par marque)
+- Index de payload utilisés par les filtres de /search (filtrage fait par Qdrant, pas en Python)
+"""
+
+import os
+
+from qdrant_client.models import Distance, KeywordIndexParams, PayloadSchemaType, VectorParams
+
+VECTOR_SIZE = 1536  # text-embedding-3-small
+
+SINGLE_COLLECTION = "chunks"
+PARTITIONED_COLLECTIONS = {
+    "apartments": "apartments",
+    "knowledge": "knowledge",
+}
+
+# Marques et fichiers de chunks du site correspondant
+BRAND_FILES = {
+    "ecla": "ecla_chunks_classified.jsonl",
+    "uxco": "uxco_chunks.jsonl",
+}
+
+# Index de payload par type de contenu
+PAYLOAD_INDEXES = {
+    "apartments": {
+        "type": PayloadSchemaType.KEYWORD,
+        "city": PayloadSchemaType.KEYWORD,
+        "rooms": PayloadSchemaType.INTEGER,
+        "rent_cc_eur": PayloadSchemaType.FLOAT,
+        "surface_m2": PayloadSchemaType.FLOAT,
+        "furnished": PayloadSchemaType.BOOL,
+    },
+    "knowledge": {
+        "type": PayloadSchemaType.KEYWORD,
+        # Index "tenant" : Qdrant regroupe sur disque les points d'une même marque
+        "brand": KeywordIndexParams(type="keyword", is_tenant=True),
+    },
+}
+
+
+# Lus à l'appel (et non à l'import) : le .env est chargé après les imports
+def qdrant_layout() -> str:
+    return os.getenv("QDRANT_LAYOUT", "single")
+
+
+def is_partitioned() -> bool:
+    return qdrant_layout() == "partitioned"
+
+
+def current_brand() -> str:
+    """Marque servie par ce déploiement"""
+    return os.getenv("BRAND", "ecla")
+
+
+def collection_for(kind: str) -> str:
+    """Collection d'un type de contenu ("apartments" ou "knowledge")"""
+    return PARTITIONED_COLLECTIONS[kind] if is_partitioned() else SINGLE_COLLECTION
+
+
+def all_collections() -> list[str]:
+    """Collections attendues pour le layout courant"""
+    return sorted(set(collection_for(kind) for kind in PARTITIONED_COLLECTIONS))
+
+
+def _indexes_for(collection_name: str) -> dict:
+    indexes = {}
+    for kind in PARTITIONED_COLLECTIONS:
+        if collection_for(kind) == collection_name:
+            indexes.update(PAYLOAD_INDEXES[kind])
+    return indexes
+
+
+def ensure_payload_indexes(client, collection_name: str):
+    """Créer les index de payload (sans effet s'ils existent déjà)"""
+    existing = client.get_collection(collection_name).payload_schema or {}
+    for field, schema in _indexes_for(collection_name).items():
+        if field in existing:
+            continue
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field,
+            field_schema=schema,
+            wait=True
+        )
+        print(f"[INDEX] Index '{field}' créé sur '{collection_name}'")
+
+
+def ensure_collections(client, kinds: list[str]) -> dict[str, str]:
+    """
+    Créer les collections de plusieurs types de contenu si besoin, avec leurs index ; retourne {type: collection}
+    En layout "single", tous les types partagent une collection : ses index ne sont créés qu'une fois
+    """
+    names = {kind: collection_for(kind) for kind in kinds}
+    existing = [c.name for c in client.get_collections().collections]
+    for collection_name in dict.fromkeys(names.values()):
+        if collection_name not in existing:
+            client.create_collection(
+                collection_name=collection_name,
+                vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE),
+            )
+            print(f"[INFO] Collection '{collection_name}' créée (layout {qdrant_layout()})")
+        ensure_payload_indexes(client, collection_name)
+    return names
+
+
+def ensure_collection(client, kind: str) -> str:
+    """Créer la collection d'un type de contenu si besoin, avec ses index ; retourne son nom"""
+    return ensure_collections(client, [kind])[kind]
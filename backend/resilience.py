@@ -0,0 +1,128 @@
+"""
+Mode dégradé du serveur de recherche
+- Deadline par requête : chaque étape lente (intention, embedding, Qdrant, réponse commerciale) reçoit
+  au plus son propre budget, borné par le temps restant avant la deadline
+- Disjoncteurs (circuit breakers) par étape : après plusieurs échecs ou dépassements consécutifs,
+  l'étape est court-circuitée pendant un moment et le serveur passe directement au repli local
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "10"))
+DEADLINE_RESERVE = float(os.getenv("DEADLINE_RESERVE", "0.5"))  # Temps gardé pour le repli et la réponse
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "30"))
+
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+_degraded: ContextVar[Optional[list]] = ContextVar("degraded_stages", default=None)
+
+# Nombre de requêtes servies en mode dégradé, par étape
+degraded_stats: dict[str, int] = {}
+
+
+def start_deadline(seconds: float = REQUEST_DEADLINE):
+    """Démarrer la deadline de la requête en cours"""
+    _deadline.set(time.monotonic() + seconds)
+
+
+def remaining() -> Optional[float]:
+    """Secondes restantes avant la deadline (None hors requête, ex: warm-up)"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def stage_budget(limit: float) -> float:
+    """Budget d'une étape : sa limite propre, réduite au temps restant (moins la réserve)"""
+    left = remaining()
+    if left is None:
+        return limit
+    return max(0.0, min(limit, left - DEADLINE_RESERVE))
+
+
+def track_degraded() -> list:
+    """Nouvelle liste des étapes dégradées pour la requête (ou le calcul partagé) en cours"""
+    stages = []
+    _degraded.set(stages)
+    return stages
+
+
+def mark_degraded(stage: str):
+    """Signaler qu'une étape a été remplacée par son repli local"""
+    stages = _degraded.get()
+    if stages is None or stage not in stages:
+        degraded_stats[stage] = degraded_stats.get(stage, 0) + 1
+    if stages is not None and stage not in stages:
+        stages.append(stage)
+
+
+def is_degraded(stage: str) -> bool:
+    return stage in (_degraded.get() or [])
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur classique : fermé -> ouvert après `failures` échecs consécutifs,
+    puis semi-ouvert après `reset_after` secondes (une seule requête d'essai)
+    """
+
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, reset_after: float = BREAKER_RESET):
+        self.name = name
+        self.failures = failures
+        self.reset_after = reset_after
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.stats = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_after:
+            self.state = "half_open"
+            self.trial_in_flight = False
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        self.stats["rejected"] += 1
+        return False
+
+    def record_success(self):
+        self.stats["successes"] += 1
+        self.consecutive_failures = 0
+        self.trial_in_flight = False
+        self.state = "closed"
+
+    def record_failure(self):
+        self.stats["failures"] += 1
+        self.consecutive_failures += 1
+        self.trial_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failures:
+            if self.state != "open":
+                self.stats["opened"] += 1
+                print(f"[BREAKER] '{self.name}' ouvert pour {self.reset_after}s")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """Essai abandonné sans verdict (ex: requête refusée par le régulateur)"""
+        self.trial_in_flight = False
+
+    @contextmanager
+    def guard(self):
+        """
+        Appel admis par allow() : une sortie sans verdict (tâche annulée, client déconnecté,
+        générateur de streaming fermé) libère l'essai semi-ouvert au lieu de le bloquer indéfiniment
+        """
+        try:
+            yield
+        except BaseException:
+            self.release()
+            raise
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "state": self.state, "consecutive_failures": self.consecutive_failures}
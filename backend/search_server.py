@@ -1,12 +1,32 @@
-﻿from fastapi import FastAPI, Query, Body
+﻿from fastapi import FastAPI, Query, Body, Response, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
 import os
 import json
-from openai import OpenAI
+import asyncio
+import secrets
+import time
 from dotenv import load_dotenv
-from qdrant_client import QdrantClient
-from qdrant_client.models import Filter, FieldCondition, MatchValue
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import Filter, FieldCondition, MatchValue, MatchAny, Range, ScoredPoint, QueryRequest as QdrantQueryRequest
+from embedding_cache import EmbeddingCache, normalize_query
+from llm_cache import CompletionCache, fingerprint
+from semantic_cache import SemanticCache
+from session_store import SessionStore, new_session
+from single_flight import SingleFlight
+from resilience import CircuitBreaker, degraded_stats, is_degraded, mark_degraded, stage_budget, start_deadline, track_degraded
+from governor import PRIORITY_FREE_TEXT, PRIORITY_QUICK_REPLY, Governor, Saturated, request_priority
+from hedging import Hedger
+from openai_transport import cassette_mode, make_async_openai_client
+from metrics import current_timings, instrument, model_call, register_stats, share_timings, stage
+from context_packer import pack_chunks, render_chunk, count_tokens, count_message_tokens
+from fast_intent import parse_intent, FAST_INTENT_MIN_CONFIDENCE
+from catalog_index import ApartmentCatalog, claim_snapshot_build, release_snapshot_build, snapshot_generation
+from local_cache import CACHE_DIR
+from lexical_index import LEXICAL_SKIP_CONFIDENCE, index_path, load_brand_index, reciprocal_rank_fusion
+from apartment_cards import card_from_payload
+from qdrant_schema import VECTOR_SIZE, all_collections, collection_for, current_brand
 
 # Tentative de chargement du .env, ignore les erreurs d'encodage
 try:
@@ -14,33 +34,44 @@ try:
 except UnicodeDecodeError:
     print("Attention: Problème d'encodage du fichier .env, utilisation des variables d'environnement système")
 
-COLLECTION_NAME = "chunks"
-
 # Configuration OpenAI sécurisée
 openai_api_key = os.getenv("OPENAI_API_KEY")
-if not openai_api_key:
+if not openai_api_key and cassette_mode() != "replay":
     raise ValueError(
         " OPENAI_API_KEY non trouvée!\n"
         "   â†’ Vérifier que backend/.env contient: OPENAI_API_KEY=votre-cle\n"
         "   â†’ Pour Railway: configurer la variable dans le Dashboard"
     )
 
-openai_client = OpenAI(api_key=openai_api_key)
+# Clients asynchrones : le handler /search n'occupe plus un thread du pool pendant les appels GPT
+# Peu de retries : sous charge, les 429 sont gérés par le régulateur plutôt que par des attentes en série
+openai_client = make_async_openai_client(api_key=openai_api_key, max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "1")))
+
+# Régulateur des appels OpenAI : appels simultanés et tokens par minute par modèle, file bornée
+governor = Governor()
+
+# Appels doublés quand la réponse tarde (opt-in, HEDGE_ENABLED) ; chaque essai passe par le régulateur
+hedger = Hedger()
 
 # Configuration Qdrant adaptable (local vs cloud)
 qdrant_url = os.getenv("QDRANT_URL")
 qdrant_api_key = os.getenv("QDRANT_API_KEY")
+qdrant_path = os.getenv("QDRANT_PATH")
 
 if qdrant_url:
     # Mode Cloud (Railway, production)
     print(f"ðŸŒ Connexion à  Qdrant Cloud: {qdrant_url}")
-    qdrant = QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
+    qdrant = AsyncQdrantClient(url=qdrant_url, api_key=qdrant_api_key)
+elif qdrant_path:
+    # Mode embarqué, sans serveur Qdrant (benchmarks, tests hors ligne)
+    print(f"[INFO] Qdrant embarqué: {qdrant_path}")
+    qdrant = AsyncQdrantClient(path=qdrant_path)
 else:
     # Mode Local (développement)
     qdrant_host = os.getenv("QDRANT_HOST", "localhost")
     qdrant_port = int(os.getenv("QDRANT_PORT", "6333"))
     print(f"ðŸ  Connexion à  Qdrant Local: {qdrant_host}:{qdrant_port}")
-    qdrant = QdrantClient(host=qdrant_host, port=qdrant_port)
+    qdrant = AsyncQdrantClient(host=qdrant_host, port=qdrant_port)
 
 app = FastAPI()
 
@@ -53,6 +84,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Durée de chaque étape : en-tête Server-Timing + /metrics (Prometheus)
+instrument(app, "search")
+
 class SearchCriteria(BaseModel):
     """Critères de recherche extraits de la query"""
     max_budget: int | None = None
@@ -70,17 +104,204 @@ class IntentAnalysis(BaseModel):
     criteria: SearchCriteria
     reasoning: str  # Pour debug
 
+# Cache des complétions GPT : un état de conversation identique ne repasse pas par le modèle
+completion_cache = CompletionCache()
+
+async def chat_completion(site: str, messages: list[dict], model: str = "gpt-4", temperature: float = 0.0,
+                          max_tokens: int | None = None, history: list[dict] | None = None,
+                          chunks: list[dict] | None = None, validate=None, tool: dict | None = None) -> str:
+    """
+    Appel GPT avec cache persistant
+    `validate` permet de ne pas mettre en cache une réponse inexploitable (ex: JSON invalide)
+    `tool` : fonction que le modèle doit appeler (sortie structurée) ; ses arguments JSON sont renvoyés
+    """
+    params = {"temperature": temperature, "max_tokens": max_tokens}
+    if tool is not None:
+        params["tool"] = tool["function"]["name"]
+    key = completion_cache.key(site, model, messages, params, history=history, chunks=chunks)
+    cached = completion_cache.get(site, key)
+    if cached is not None:
+        print(f"[LLM-CACHE] Hit ({site})")
+        return cached
+
+    tool_params = {}
+    if tool is not None:
+        tool_params = {"tools": [tool], "tool_choice": {"type": "function", "function": {"name": tool["function"]["name"]}}}
+    async def call():
+        async with governor.slot(model, cost=count_message_tokens(messages) + (max_tokens or 0)):
+            with model_call(site, model):
+                return await openai_client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    **tool_params
+                )
+
+    response = await hedger.run(site, model, call)
+    message = response.choices[0].message
+    if tool is not None and message.tool_calls:
+        text = message.tool_calls[0].function.arguments.strip()
+    else:
+        text = (message.content or "").strip()
+
+    if validate is None or validate(text):
+        completion_cache.set(site, key, text)
+    return text
+
+async def stream_chat_completion(site: str, messages: list[dict], model: str = "gpt-4", temperature: float = 0.0,
+                                 max_tokens: int | None = None, history: list[dict] | None = None,
+                                 chunks: list[dict] | None = None):
+    """
+    Variante streaming de chat_completion : génère les tokens au fil de l'eau
+    Une réponse en cache est renvoyée d'un bloc, une réponse complète est mise en cache à la fin du stream
+    """
+    params = {"temperature": temperature, "max_tokens": max_tokens}
+    key = completion_cache.key(site, model, messages, params, history=history, chunks=chunks)
+    cached = completion_cache.get(site, key)
+    if cached is not None:
+        print(f"[LLM-CACHE] Hit ({site})")
+        yield cached
+        return
+
+    async with governor.slot(model, cost=count_message_tokens(messages) + (max_tokens or 0)):
+        with model_call(site, model):
+            stream = await openai_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True
+            )
+            parts = []
+            async for event in stream:
+                if not event.choices:
+                    continue
+                token = event.choices[0].delta.content
+                if token:
+                    parts.append(token)
+                    yield token
+
+    text = "".join(parts).strip()
+    if text:
+        completion_cache.set(site, key, text)
+
+# Modèles de l'agent d'intention : un modèle rapide par défaut, le plus gros seulement en cas d'échec
+INTENT_MODEL = os.getenv("INTENT_MODEL", "gpt-4o-mini")
+INTENT_ESCALATION_MODEL = os.getenv("INTENT_ESCALATION_MODEL", "gpt-4")
+INTENT_MIN_CONFIDENCE = float(os.getenv("INTENT_MIN_CONFIDENCE", "0.6"))
+COMMERCIAL_MODEL = os.getenv("COMMERCIAL_MODEL", "gpt-4")
+
+# Budgets des étapes lentes (secondes), bornés par le temps restant avant la deadline de la requête
+INTENT_TIMEOUT = float(os.getenv("INTENT_TIMEOUT", "4"))
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "3"))
+COMMERCIAL_TIMEOUT = float(os.getenv("COMMERCIAL_TIMEOUT", "6"))
+QDRANT_TIMEOUT = float(os.getenv("QDRANT_TIMEOUT", "2"))
+
+# Disjoncteurs des étapes GPT et de Qdrant : après plusieurs échecs ou dépassements, repli local immédiat
+intent_breaker = CircuitBreaker("intent")
+commercial_breaker = CircuitBreaker("commercial")
+qdrant_breaker = CircuitBreaker("qdrant")
+
+_NULLABLE_NUMBER = {"type": ["number", "null"]}
+_NULLABLE_INTEGER = {"type": ["integer", "null"]}
+
+INTENT_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "extract_search_intent",
+        "description": "Enregistrer l'intention de l'utilisateur et les critères de recherche extraits de la conversation",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "is_apartment_search": {"type": "boolean"},
+                "criteria": {
+                    "type": "object",
+                    "properties": {
+                        "max_budget": _NULLABLE_INTEGER,
+                        "min_budget": _NULLABLE_INTEGER,
+                        "city": {"type": ["string", "null"]},
+                        "furnished": {"type": ["boolean", "null"]},
+                        "min_surface": _NULLABLE_NUMBER,
+                        "max_surface": _NULLABLE_NUMBER,
+                        "rooms": _NULLABLE_INTEGER,
+                        "max_results": _NULLABLE_INTEGER,
+                    },
+                    "required": ["max_budget", "min_budget", "city", "furnished", "min_surface", "max_surface",
+                                 "rooms", "max_results"],
+                    "additionalProperties": False,
+                },
+                "reasoning": {"type": "string"},
+                "confidence": {"type": "number", "description": "Confiance dans l'analyse, entre 0 et 1"},
+            },
+            "required": ["is_apartment_search", "criteria", "reasoning", "confidence"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+class IntentExtraction(IntentAnalysis):
+    """Arguments de l'appel de fonction de l'agent d'intention (validés avant usage)"""
+    confidence: float = Field(ge=0, le=1)
+
+def _is_valid_intent(text: str) -> bool:
+    try:
+        IntentExtraction.model_validate_json(text)
+        return True
+    except ValidationError:
+        return False
+
 class QueryRequest(BaseModel):
     query: str
     type: str | None = None
     summarize: bool = False
     conversation_history: list[dict] | None = None  # Format: [{"role": "user", "content": "..."}, ...]
+    session_id: str | None = None  # Session serveur : critères accumulés + historique compact
+    resume_session: bool = False  # Session déjà établie : le client n'envoie plus conversation_history
+    compact: bool = False  # Cards allégées : sans "content" ni "score"
+    retrieval: str | None = None  # "dense" ou "hybrid" (BM25 + vecteurs) ; défaut : RETRIEVAL_MODE
+
+# Compteurs du chemin rapide (analyse locale) vs agent GPT, et des escalades vers le gros modèle
+intent_stats = {"fast_path": 0, "llm": 0, "calls_by_model": {}, "escalations": {"invalid": 0, "low_confidence": 0, "error": 0}}
+
+def intent_from_json(result_json: dict) -> IntentAnalysis:
+    """Construire IntentAnalysis à partir du JSON de l'agent GPT (ou de l'analyse locale)"""
+    criteria = SearchCriteria(
+        max_budget=result_json["criteria"].get("max_budget"),
+        min_budget=result_json["criteria"].get("min_budget"),
+        city=result_json["criteria"].get("city"),
+        furnished=result_json["criteria"].get("furnished"),
+        min_surface=result_json["criteria"].get("min_surface"),
+        max_surface=result_json["criteria"].get("max_surface"),
+        rooms=result_json["criteria"].get("rooms"),
+        max_results=result_json["criteria"].get("max_results")
+    )
 
-def analyze_user_intent(query: str, conversation_history: list[dict] | None = None) -> IntentAnalysis:
+    return IntentAnalysis(
+        is_apartment_search=result_json["is_apartment_search"],
+        criteria=criteria,
+        reasoning=result_json.get("reasoning", "")
+    )
+
+async def analyze_user_intent(query: str, conversation_history: list[dict] | None = None,
+                              session: dict | None = None) -> IntentAnalysis:
     """
     Agent GPT qui analyse l'intention utilisateur et extrait les critères structurés
     EN TENANT COMPTE DE L'HISTORIQUE DE CONVERSATION
+    Avec une session serveur déjà entamée, seuls la nouvelle question et les critères courants sont analysés
+    Les quick replies et requêtes simples sont analysées localement, sans appel GPT
     """
+    known_criteria = session["criteria"] if session and session["turns"] else None
+    if known_criteria is not None:
+        conversation_history = None
+    fast_result = parse_intent(query, conversation_history, base_criteria=known_criteria)
+    if fast_result is not None and fast_result["confidence"] >= FAST_INTENT_MIN_CONFIDENCE:
+        intent_stats["fast_path"] += 1
+        intent = intent_from_json(fast_result)
+        print(f"[FAST-INTENT] Intent: {intent.is_apartment_search}, Criteres: {intent.criteria}")
+        return intent
+
+    intent_stats["llm"] += 1
     system_prompt = """Tu es un agent d'analyse de requàªtes pour une plateforme de logement étudiant.
 
 Ta mission : analyser TOUTE LA CONVERSATION (pas juste la dernière question) et déterminer :
@@ -106,88 +327,168 @@ EXEMPLES :
 ✅… "j'ai besoin de trouver un toit à  moins de 500 euros à  paris" â†’ is_apartment_search: true, max_budget: 500, city: "Paris"
 ✅… Historique: "Archamps", puis "t1 et 600â‚¬" â†’ is_apartment_search: true, rooms: 1, max_budget: 600, city: "Archamps"
 
-Réponds UNIQUEMENT en JSON valide (pas de markdown) :
-{
-  "is_apartment_search": true/false,
-  "criteria": {
-    "max_budget": null ou nombre,
-    "min_budget": null ou nombre,
-    "city": null ou "Paris"/"Lyon"/etc,
-    "furnished": null ou true/false,
-    "min_surface": null ou nombre,
-    "max_surface": null ou nombre,
-    "rooms": null ou nombre (1=studio),
-    "max_results": null ou nombre (si l'utilisateur précise combien d'appartements il veut voir)
-  },
-  "reasoning": "Courte explication de ton analyse"
-}"""
+Réponds UNIQUEMENT en appelant la fonction extract_search_intent :
+- criteria : null pour chaque critère non mentionné, rooms=1 pour un studio
+- max_results : seulement si l'utilisateur précise combien d'appartements il veut voir
+- reasoning : courte explication de ton analyse
+- confidence : entre 0 et 1, basse si la demande est ambiguë ou si tu as dû deviner des critères"""
 
-    try:
-        # Construire les messages avec l'historique
-        messages = [{"role": "system", "content": system_prompt}]
-
-        # Ajouter l'historique si disponible
-        if conversation_history:
-            for msg in conversation_history[-6:]:  # Garder les 6 derniers messages
-                messages.append({"role": msg["role"], "content": msg["content"]})
-
-        # Ajouter la question actuelle
-        messages.append({"role": "user", "content": f"Question actuelle : {query}"})
-
-        response = openai_client.chat.completions.create(
-            model="gpt-4",
-            messages=messages,
-            temperature=0.0,  # Déterministe
-            max_tokens=300
-        )
+    # Construire les messages avec l'historique
+    messages = [{"role": "system", "content": system_prompt}]
 
-        result_text = response.choices[0].message.content.strip()
-        print(f"[GPT-AGENT] Analyse brute: {result_text}")
-
-        # Parser le JSON
-        result_json = json.loads(result_text)
-
-        # Construire IntentAnalysis
-        criteria = SearchCriteria(
-            max_budget=result_json["criteria"].get("max_budget"),
-            min_budget=result_json["criteria"].get("min_budget"),
-            city=result_json["criteria"].get("city"),
-            furnished=result_json["criteria"].get("furnished"),
-            min_surface=result_json["criteria"].get("min_surface"),
-            max_surface=result_json["criteria"].get("max_surface"),
-            rooms=result_json["criteria"].get("rooms"),
-            max_results=result_json["criteria"].get("max_results")
-        )
+    # Ajouter l'historique si disponible
+    recent_history = (conversation_history or [])[-6:]  # Garder les 6 derniers messages
+    for msg in recent_history:
+        messages.append({"role": msg["role"], "content": msg["content"]})
 
-        intent = IntentAnalysis(
-            is_apartment_search=result_json["is_apartment_search"],
-            criteria=criteria,
-            reasoning=result_json.get("reasoning", "")
-        )
+    # Session serveur : les critères déjà extraits remplacent l'historique
+    if known_criteria is not None:
+        messages.append({"role": "user", "content": session_context(session)})
 
-        print(f"[GPT-AGENT] Intent: {intent.is_apartment_search}, Criteres: {criteria}")
-        return intent
+    # Ajouter la question actuelle
+    messages.append({"role": "user", "content": f"Question actuelle : {query}"})
 
-    except Exception as e:
-        print(f"[ERROR] Erreur analyse GPT: {e}")
-        # Fallback : considérer que ce n'est pas une recherche d'appartement
-        return IntentAnalysis(
-            is_apartment_search=False,
-            criteria=SearchCriteria(),
-            reasoning=f"Erreur parsing: {e}"
-        )
-
-def embed(text):
-    response = openai_client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text
+    if not intent_breaker.allow():
+        return degraded_intent(query, fast_result, session, "disjoncteur ouvert")
+    # Régulateur saturé (503) ou requête annulée : l'essai est libéré sans verdict
+    with intent_breaker.guard():
+        try:
+            best = await asyncio.wait_for(llm_intent(messages, recent_history), timeout=stage_budget(INTENT_TIMEOUT))
+        except asyncio.TimeoutError:
+            intent_breaker.record_failure()
+            return degraded_intent(query, fast_result, session, "délai dépassé")
+    if best is None:
+        intent_breaker.record_failure()
+        return degraded_intent(query, fast_result, session, "erreur GPT")
+    intent_breaker.record_success()
+
+    intent = IntentAnalysis(**best.model_dump(exclude={"confidence"}))
+    print(f"[GPT-AGENT] Intent: {intent.is_apartment_search}, Criteres: {intent.criteria}")
+    return intent
+
+async def llm_intent(messages: list[dict], recent_history: list[dict]) -> IntentExtraction | None:
+    """Appels à l'agent GPT : modèle rapide d'abord, escalade si la sortie est invalide ou peu sûre"""
+    models = list(dict.fromkeys([INTENT_MODEL, INTENT_ESCALATION_MODEL]))
+    best = None
+    error = None
+    for i, model in enumerate(models):
+        intent_stats["calls_by_model"][model] = intent_stats["calls_by_model"].get(model, 0) + 1
+        try:
+            with stage("intent_llm"):
+                result_text = await chat_completion(
+                    "intent",
+                    messages,
+                    model=model,
+                    temperature=0.0,  # Déterministe
+                    max_tokens=300,
+                    history=recent_history,
+                    validate=_is_valid_intent,
+                    tool=INTENT_TOOL
+                )
+            print(f"[GPT-AGENT] Analyse brute ({model}): {result_text}")
+            extraction = IntentExtraction.model_validate_json(result_text)
+        except Saturated:
+            raise
+        except ValidationError as e:
+            reason, error = "invalid", e
+            print(f"[WARNING] Sortie invalide de {model}: {e.error_count()} erreur(s)")
+        except Exception as e:
+            reason, error = "error", e
+            print(f"[ERROR] Erreur analyse GPT ({model}): {e}")
+        else:
+            if best is None or extraction.confidence > best.confidence:
+                best = extraction
+            if extraction.confidence >= INTENT_MIN_CONFIDENCE:
+                break
+            reason = "low_confidence"
+            print(f"[GPT-AGENT] Confiance faible ({extraction.confidence}) avec {model}")
+        if i + 1 < len(models):
+            intent_stats["escalations"][reason] += 1
+            print(f"[GPT-AGENT] Escalade vers {models[i + 1]} ({reason})")
+
+    if best is None:
+        print(f"[ERROR] Erreur analyse GPT: {error}")
+    return best
+
+def degraded_intent(query: str, fast_result: dict | None, session: dict | None, reason: str) -> IntentAnalysis:
+    """
+    Repli sans GPT : analyse locale même peu sûre, sinon critères déjà connus de la session,
+    sinon question générale
+    """
+    mark_degraded("intent")
+    print(f"[DEGRADED] Intention analysée localement ({reason}): {query}")
+    if fast_result is not None:
+        intent = intent_from_json(fast_result)
+    elif session and session["turns"]:
+        intent = IntentAnalysis(is_apartment_search=session["is_apartment_search"],
+                                criteria=SearchCriteria(**session["criteria"]), reasoning="")
+    else:
+        intent = IntentAnalysis(is_apartment_search=False, criteria=SearchCriteria(), reasoning="")
+    intent.reasoning = f"Mode dégradé ({reason})"
+    return intent
+
+def session_context(session: dict) -> str:
+    """Résumé de la session pour l'agent d'intention (remplace les messages précédents)"""
+    criteria = {k: v for k, v in session["criteria"].items() if v is not None}
+    search = "oui" if session["is_apartment_search"] else "non"
+    return (
+        f"Critères déjà extraits de la conversation : {json.dumps(criteria, ensure_ascii=False)}\n"
+        f"Recherche d'appartement en cours : {search}\n"
+        "Conserve ces critères sauf si la question actuelle les modifie."
     )
-    return response.data[0].embedding
 
-def generate_commercial_response(chunks, query, conversation_history=None):
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Cache des embeddings : les quick replies ("flexible", "Paris", "Tous"...) reviennent sans cesse
+embedding_cache = EmbeddingCache()
+
+async def embed(text):
+    cached = embedding_cache.get(EMBEDDING_MODEL, text)
+    if cached is not None:
+        return cached
+
+    async def call():
+        async with governor.slot(EMBEDDING_MODEL, cost=count_tokens(text)):
+            return await openai_client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=text
+            )
+
+    with stage("embedding"):
+        response = await hedger.run("embedding", EMBEDDING_MODEL, call)
+    vector = response.data[0].embedding
+    embedding_cache.set(EMBEDDING_MODEL, text, vector)
+    return vector
+
+async def embed_within_budget(text: str) -> list[float] | None:
+    """Embedding borné par la deadline ; None si indisponible (recherche sans similarité vectorielle)"""
+    try:
+        return await asyncio.wait_for(embed(text), timeout=stage_budget(EMBEDDING_TIMEOUT))
+    except Saturated:
+        raise
+    except Exception as e:
+        print(f"[DEGRADED] Embedding indisponible: {e!r}")
+        mark_degraded("embedding")
+        return None
+
+async def embed_many(texts: list[str]) -> list[list[float]]:
+    """Embeddings de plusieurs textes, les absents du cache en un seul appel"""
+    vectors = {text: embedding_cache.get(EMBEDDING_MODEL, text) for text in texts}
+    missing = [text for text, vector in vectors.items() if vector is None]
+    if missing:
+        async with governor.slot(EMBEDDING_MODEL, cost=sum(count_tokens(text) for text in missing)):
+            with stage("embedding"):
+                response = await openai_client.embeddings.create(model=EMBEDDING_MODEL, input=missing)
+        for text, item in zip(missing, response.data):
+            vectors[text] = item.embedding
+            embedding_cache.set(EMBEDDING_MODEL, text, item.embedding)
+    return [vectors[text] for text in texts]
+
+def build_commercial_prompt(chunks, query, conversation_history=None):
     """
     Agent commercial IA qui accompagne l'utilisateur comme un vrai conseiller
     ET qui sait collaborer avec le système d'affichage d'appartements
+    Retourne les messages à envoyer au modèle et le max_tokens adapté
     """
     has_apartments = any(c.get('type') == 'appartement' for c in chunks)
 
@@ -346,7 +647,7 @@ RàˆGLES :
             prompt = f"""{conversation_context}Question : {query}
 
 Informations disponibles :
-{chr(10).join([f"- {c['content'][:200]}" for c in chunks])}
+{chr(10).join([render_chunk(c) for c in chunks])}
 
 Réponds de manière claire et structurée (2-3 paragraphes max).
 TERMINE par une question pour affiner sa recherche : "Quelle ville vous intéresse ? Quel est votre budget maximum ?" """
@@ -355,26 +656,164 @@ TERMINE par une question pour affiner sa recherche : "Quelle ville vous intéres
             prompt = f"""{conversation_context}Question : {query}
 
 Informations disponibles :
-{chr(10).join([f"- {c['content'][:200]}" for c in chunks])}
+{chr(10).join([render_chunk(c) for c in chunks])}
 
 Réponds de manière claire et structurée (2-3 paragraphes max).
 TERMINE par une proposition d'aide : "Puis-je vous aider à  trouver un logement ?" """
 
         max_tokens = 400
 
-    response = openai_client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.7,  # Plus créatif pour l'agent commercial
-        max_tokens=max_tokens
-    )
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ]
+    return messages, max_tokens
+
+# Taille des prompts de l'agent commercial avant / après sélection du contexte
+context_stats = {"prompts": 0, "tokens_before": 0, "tokens_after": 0}
+
+def build_packed_commercial_prompt(chunks, query, conversation_history=None):
+    """
+    Prompt de l'agent commercial avec un contexte dédoublonné, varié et limité à CONTEXT_TOKEN_BUDGET tokens
+    Retourne les messages, le max_tokens et les chunks retenus
+    """
+    # En mode appartements le prompt ne cite pas les chunks (seulement leur nombre) : rien à sélectionner
+    if not any(c.get('type') == 'appartement' for c in chunks):
+        packed = pack_chunks(chunks)
+    else:
+        packed = chunks
+    messages, max_tokens = build_commercial_prompt(packed, query, conversation_history)
+
+    tokens_after = count_message_tokens(messages)
+    dropped = [c for c in chunks if not any(c is p for p in packed)]
+    tokens_before = tokens_after + sum(count_tokens(render_chunk(c)) + 1 for c in dropped)
+    context_stats["prompts"] += 1
+    context_stats["tokens_before"] += tokens_before
+    context_stats["tokens_after"] += tokens_after
+    print(f"[CONTEXT] {len(packed)}/{len(chunks)} chunks retenus, prompt {tokens_before} -> {tokens_after} tokens")
+    return messages, max_tokens, packed
+
+async def generate_commercial_response(chunks, query, conversation_history=None):
+    """Réponse complète de l'agent commercial"""
+    messages, max_tokens, chunks = build_packed_commercial_prompt(chunks, query, conversation_history)
+    with stage("commercial_llm"):
+        return await chat_completion(
+            "commercial",
+            messages,
+            model=COMMERCIAL_MODEL,
+            temperature=0.7,  # Plus créatif pour l'agent commercial
+            max_tokens=max_tokens,
+            history=(conversation_history or [])[-4:],
+            chunks=chunks
+        )
 
-    return response.choices[0].message.content.strip()
+async def stream_commercial_response(chunks, query, conversation_history=None):
+    """Réponse de l'agent commercial, token par token"""
+    messages, max_tokens, chunks = build_packed_commercial_prompt(chunks, query, conversation_history)
+    # Durée jusqu'au dernier token
+    with stage("commercial_llm"):
+        async for token in stream_chat_completion(
+            "commercial",
+            messages,
+            model=COMMERCIAL_MODEL,
+            temperature=0.7,
+            max_tokens=max_tokens,
+            history=(conversation_history or [])[-4:],
+            chunks=chunks
+        ):
+            yield token
+
+DEGRADED_EXCERPT_CHARS = 600
+
+def templated_answer(chunks: list[dict], apartments: list[dict], payload: dict) -> str:
+    """Réponse déterministe (mode dégradé, sans GPT) construite à partir des cards et des chunks"""
+    if payload.get("quick_replies"):
+        cities = sorted({apt["city"] for apt in apartments if apt.get("city")})
+        return f"Nous avons des logements disponibles à {', '.join(cities)}. Quelle ville vous intéresse ?"
+    if apartments:
+        cities = sorted({apt["city"] for apt in apartments if apt.get("city")})
+        rents = sorted(round(apt["rent_cc_eur"]) for apt in apartments if apt.get("rent_cc_eur"))
+        plural = "s" if len(apartments) > 1 else ""
+        answer = f"Voici {len(apartments)} logement{plural} disponible{plural}"
+        if cities:
+            answer += f" à {', '.join(cities)}"
+        if rents and rents[0] != rents[-1]:
+            answer += f", de {rents[0]}€ à {rents[-1]}€ charges comprises"
+        elif rents:
+            answer += f", à {rents[0]}€ charges comprises"
+        return answer + ". Tous les détails sont sur les fiches ci-dessous."
+    knowledge = [c for c in chunks if c.get("type") != "appartement" and c.get("content")]
+    if knowledge:
+        excerpt = knowledge[0]["content"].strip()
+        if len(excerpt) > DEGRADED_EXCERPT_CHARS:
+            excerpt = excerpt[:DEGRADED_EXCERPT_CHARS].rsplit(" ", 1)[0] + "…"
+        answer = f"Voici ce que j'ai trouvé :\n\n{excerpt}"
+        url = knowledge[0].get("url")
+        if url and url.startswith("http"):
+            answer += f"\n\nPlus d'informations : {url}"
+        return answer
+    return "Je ne peux pas répondre précisément pour le moment. Pouvez-vous réessayer dans quelques instants ?"
+
+async def commercial_answer(chunks, apartments, payload, query, conversation_history=None) -> str:
+    """Réponse de l'agent commercial dans le budget de la requête, sinon réponse type"""
+    if commercial_breaker.allow():
+        with commercial_breaker.guard():
+            try:
+                answer = await asyncio.wait_for(
+                    generate_commercial_response(chunks, query, conversation_history),
+                    timeout=stage_budget(COMMERCIAL_TIMEOUT)
+                )
+            except Saturated:
+                # Résultats déjà prêts : mieux vaut une réponse type qu'un 503
+                commercial_breaker.release()
+                print("[DEGRADED] Agent commercial saturé")
+            except Exception as e:
+                commercial_breaker.record_failure()
+                print(f"[DEGRADED] Agent commercial indisponible: {e!r}")
+            else:
+                commercial_breaker.record_success()
+                return answer
+    mark_degraded("commercial")
+    return templated_answer(chunks, apartments, payload)
 
-def summarize_chunks(chunks, query):
+async def stream_commercial_answer(chunks, apartments, payload, query, conversation_history=None):
+    """
+    Variante streaming : chaque token doit arriver avant la fin du budget de l'étape
+    Sans aucun token la réponse type est envoyée ; une réponse coupée en cours de route est terminée par "…"
+    """
+    if not commercial_breaker.allow():
+        mark_degraded("commercial")
+        yield templated_answer(chunks, apartments, payload)
+        return
+
+    ends_at = time.monotonic() + stage_budget(COMMERCIAL_TIMEOUT)
+    tokens = stream_commercial_response(chunks, query, conversation_history)
+    emitted = False
+    # Client déconnecté (GeneratorExit) ou requête annulée : l'essai est libéré sans verdict
+    with commercial_breaker.guard():
+        try:
+            while True:
+                try:
+                    token = await asyncio.wait_for(anext(tokens), timeout=max(0.0, ends_at - time.monotonic()))
+                except StopAsyncIteration:
+                    break
+                emitted = True
+                yield token
+        except Saturated:
+            commercial_breaker.release()
+            print("[DEGRADED] Agent commercial saturé")
+        except Exception as e:
+            commercial_breaker.record_failure()
+            print(f"[DEGRADED] Agent commercial indisponible: {e!r}")
+        else:
+            commercial_breaker.record_success()
+            return
+        finally:
+            await tokens.aclose()
+    mark_degraded("commercial")
+    yield "…" if emitted else templated_answer(chunks, apartments, payload)
+
+async def summarize_chunks(chunks, query):
     # Détecter si ce sont des appartements ou des infos générales
     has_apartments = any(c.get('type') == 'appartement' for c in chunks)
 
@@ -424,411 +863,1024 @@ Réponds de manière claire, complète et structurée. Tu peux utiliser 2-3 para
 """
         max_tokens = 400
 
-    response = openai_client.chat.completions.create(
-        model="gpt-4",
-        messages=[
+    return await chat_completion(
+        "summary",
+        [
             {"role": "system", "content": "Tu es un conseiller en logement expert. Tu promeus UNIQUEMENT nos propres services, JAMAIS la concurrence."},
             {"role": "user", "content": prompt}
         ],
         temperature=0.3,
-        max_tokens=max_tokens
+        max_tokens=max_tokens,
+        chunks=chunks
     )
 
-    return response.choices[0].message.content.strip()
-
 @app.get("/")
 def root():
     return {"status": "ok", "message": "API is running"}
 
-@app.post("/search")
-def search(req: QueryRequest):
+@app.get("/intent/stats")
+def intent_stats_endpoint():
+    """Part des requêtes analysées localement (chemin rapide) vs par GPT, et taux d'escalade"""
+    total = intent_stats["fast_path"] + intent_stats["llm"]
+    escalations = sum(intent_stats["escalations"].values())
+    return {
+        **intent_stats,
+        "fast_path_rate": round(intent_stats["fast_path"] / total, 3) if total else 0.0,
+        "escalation_rate": round(escalations / intent_stats["llm"], 3) if intent_stats["llm"] else 0.0
+    }
+
+@app.get("/retrieval/stats")
+def retrieval_stats_endpoint():
+    """Taux d'utilisation de la recherche élargie (fallback) et de l'index lexical"""
+    searches = retrieval_stats["apartment_searches"]
+    index = lexical_state["index"]
+    return {
+        **retrieval_stats,
+        "fallback_rate": round(retrieval_stats["fallback_used"] / searches, 3) if searches else 0.0,
+        "retrieval_mode": RETRIEVAL_MODE,
+        "lexical_index_chunks": len(index) if index is not None else 0
+    }
+
+@app.get("/context/stats")
+def context_stats_endpoint():
+    """Tokens moyens du prompt de l'agent commercial avant / après sélection du contexte"""
+    prompts = context_stats["prompts"]
+    return {
+        **context_stats,
+        "avg_tokens_before": round(context_stats["tokens_before"] / prompts, 1) if prompts else 0.0,
+        "avg_tokens_after": round(context_stats["tokens_after"] / prompts, 1) if prompts else 0.0,
+        "reduction": round(1 - context_stats["tokens_after"] / context_stats["tokens_before"], 3) if prompts else 0.0
+    }
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Statistiques des caches (hits/misses)"""
+    return {
+        "embeddings": embedding_cache.get_stats(),
+        "completions": completion_cache.get_stats(),
+        "responses": semantic_cache.get_stats()
+    }
+# Zones géographiques : une zone regroupe plusieurs villes/résidences
+ZONE_MAPPING = {
+    "Paris": ["Massy-Palaiseau", "Villejuif", "Noisy-le-Grand"],
+    "Genève": ["Archamps"],
+    "Lille": ["Lille"],
+    "Bordeaux": ["Bordeaux"]
+}
+
+# Catalogue des appartements en mémoire : les recherches d'appartements n'ont pas besoin de Qdrant
+apartment_catalog = ApartmentCatalog(ZONE_MAPPING)
+
+# Instantané du catalogue partagé par les workers du nœud (voir catalog_index.py)
+CATALOG_SNAPSHOT_DIR = os.path.join(CACHE_DIR, "catalog")
+CATALOG_BUILD_WAIT = float(os.getenv("CATALOG_BUILD_WAIT", "30"))  # Attente de l'instantané construit par un autre worker
+CATALOG_REFRESH_INTERVAL = float(os.getenv("CATALOG_REFRESH_INTERVAL", "5"))
+catalog_sync = {"checked_at": 0.0, "reloads": 0}
+
+# Recherche hybride : index lexical BM25 de la marque servie (voir lexical_index.py) fusionné avec Qdrant
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+lexical_state = {"index": None, "mtime": None}
+
+def load_lexical_index():
+    """Charger l'index lexical écrit à l'ingestion (reconstruit depuis le JSONL s'il manque)"""
     try:
-        print(f"[SEARCH] Recherche recue: {req.query}")
+        brand = current_brand()
+        index = load_brand_index(brand)
+        lexical_state.update(index=index, mtime=os.path.getmtime(index_path(brand)))
+        print(f"[LEXICAL] Index BM25 '{brand}' : {len(index)} chunks")
+    except Exception as e:
+        print(f"[WARNING] Index lexical non chargé, recherche vectorielle seule: {e}")
 
-        # ETAPE 0: Agent GPT analyse l'intention et extrait les critères EN TENANT COMPTE DE L'HISTORIQUE
-        intent = analyze_user_intent(req.query, req.conversation_history)
-        print(f"[GPT-INTENT] {intent.reasoning}")
-        print(f"[GPT-INTENT] Recherche appartement: {intent.is_apartment_search}")
-        print(f"[GPT-CRITERIA] budget_max={intent.criteria.max_budget}, ville={intent.criteria.city}, pieces={intent.criteria.rooms}, meuble={intent.criteria.furnished}")
+def lexical_lookup(req: QueryRequest) -> tuple[list[tuple[dict, float]], float] | None:
+    """Résultats BM25 de la question et confiance lexicale (None en mode "dense" ou sans index)"""
+    index = lexical_state["index"]
+    if index is None or (req.retrieval or RETRIEVAL_MODE) != "hybrid":
+        return None
+    with stage("lexical_search"):
+        return index.search(req.query)
 
-        # Si ce n'est PAS une recherche d'appartement, forcer type=None
-        if not intent.is_apartment_search:
-            req.type = None
-        else:
-            # Si recherche d'appartement MAIS aucun critère â†’ forcer type="appartement" pour trouver des résultats
-            if not intent.criteria.city and not intent.criteria.max_budget and not intent.criteria.rooms:
-                req.type = "appartement"
-                print("[INFO] Recherche d'appartement sans critères â†’ Forcer type='appartement' pour Qdrant")
+def skip_embedding(req: QueryRequest, lexical) -> bool:
+    """
+    Question à mots-clés bien couverte par l'index lexical : pas d'aller-retour embedding
+    L'index lexical ne sert que la base de connaissances : une question au vocabulaire logement (ville, budget...)
+    garde l'embedding (classement vectoriel du catalogue, cache sémantique)
+    """
+    return lexical is not None and lexical[1] >= LEXICAL_SKIP_CONFIDENCE and parse_intent(req.query) is None
+
+async def fetch_apartment_points() -> list:
+    """Tous les points "appartement" de Qdrant, avec leurs vecteurs"""
+    apartment_filter = Filter(must=[FieldCondition(key="type", match=MatchValue(value="appartement"))])
+    points = []
+    offset = None
+    while True:
+        batch, offset = await qdrant.scroll(
+            collection_name=collection_for("apartments"),
+            scroll_filter=apartment_filter,
+            limit=256,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True
+        )
+        points.extend(batch)
+        if offset is None:
+            return points
 
+async def load_apartment_catalog(rebuild: bool = False):
+    """
+    Charger le catalogue : instantané déjà publié par un autre worker, sinon points "appartement" de Qdrant
+    (un seul worker relit Qdrant, puis publie l'instantané pour les autres)
+    `rebuild=True` (ré-indexation) relit toujours Qdrant
+    """
+    claimed = False
+    try:
+        if not rebuild:
+            if apartment_catalog.load_snapshot(CATALOG_SNAPSHOT_DIR):
+                print(f"[CATALOG] {len(apartment_catalog)} appartements chargés depuis l'instantané partagé")
+                return
+            claimed = claim_snapshot_build(CATALOG_SNAPSHOT_DIR)
+            if not claimed:
+                # Un autre worker interroge déjà Qdrant : attendre qu'il publie l'instantané
+                waited = 0.0
+                while waited < CATALOG_BUILD_WAIT:
+                    await asyncio.sleep(0.2)
+                    waited += 0.2
+                    if apartment_catalog.load_snapshot(CATALOG_SNAPSHOT_DIR):
+                        print(f"[CATALOG] {len(apartment_catalog)} appartements chargés depuis l'instantané partagé")
+                        return
+
+        apartment_catalog.load(await fetch_apartment_points())
+        if apartment_catalog.ready:
+            apartment_catalog.save_snapshot(CATALOG_SNAPSHOT_DIR)
+        print(f"[CATALOG] {len(apartment_catalog)} appartements chargés en mémoire")
+    except Exception as e:
+        print(f"[WARNING] Catalogue non chargé, les recherches passeront par Qdrant: {e}")
+    finally:
+        if claimed:
+            release_snapshot_build(CATALOG_SNAPSHOT_DIR)
+
+def sync_shared_indexes():
+    """
+    Suivre les index reconstruits ailleurs (ré-indexation reçue par un autre worker, ingestion) :
+    index lexical rechargé si son fichier a changé ; catalogue rechargé depuis l'instantané publié
+    et réponses en cache invalidées. Vérifié au plus toutes les CATALOG_REFRESH_INTERVAL s
+    """
+    now = time.monotonic()
+    if now - catalog_sync["checked_at"] < CATALOG_REFRESH_INTERVAL:
+        return
+    catalog_sync["checked_at"] = now
+    try:
+        lexical_mtime = os.path.getmtime(index_path(current_brand()))
+    except OSError:
+        lexical_mtime = None
+    if lexical_state["mtime"] is not None and lexical_mtime not in (None, lexical_state["mtime"]):
+        load_lexical_index()
+    generation = snapshot_generation(CATALOG_SNAPSHOT_DIR)
+    if generation is None or generation == apartment_catalog.generation or not readiness["ready"]:
+        return
+    if apartment_catalog.load_snapshot(CATALOG_SNAPSHOT_DIR):
+        catalog_sync["reloads"] += 1
+        semantic_cache.clear()
+        print(f"[CATALOG] Nouvel instantané {generation} : {len(apartment_catalog)} appartements")
+
+# Questions fréquentes pré-calculées au démarrage, en plus des quick replies (zones, villes, typologies)
+WARMUP_QUERIES = [
+    "Bonjour, je cherche un logement",
+    "c'est quoi ECLA ?",
+    "quels services sont inclus dans le loyer ?",
+    "quels sont les frais de dossier ?",
+    "Je suis flexible sur la ville",
+    "flexible",
+    "Tous",
+    "Studio",
+    "T1",
+    "T2",
+    "T3",
+]
+WARMUP_RETRY_DELAY = float(os.getenv("WARMUP_RETRY_DELAY", "5"))
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))  # Connexions OpenAI ouvertes en parallèle
+
+# Etat du démarrage : /ready répond 503 tant que le warm-up n'est pas terminé
+readiness = {"ready": False, "steps": {}, "warnings": [], "duration_s": None}
+
+def warmup_queries() -> list[str]:
+    """Valeurs des quick replies et requêtes envoyées par le frontend quand on clique dessus"""
+    places = list(ZONE_MAPPING) + sorted({p.get("city", "") for p in apartment_catalog.payloads} - {""})
+    queries = WARMUP_QUERIES + places + [f"Montre moi les typologies disponibles à {place}" for place in places]
+    return list(dict.fromkeys(queries))
+
+async def warm_up():
+    """
+    Préparer le serveur avant d'annoncer qu'il est prêt :
+    connexions Qdrant/OpenAI ouvertes, catalogue chargé, quick replies déjà embeddées, recherche de test Qdrant
+    Les étapes Qdrant sont réessayées jusqu'au succès ; un échec OpenAI est seulement signalé
+    """
+    start = time.perf_counter()
+    while True:
+        try:
+            step = time.perf_counter()
+            await qdrant.get_collections()
+            readiness["steps"]["qdrant_connection"] = round(time.perf_counter() - step, 3)
+
+            step = time.perf_counter()
+            await load_apartment_catalog()
+            readiness["steps"]["catalog"] = round(time.perf_counter() - step, 3)
+            break
+        except Exception as e:
+            print(f"[WARMUP] Qdrant indisponible, nouvel essai dans {WARMUP_RETRY_DELAY}s: {e}")
+            await asyncio.sleep(WARMUP_RETRY_DELAY)
+
+    step = time.perf_counter()
+    load_lexical_index()
+    readiness["steps"]["lexical_index"] = round(time.perf_counter() - step, 3)
+
+    # Vecteur unitaire si les embeddings ne sont pas disponibles
+    probe_vector = [1.0] + [0.0] * (VECTOR_SIZE - 1)
+    step = time.perf_counter()
+    try:
+        # Requêtes réparties en lots parallèles : autant de connexions gardées ouvertes dans le pool
+        queries = warmup_queries()
+        batches = [queries[i::WARMUP_CONNECTIONS] for i in range(WARMUP_CONNECTIONS) if queries[i::WARMUP_CONNECTIONS]]
+        vectors = await asyncio.gather(*(embed_many(batch) for batch in batches))
+        probe_vector = vectors[0][0]
+        readiness["steps"]["embeddings"] = round(time.perf_counter() - step, 3)
+        print(f"[WARMUP] {len(queries)} requêtes fréquentes embeddées")
+    except Exception as e:
+        readiness["warnings"].append(f"embeddings: {e}")
+        print(f"[WARNING] Warm-up des embeddings impossible: {e}")
+
+    step = time.perf_counter()
+    while True:
+        try:
+            for collection_name in all_collections():
+                await qdrant.query_points(
+                    collection_name=collection_name,
+                    query=probe_vector,
+                    limit=1,
+                    with_payload=False
+                )
+            readiness["steps"]["qdrant_probe"] = round(time.perf_counter() - step, 3)
+            break
+        except Exception as e:
+            print(f"[WARMUP] Recherche de test Qdrant en échec, nouvel essai dans {WARMUP_RETRY_DELAY}s: {e}")
+            await asyncio.sleep(WARMUP_RETRY_DELAY)
+
+    readiness["duration_s"] = round(time.perf_counter() - start, 3)
+    readiness["ready"] = True
+    print(f"[WARMUP] Serveur prêt en {readiness['duration_s']}s {readiness['steps']}")
+
+@app.on_event("startup")
+async def startup():
+    # Warm-up en arrière-plan : "/" (liveness) répond pendant ce temps, "/ready" seulement ensuite
+    app.state.warmup_task = asyncio.create_task(warm_up())
+
+@app.get("/ready")
+def ready():
+    """Readiness : 200 une fois le warm-up terminé, 503 avant (à utiliser comme healthcheck de déploiement)"""
+    if not readiness["ready"]:
+        return JSONResponse(status_code=503, content={"status": "warming_up", **readiness})
+    return {"status": "ready", **readiness}
+
+class ReindexNotification(BaseModel):
+    kind: str = "all"  # "documents", "apartments" ou "all"
+
+# Secret partagé avec le serveur d'administration (en-tête X-Internal-Token) ; sans secret, la route est fermée
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "")
+if not INTERNAL_API_TOKEN:
+    print("[WARNING] INTERNAL_API_TOKEN absent : /internal/reindex refusera les notifications de ré-indexation")
+
+@app.post("/internal/reindex")
+async def on_reindex(notification: ReindexNotification, x_internal_token: str = Header(default="")):
+    """Appelé par le serveur d'administration après une ré-indexation"""
+    if not INTERNAL_API_TOKEN or not secrets.compare_digest(x_internal_token.encode(), INTERNAL_API_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Jeton interne invalide")
+    if notification.kind in ("apartments", "all"):
+        await load_apartment_catalog(rebuild=True)
+    elif apartment_catalog.ready:
+        # Nouvelle génération d'instantané : les autres workers vident aussi leur cache sémantique
+        apartment_catalog.save_snapshot(CATALOG_SNAPSHOT_DIR)
+    if notification.kind in ("documents", "all"):
+        # Index lexical réécrit par ingest_qdrant.py
+        load_lexical_index()
+    # Les réponses en cache ont été construites sur l'ancien index
+    semantic_cache.clear()
+    return {"success": True, "catalog_size": len(apartment_catalog)}
+
+# Champs de payload demandés à Qdrant selon le contenu interrogé (jamais les vecteurs)
+# (les champs de card à la racine ne servent qu'aux points indexés avant les cards précalculées)
+APARTMENT_PAYLOAD_FIELDS = [
+    "type", "content", "url", "card", "apartment_id", "typologie_id", "city", "rooms", "surface_m2", "surface_min",
+    "surface_max", "furnished", "rent_cc_eur", "availability_date", "energy_label", "postal_code", "floor",
+    "orientation", "bed_size", "has_ac", "application_fee", "deposit_months", "is_typologie",
+]
+KNOWLEDGE_PAYLOAD_FIELDS = ["type", "content", "url"]
+
+# Champs des cards non affichés en mode compact
+COMPACT_DROPPED_FIELDS = ("content", "score")
+
+def compact_payload(payload: dict) -> dict:
+    """Réponse allégée pour le frontend : cards sans description complète ni score"""
+    if not payload.get("apartments"):
+        return payload
+    return {
+        **payload,
+        "apartments": [
+            {k: v for k, v in apt.items() if k not in COMPACT_DROPPED_FIELDS} for apt in payload["apartments"]
+        ]
+    }
+
+def collect_results(results: list, apartments_only: bool, keep_apartments: bool) -> tuple[list[dict], list[dict]]:
+    """
+    Chunks (contexte de l'agent commercial) et cards d'appartements à partir des points Qdrant / catalogue
+    La card est précalculée à l'ingestion : il ne reste qu'à y ajouter la description et le score
+    """
+    chunks = []
+    apartments = []
+    for r in results:
+        payload = r.payload
+        is_apartment = payload.get("type") == "appartement"
+        if (is_apartment and not keep_apartments) or (apartments_only and not is_apartment):
+            continue
+        if is_apartment:
+            card = card_from_payload(payload, broadened=apartments_only)
+            apartments.append({**card, "content": payload["content"], "score": r.score})
+        chunks.append({
+            "content": payload["content"],
+            "url": payload.get("url", ""),
+            "type": payload.get("type", ""),
+            "score": r.score
+        })
+    return chunks, apartments
+
+# Compteurs de la recherche élargie (fallback)
+retrieval_stats = {"apartment_searches": 0, "fallback_used": 0, "fallback_prefetched": 0,
+                   "hybrid_searches": 0, "lexical_only": 0, "embedding_skipped": 0}
+
+def content_kind(req: QueryRequest, intent: IntentAnalysis) -> str:
+    """Type de contenu interrogé : appartements ou base de connaissances (même collection en layout "single")"""
+    if req.type == "appartement" or (req.type is None and intent.is_apartment_search):
+        return "apartments"
+    return "knowledge"
+
+def use_catalog(req: QueryRequest, intent: IntentAnalysis) -> bool:
+    """Le catalogue ne couvre que les recherches d'appartements"""
+    return intent.is_apartment_search and apartment_catalog.ready and req.type in (None, "appartement")
+
+def start_intent(req: QueryRequest, session: dict | None = None) -> asyncio.Task:
+    """Lancer l'analyse d'intention en tâche de fond (en parallèle de l'embedding)"""
+    return asyncio.create_task(analyze_user_intent(req.query, req.conversation_history, session))
+
+async def analyze_and_embed(req: QueryRequest, vector: list[float] | None = None, session: dict | None = None,
+                            embed_query: bool = True, intent_task: asyncio.Task | None = None):
+    """
+    Analyse de l'intention et embedding de la query (étapes indépendantes, lancées en parallèle)
+    `intent_task` : analyse déjà lancée pendant la consultation du cache sémantique
+    """
+    # ETAPE 0: Agent GPT analyse l'intention et extrait les critères EN TENANT COMPTE DE L'HISTORIQUE
+    # L'embedding ne dépend que de la query : il est calculé EN PARALLELE de l'analyse GPT
+    # Embedding indisponible (mode dégradé) : vector=None, recherche par filtres seuls
+    if intent_task is None:
+        intent_task = start_intent(req, session)
+    if vector is None and embed_query and not is_degraded("embedding"):
         try:
-            vector = embed(req.query)
+            vector = await embed_within_budget(req.query)
         except Exception as e:
+            intent_task.cancel()
             print(f"[ERROR] Erreur embedding: {str(e)}")
             raise
 
-        # ETAPE 1: Construire les filtres Qdrant avec les critères GPT
-        filter_conditions = []
-
-        if req.type:
-            filter_conditions.append(FieldCondition(key="type", match=MatchValue(value=req.type)))
+    intent = await intent_task
+    if vector is None and not embed_query:
+        if intent.is_apartment_search and not is_degraded("embedding"):
+            # Recherche d'appartement non détectée localement : embedding pour le classement du catalogue
+            vector = await embed_within_budget(req.query)
+        else:
+            retrieval_stats["embedding_skipped"] += 1
+            print("[LEXICAL] Question à mots-clés : recherche sans embedding")
+    print(f"[GPT-INTENT] {intent.reasoning}")
+    print(f"[GPT-INTENT] Recherche appartement: {intent.is_apartment_search}")
+    print(f"[GPT-CRITERIA] budget_max={intent.criteria.max_budget}, ville={intent.criteria.city}, pieces={intent.criteria.rooms}, meuble={intent.criteria.furnished}")
+
+    # Si ce n'est PAS une recherche d'appartement, forcer type=None
+    if not intent.is_apartment_search:
+        req.type = None
+    else:
+        # Si recherche d'appartement MAIS aucun critère â†’ forcer type="appartement" pour trouver des résultats
+        if not intent.criteria.city and not intent.criteria.max_budget and not intent.criteria.rooms:
+            req.type = "appartement"
+            print("[INFO] Recherche d'appartement sans critères â†’ Forcer type='appartement' pour Qdrant")
 
-        # Filtre ville (extrait par GPT)
-        # Gérer le mapping des ZONES â†’ villes multiples
-        ZONE_MAPPING = {
-            "Paris": ["Massy-Palaiseau", "Villejuif", "Noisy-le-Grand"],
-            "Genève": ["Archamps"],
-            "Lille": ["Lille"],
-            "Bordeaux": ["Bordeaux"]
-        }
+    return intent, vector
 
-        if intent.criteria.city:
-            # Si c'est une ZONE, chercher dans toutes les villes de la zone
-            if intent.criteria.city in ZONE_MAPPING:
-                # On ne filtre PAS ici, le backend retournera toutes les villes et on filtrera après
-                print(f"[INFO] Zone '{intent.criteria.city}' détectée â†’ recherche dans {ZONE_MAPPING[intent.criteria.city]}")
-                # Ne pas ajouter de filtre, on récupère tout et on filtre après
+async def retrieve(req: QueryRequest, intent: IntentAnalysis, vector: list[float] | None,
+                   lexical: tuple[list[tuple[dict, float]], float] | None = None):
+    """
+    Recherche avec les critères GPT, élargie automatiquement si aucun appartement ne correspond
+    Appartements : catalogue en mémoire s'il est chargé (aucun appel Qdrant), sinon Qdrant
+    Base de connaissances en mode hybride : résultats BM25 (`lexical`) et Qdrant fusionnés par rangs réciproques
+    Sans embedding (question à mots-clés, mode dégradé), les appartements sont filtrés puis triés par loyer
+    et la base de connaissances n'est interrogée que par l'index lexical
+    Qdrant hors budget ou disjoncteur ouvert : même repli (étape "qdrant" dégradée)
+    """
+    # ETAPE 1: Construire les filtres Qdrant avec les critères GPT
+    filter_conditions = []
+
+    if req.type:
+        filter_conditions.append(FieldCondition(key="type", match=MatchValue(value=req.type)))
+
+    # Filtre ville (extrait par GPT)
+    # Gérer le mapping des ZONES â†’ villes multiples (voir ZONE_MAPPING)
+    if intent.criteria.city:
+        # Si c'est une ZONE, chercher dans toutes les villes de la zone
+        if intent.criteria.city in ZONE_MAPPING:
+            print(f"[INFO] Zone '{intent.criteria.city}' détectée â†’ recherche dans {ZONE_MAPPING[intent.criteria.city]}")
+            filter_conditions.append(FieldCondition(key="city", match=MatchAny(any=ZONE_MAPPING[intent.criteria.city])))
+        else:
+            # Ville spécifique
+            filter_conditions.append(FieldCondition(key="city", match=MatchValue(value=intent.criteria.city)))
+
+    # Filtre meublé (extrait par GPT)
+    if intent.criteria.furnished is not None:
+        filter_conditions.append(FieldCondition(key="furnished", match=MatchValue(value=intent.criteria.furnished)))
+
+    # Filtre nombre de pièces (extrait par GPT)
+    if intent.criteria.rooms:
+        filter_conditions.append(FieldCondition(key="rooms", match=MatchValue(value=intent.criteria.rooms)))
+
+    # Filtres budget et surface (extraits par GPT), appliqués par Qdrant via les index de payload
+    if intent.criteria.min_budget is not None or intent.criteria.max_budget is not None:
+        filter_conditions.append(FieldCondition(
+            key="rent_cc_eur", range=Range(gte=intent.criteria.min_budget, lte=intent.criteria.max_budget)
+        ))
+    if intent.criteria.min_surface is not None or intent.criteria.max_surface is not None:
+        filter_conditions.append(FieldCondition(
+            key="surface_m2", range=Range(gte=intent.criteria.min_surface, lte=intent.criteria.max_surface)
+        ))
+
+    # La base de connaissances est partagée entre marques dans les deux layouts (index tenant "brand")
+    kind = content_kind(req, intent)
+    collection_name = collection_for(kind)
+    payload_fields = APARTMENT_PAYLOAD_FIELDS if kind == "apartments" else KNOWLEDGE_PAYLOAD_FIELDS
+    if kind == "knowledge":
+        filter_conditions.append(FieldCondition(key="brand", match=MatchValue(value=current_brand())))
+
+    filters = Filter(must=filter_conditions) if filter_conditions else None
+
+    # Filtres élargis : sans ville ni surface, budget max élargi de 30%
+    expanded_budget = int(intent.criteria.max_budget * 1.3) if intent.criteria.max_budget else None
+    fallback_conditions = []
+    if req.type:
+        fallback_conditions.append(FieldCondition(key="type", match=MatchValue(value=req.type)))
+
+    # Garder seulement les critères non-budget
+    if intent.criteria.furnished is not None:
+        fallback_conditions.append(FieldCondition(key="furnished", match=MatchValue(value=intent.criteria.furnished)))
+    if intent.criteria.rooms:
+        fallback_conditions.append(FieldCondition(key="rooms", match=MatchValue(value=intent.criteria.rooms)))
+    if expanded_budget:
+        fallback_conditions.append(FieldCondition(key="rent_cc_eur", range=Range(lte=expanded_budget)))
+
+    fallback_filter = Filter(must=fallback_conditions) if fallback_conditions else None
+    prefetched_fallback = None
+
+    if intent.is_apartment_search:
+        retrieval_stats["apartment_searches"] += 1
+
+    # Catalogue chargé : il fait foi pour les recherches d'appartements (principale et élargie), sans Qdrant
+    catalog = use_catalog(req, intent)
+    results = []
+    if catalog:
+        # Mêmes critères que le filtre Qdrant, la zone étant résolue directement par l'index
+        city = intent.criteria.city
+        with stage("catalog_search"):
+            results = apartment_catalog.search(
+                vector,
+                city=city if city and city not in ZONE_MAPPING else None,
+                zone=city if city in ZONE_MAPPING else None,
+                furnished=intent.criteria.furnished,
+                rooms=intent.criteria.rooms or None,
+                min_rent=intent.criteria.min_budget,
+                max_rent=intent.criteria.max_budget,
+                min_surface=intent.criteria.min_surface,
+                max_surface=intent.criteria.max_surface,
+                limit=20
+            )
+        print(f"[CATALOG] Trouve {len(results)} appartements dans le catalogue")
+
+    if not catalog and (vector is not None or kind == "apartments"):
+        with stage("qdrant_search"):
+            if req.summarize and intent.is_apartment_search:
+                # Recherche principale ET recherche élargie en un seul aller-retour Qdrant :
+                # le fallback éventuel ne coûte alors plus rien
+                responses = await qdrant_query(lambda: qdrant.query_batch_points(
+                    collection_name=collection_name,
+                    requests=[
+                        QdrantQueryRequest(query=vector, filter=filters, limit=20,
+                                           with_payload=payload_fields, with_vector=False),
+                        QdrantQueryRequest(query=vector, filter=fallback_filter, limit=20,
+                                           with_payload=payload_fields, with_vector=False)
+                    ]
+                ))
+                if responses is not None:
+                    results = responses[0].points
+                    prefetched_fallback = responses[1].points
+                    retrieval_stats["fallback_prefetched"] += 1
             else:
-                # Ville spécifique
-                filter_conditions.append(FieldCondition(key="city", match=MatchValue(value=intent.criteria.city)))
+                response = await qdrant_query(lambda: qdrant.query_points(
+                    collection_name=collection_name,
+                    query=vector,
+                    limit=20,  # Augmenter pour avoir plus de résultats avant filtrage budget
+                    with_payload=payload_fields,
+                    with_vectors=False,
+                    query_filter=filters
+                ))
+                if response is not None:
+                    results = response.points
+        print(f"[RESULTS] Trouve {len(results)} resultats")
+
+    if lexical is not None and kind == "knowledge":
+        lexical_points = [
+            ScoredPoint(id=doc["id"], version=0, score=score,
+                        payload={"type": doc["type"], "content": doc["content"], "url": doc["url"]})
+            for doc, score in lexical[0]
+            if not req.type or doc["type"] == req.type
+        ]
+        if results and lexical_points:
+            fused = reciprocal_rank_fusion([results, lexical_points], key=lambda point: point.payload.get("content"))
+            results = [ScoredPoint(id=point.id, version=0, score=score, payload=point.payload) for point, score in fused[:20]]
+            retrieval_stats["hybrid_searches"] += 1
+        elif lexical_points:
+            results = lexical_points
+            retrieval_stats["lexical_only"] += 1
+        print(f"[LEXICAL] {len(lexical_points)} résultats BM25 (confiance {lexical[1]})")
+
+    # Extraire les chunks et les cards d'appartements (les points "appartement" sont ignorés hors recherche d'appartement)
+    chunks, apartments = collect_results(results, apartments_only=False, keep_apartments=intent.is_apartment_search)
+
+    # STRATEGIE COMMERCIALE : Si recherche appartement mais 0 résultat â†’ élargir automatiquement
+    if req.summarize and intent.is_apartment_search and len(apartments) == 0:
+        print("[FALLBACK] Aucun appartement trouvé, élargissement automatique...")
+        retrieval_stats["fallback_used"] += 1
+
+        # Elargir : retirer les filtres de ville ET augmenter le budget de 30%
+        # Catalogue en mémoire, sinon résultats déjà récupérés avec la recherche principale, sinon Qdrant
+        with stage("fallback_search"):
+            if catalog:
+                fallback_results = apartment_catalog.search(
+                    vector,
+                    furnished=intent.criteria.furnished,
+                    rooms=intent.criteria.rooms or None,
+                    max_rent=expanded_budget,
+                    limit=20
+                )
+            elif prefetched_fallback is not None:
+                fallback_results = prefetched_fallback
+            elif is_degraded("qdrant"):
+                # Qdrant vient d'échouer pour cette requête : pas de second appel
+                fallback_results = []
+            else:
+                fallback_response = await qdrant_query(lambda: qdrant.query_points(
+                    collection_name=collection_name,
+                    query=vector,
+                    limit=20,
+                    with_payload=payload_fields,
+                    with_vectors=False,
+                    query_filter=fallback_filter
+                ))
+                fallback_results = fallback_response.points if fallback_response is not None else []
+        print(f"[FALLBACK] {len(fallback_results)} résultats trouvés après élargissement")
 
-        # Filtre meublé (extrait par GPT)
-        if intent.criteria.furnished is not None:
-            filter_conditions.append(FieldCondition(key="furnished", match=MatchValue(value=intent.criteria.furnished)))
+        # Budget élargi de 30% si spécifié (déjà appliqué par le filtre élargi)
+        if expanded_budget:
+            print(f"[FALLBACK] Budget élargi de {intent.criteria.max_budget}â‚¬ à  {expanded_budget}â‚¬")
 
-        # Filtre nombre de pièces (extrait par GPT)
-        if intent.criteria.rooms:
-            filter_conditions.append(FieldCondition(key="rooms", match=MatchValue(value=intent.criteria.rooms)))
+        # Reconstruire apartments et chunks (appartements uniquement)
+        chunks, apartments = collect_results(fallback_results, apartments_only=True, keep_apartments=True)
 
-        filters = Filter(must=filter_conditions) if filter_conditions else None
+    return chunks, apartments
 
+async def qdrant_query(call):
+    """
+    Requête Qdrant (`call` : fonction sans argument retournant l'appel) bornée par la deadline et protégée
+    par le disjoncteur ; None si Qdrant est indisponible (la recherche continue avec le BM25 seul)
+    """
+    if not qdrant_breaker.allow():
+        mark_degraded("qdrant")
+        return None
+    with qdrant_breaker.guard():
         try:
-            results = qdrant.search(
-                collection_name=COLLECTION_NAME,
-                query_vector=vector,
-                limit=20,  # Augmenter pour avoir plus de résultats avant filtrage budget
-                with_payload=True,
-                query_filter=filters
-            )
-            print(f"[RESULTS] Trouve {len(results)} resultats")
+            response = await asyncio.wait_for(call(), timeout=stage_budget(QDRANT_TIMEOUT))
         except Exception as e:
-            print(f"[ERROR] Erreur Qdrant: {str(e)}")
-            raise
-
-        # Extraire les chunks avec toutes les métadonnées
-        chunks = []
-        apartments = []
+            qdrant_breaker.record_failure()
+            print(f"[DEGRADED] Qdrant indisponible: {e!r}")
+            mark_degraded("qdrant")
+            return None
+        qdrant_breaker.record_success()
+        return response
+
+def build_results_payload(req: QueryRequest, intent: IntentAnalysis, apartments: list[dict]) -> dict:
+    """Cards et quick replies à renvoyer au frontend (la réponse de l'agent est générée à part)"""
+    # Si on a des appartements, analyser les résidences disponibles
+    if apartments:
+        # Si l'utilisateur a choisi une ZONE, filtrer les appartements par villes de la zone
+        if intent.criteria.city and intent.criteria.city in ZONE_MAPPING:
+            zone_cities = ZONE_MAPPING[intent.criteria.city]
+            apartments = [apt for apt in apartments if apt['city'] in zone_cities]
+            print(f"[INFO] Filtrage par zone '{intent.criteria.city}': {len(apartments)} typologies dans {zone_cities}")
+
+        # Extraire les villes uniques (après filtrage par zone si applicable)
+        cities = list(set([apt['city'] for apt in apartments]))
+
+        # Déterminer si l'utilisateur a choisi "flexible"
+        is_flexible = req.query.lower() in ["je suis flexible", "flexible"] or "flexible" in req.query.lower()
+
+        # Si plusieurs villes ET l'utilisateur n'a pas spécifié de ville/zone, proposer de choisir
+        if len(cities) > 1 and not intent.criteria.city:
+            # Si l'utilisateur a dit "flexible", proposer les ZONES
+            if is_flexible:
+                quick_replies = [
+                    {"id": "paris", "label": "Paris", "value": "Paris"},
+                    {"id": "geneve", "label": "Genève", "value": "Genève"},
+                    {"id": "lille", "label": "Lille", "value": "Lille"},
+                    {"id": "bordeaux", "label": "Bordeaux", "value": "Bordeaux"}
+                ]
+                print(f"[SUCCESS] Agent commercial - Proposition des ZONES géographiques")
+            else:
+                # Sinon, proposer les villes individuelles + flexible
+                quick_replies = [
+                    {"id": city.lower().replace("-", "_"), "label": city, "value": city}
+                    for city in sorted(cities)]
+                # Ajouter l'option "Flexible"
+                quick_replies.append({"id": "flexible", "label": "Je suis flexible", "value": "flexible"})
+                print(f"[SUCCESS] Agent commercial - {len(cities)} résidences disponibles avec quick replies")
+
+            return {
+                "quick_replies": quick_replies,
+                "apartments": [],
+                "has_apartments": False
+            }
+        else:
+            # Une seule ville ou ville spécifiée
+            # NOUVEAU FLUX SIMPLIFIE : Afficher directement TOUTES les typologies
+            # Le budget est visible sur les cards, l'utilisateur choisit ensuite
+
+            # Afficher toutes les typologies de la résidence correspondant aux critères
+            apartments_to_return = apartments
+
+            print(f"[SUCCESS] Agent commercial - Affichage direct de {len(apartments_to_return)} typologies")
+            return {
+                "apartments": apartments_to_return,
+                "residences_available": [],
+                "has_apartments": True
+            }
+    else:
+        # Agent commercial pour infos générales
+        print("[SUCCESS] Agent commercial - infos générales")
+        return {
+            "residences_available": [],
+            "has_apartments": False
+        }
 
-        for r in results:
-            payload = r.payload
+# Cache sémantique des réponses aux premières questions ("c'est quoi ECLA", "quels services"...)
+semantic_cache = SemanticCache()
 
-            # Si c'est un appartement ET que c'est une recherche d'appartement
-            if payload.get("type") == "appartement":
-                # Si l'utilisateur ne cherche PAS d'appartement, skip
-                if not intent.is_apartment_search:
-                    continue
+def semantic_scope(req: QueryRequest) -> str:
+    """
+    Scope du cache sémantique : variante de réponse + critères reconnus localement dans la question
+    ("T2 à Lille" et "T2 à Lyon" ont des embeddings très proches mais pas la même réponse)
+    """
+    local_intent = parse_intent(req.query)
+    return fingerprint({
+        "summarize": req.summarize,
+        "compact": req.compact,
+        "retrieval": req.retrieval,
+        "type": req.type,
+        "criteria": local_intent["criteria"] if local_intent else None
+    })
+
+def search_metrics():
+    """Compteurs existants (/intent/stats, /retrieval/stats, /cache/stats, /context/stats) pour /metrics"""
+    for path in ("fast_path", "llm"):
+        yield ("search_intent_analyses", "Analyses d'intention par chemin", "counter", {"path": path}, intent_stats[path])
+    for model, calls in intent_stats["calls_by_model"].items():
+        yield ("search_intent_model_calls", "Appels à l'agent d'intention par modèle", "counter", {"model": model}, calls)
+    for reason, count in intent_stats["escalations"].items():
+        yield ("search_intent_escalations", "Escalades vers le gros modèle d'intention", "counter", {"reason": reason}, count)
+    yield ("search_intent_escalation_ratio", "Part des analyses GPT escaladées", "gauge", {},
+           sum(intent_stats["escalations"].values()) / intent_stats["llm"] if intent_stats["llm"] else 0.0)
+
+    yield ("search_apartment_searches", "Recherches d'appartements", "counter", {}, retrieval_stats["apartment_searches"])
+    yield ("search_fallbacks", "Recherches élargies (aucun résultat)", "counter", {}, retrieval_stats["fallback_used"])
+    searches = retrieval_stats["apartment_searches"]
+    yield ("search_fallback_ratio", "Part des recherches d'appartements élargies", "gauge", {},
+           retrieval_stats["fallback_used"] / searches if searches else 0.0)
+
+    for source in ("hybrid_searches", "lexical_only"):
+        yield ("search_lexical_retrievals", "Recherches dans la base de connaissances avec l'index BM25", "counter",
+               {"source": source.removesuffix("_searches")}, retrieval_stats[source])
+    yield ("search_embeddings_skipped", "Embeddings évités grâce à la confiance lexicale", "counter", {},
+           retrieval_stats["embedding_skipped"])
+
+    caches = {"embeddings": embedding_cache.get_stats(), "responses": semantic_cache.get_stats()}
+    for site, stats in completion_cache.get_stats().items():
+        caches[f"completions_{site}"] = stats
+    for cache, stats in caches.items():
+        hits = stats.get("hits", stats.get("memory_hits", 0) + stats.get("disk_hits", 0))
+        yield ("cache_lookups", "Consultations des caches", "counter", {"cache": cache, "result": "hit"}, hits)
+        yield ("cache_lookups", "Consultations des caches", "counter", {"cache": cache, "result": "miss"}, stats["misses"])
+        yield ("cache_hit_ratio", "Taux de succès des caches", "gauge", {"cache": cache}, stats["hit_rate"])
+
+    yield ("commercial_prompt_tokens", "Tokens des prompts de l'agent commercial", "counter",
+           {"packing": "before"}, context_stats["tokens_before"])
+    yield ("commercial_prompt_tokens", "Tokens des prompts de l'agent commercial", "counter",
+           {"packing": "after"}, context_stats["tokens_after"])
+
+    flights = search_flight.get_stats()
+    yield ("search_single_flight_requests", "Requêtes /search par rôle (calcul lancé ou résultat partagé)", "counter",
+           {"role": "leader"}, flights["leaders"])
+    yield ("search_single_flight_requests", "Requêtes /search par rôle (calcul lancé ou résultat partagé)", "counter",
+           {"role": "coalesced"}, flights["coalesced"])
+    yield ("search_single_flight_in_flight", "Calculs /search en cours", "gauge", {}, flights["in_flight"])
+
+    for model, stats in governor.get_stats().items():
+        labels = {"model": model}
+        yield ("openai_queue_depth", "Appels OpenAI en attente dans le régulateur", "gauge", labels, stats["queue_depth"])
+        yield ("openai_calls_in_flight", "Appels OpenAI en cours", "gauge", labels, stats["active"])
+        yield ("openai_calls_admitted", "Appels OpenAI admis par le régulateur", "counter", labels, stats["admitted"])
+        for reason in ("queue_full", "timeout"):
+            yield ("openai_calls_shed", "Appels OpenAI refusés par le régulateur", "counter",
+                   {**labels, "reason": reason}, stats[f"shed_{reason}"])
+
+    for key, stats in hedger.get_stats().items():
+        site, _, model = key.partition(":")
+        labels = {"site": site, "model": model}
+        yield ("openai_hedged_calls", "Appels OpenAI éligibles au doublement", "counter", labels, stats["calls"])
+        for outcome in ("fired", "won", "suppressed"):
+            yield ("openai_hedges", "Appels doublés : lancés, gagnés, évités par le plafond de surcoût", "counter",
+                   {**labels, "outcome": outcome}, stats[outcome])
+
+    for endpoint, count in degraded_responses.items():
+        yield ("search_degraded_responses", "Réponses servies en mode dégradé", "counter", {"endpoint": endpoint}, count)
+    for stage_name, count in degraded_stats.items():
+        yield ("search_degraded_stages", "Étapes remplacées par leur repli local", "counter", {"stage": stage_name}, count)
+    for stage_name, breaker in (("intent", intent_breaker), ("commercial", commercial_breaker), ("qdrant", qdrant_breaker)):
+        breaker_stats = breaker.get_stats()
+        yield ("circuit_breaker_open", "Disjoncteur ouvert (1) ou fermé / en essai (0)", "gauge",
+               {"stage": stage_name}, 1 if breaker_stats["state"] == "open" else 0)
+        yield ("circuit_breaker_rejected", "Appels court-circuités par un disjoncteur ouvert", "counter",
+               {"stage": stage_name}, breaker_stats["rejected"])
+
+    sessions = session_store.get_stats()
+    yield ("session_lookups", "Consultations des sessions", "counter", {"result": "hit"}, sessions["hits"])
+    yield ("session_lookups", "Consultations des sessions", "counter", {"result": "miss"}, sessions["misses"])
+    yield ("sessions", "Sessions de conversation actives", "gauge", {}, sessions["sessions"])
+
+register_stats(search_metrics)
+
+# Sessions de conversation : critères accumulés + historique compact, indexés par session_id
+session_store = SessionStore()
+
+def load_session(req: QueryRequest) -> dict | None:
+    """
+    Session de la requête (None sans session_id)
+    Une session connue remplace l'historique envoyé par le frontend ; une session inconnue ou expirée
+    repart de `conversation_history` pour ce tour. Avec `resume_session` (historique non envoyé),
+    une session expirée est signalée (409) pour que le client renvoie son historique
+    """
+    if not req.session_id:
+        return None
+    session = session_store.get(req.session_id)
+    if session is None:
+        if req.resume_session:
+            raise HTTPException(status_code=409, detail="Session inconnue ou expirée : renvoyer conversation_history")
+        return new_session()
+    req.conversation_history = session["history"]
+    return session
+
+async def save_session(req: QueryRequest, session: dict | None, intent: IntentAnalysis, answer: str):
+    """
+    Enregistrer le tour ; une question générale ne remet pas à zéro les critères déjà extraits
+    Ajout atomique (backend SQLite : transaction possiblement en attente d'un autre worker), hors de la boucle
+    """
+    if session is None:
+        return
+    criteria = intent.criteria.model_dump() if intent.is_apartment_search else None
+    await asyncio.to_thread(session_store.record_turn, req.session_id, session, req.query, answer, criteria,
+                            intent.is_apartment_search)
 
-                rent = payload.get("rent_cc_eur", 0)
-
-                # NOTE: On ne filtre PAS par budget ici pour permettre l'affichage de TOUTES les typologies d'une résidence
-                # Le filtrage par budget sera appliqué APRàˆS le groupement par ville (ligne 655-657)
-                # Cela permet de montrer toutes les typologies disponibles, et de masquer uniquement celles hors budget
-
-                # Créer la card seulement si le budget est OK
-                apartment_card = {
-                    "id": payload.get("apartment_id", ""),
-                    "typologie_id": payload.get("typologie_id", ""),
-                    "city": payload.get("city", ""),
-                    "rooms": payload.get("rooms", 1),
-                    "surface_m2": payload.get("surface_m2", 0),
-                    "furnished": payload.get("furnished", False),
-                    "rent_cc_eur": rent,
-                    "availability_date": payload.get("availability_date", ""),
-                    "energy_label": payload.get("energy_label", ""),
-                    "postal_code": payload.get("postal_code", ""),
-                    "floor": payload.get("floor", 0),
-                    "orientation": payload.get("orientation", "Nord"),
-                    "bed_size": payload.get("bed_size", 140),
-                    "has_ac": payload.get("has_ac", False),
-                    "application_fee": payload.get("application_fee", 100),
-                    "deposit_months": payload.get("deposit_months", 1),
-                    "is_typologie": payload.get("is_typologie", False),
-                    "content": payload["content"],
-                    "score": r.score
-                }
-                apartments.append(apartment_card)
-
-                # Créer aussi le chunk pour cet appartement
-                chunk_data = {
-                    "content": payload["content"],
-                    "url": payload.get("url", ""),
-                    "type": payload.get("type", ""),
-                    "score": r.score
-                }
-                chunks.append(chunk_data)
-            else:
-                # Pour les non-appartements, ajouter le chunk normalement
-                chunk_data = {
-                    "content": payload["content"],
-                    "url": payload.get("url", ""),
-                    "type": payload.get("type", ""),
-                "score": r.score
-            }
-                chunks.append(chunk_data)
+@app.get("/sessions/stats")
+def sessions_stats():
+    return session_store.get_stats()
 
-        if req.summarize:
-            print("[AI] Generation du resume IA...")
+def admit(req: QueryRequest):
+    """
+    Admission d'une requête : priorité aux tours courts (quick replies analysées sans GPT),
+    refus immédiat (503) si la file d'un des modèles utilisés est déjà pleine
+    La deadline de la requête démarre ici : toutes les étapes lentes se partagent ce budget
+    """
+    start_deadline()
+    fast_result = parse_intent(req.query)
+    quick_reply = fast_result is not None and fast_result["confidence"] >= FAST_INTENT_MIN_CONFIDENCE
+    request_priority.set(PRIORITY_QUICK_REPLY if quick_reply else PRIORITY_FREE_TEXT)
+    governor.check(EMBEDDING_MODEL, COMMERCIAL_MODEL, *([] if quick_reply else [INTENT_MODEL]))
+
+@app.exception_handler(Saturated)
+async def saturated_handler(request, exc: Saturated):
+    print(f"[GOVERNOR] Requête refusée: {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Service saturé, veuillez réessayer dans quelques secondes", "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
-            # STRATEGIE COMMERCIALE : Si recherche appartement mais 0 résultat â†’ élargir automatiquement
-            if intent.is_apartment_search and len(apartments) == 0:
-                print("[FALLBACK] Aucun appartement trouvé, élargissement automatique...")
+# Réponses servies en mode dégradé, par endpoint
+degraded_responses = {"search": 0, "stream": 0}
+
+@app.get("/degraded/stats")
+def degraded_stats_endpoint():
+    """État des disjoncteurs et nombre de replis locaux par étape"""
+    return {
+        "responses": degraded_responses,
+        "stages": degraded_stats,
+        "breakers": {
+            "intent": intent_breaker.get_stats(),
+            "commercial": commercial_breaker.get_stats(),
+            "qdrant": qdrant_breaker.get_stats(),
+        },
+    }
+
+@app.get("/governor/stats")
+def governor_stats():
+    """Appels en cours, profondeur de file, attente et refus par modèle"""
+    return governor.get_stats()
+
+@app.get("/hedging/stats")
+def hedging_stats():
+    """Appels doublés par site : lancés, gagnés (le doublon a répondu le premier), évités par le plafond"""
+    return {"enabled": hedger.enabled, "sites": hedger.get_stats()}
+
+@app.get("/single-flight/stats")
+def single_flight_stats():
+    """Requêtes /search identiques servies par un calcul déjà en cours"""
+    return search_flight.get_stats()
+
+# Requêtes identiques simultanées (même quick reply cliquée au même moment) : un seul calcul partagé
+search_flight = SingleFlight()
+
+def search_key(req: QueryRequest, session: dict | None) -> str:
+    """Requête normalisée : question, options, critères de la session et empreinte de l'historique"""
+    return fingerprint({
+        "query": normalize_query(req.query),
+        "type": req.type,
+        "summarize": req.summarize,
+        "compact": req.compact,
+        "retrieval": req.retrieval,
+        "criteria": session["criteria"] if session else None,
+        "history": fingerprint(req.conversation_history or []),
+    })
+
+def degraded_fields(degraded: list[str]) -> dict:
+    """Marquage d'une réponse servie (en partie) par les replis locaux"""
+    return {"degraded": True, "degraded_stages": degraded} if degraded else {}
+
+async def run_search(req: QueryRequest, session: dict | None):
+    """
+    Chaîne complète de /search
+    Retourne (réponse, intention, texte de la réponse commerciale, étapes servies en mode dégradé)
+    """
+    degraded = track_degraded()
+    lexical = lexical_lookup(req)
+    embed_query = not skip_embedding(req, lexical)
+    # Première question (sans historique) : réponse en cache si une question proche a déjà été servie.
+    # L'analyse d'intention démarre en même temps que l'embedding et n'est annulée qu'en cas de succès du cache
+    scope = vector = intent_task = None
+    if not req.conversation_history and embed_query:
+        scope = semantic_scope(req)
+        intent_task = start_intent(req, session)
+        try:
+            vector = await embed_within_budget(req.query)
+        except BaseException:
+            intent_task.cancel()
+            raise
+        if vector is not None:
+            with stage("semantic_cache"):
+                cached = semantic_cache.get(vector, scope)
+            if cached is not None:
+                intent_task.cancel()
+                print("[SEMANTIC-CACHE] Réponse servie depuis le cache")
+                response, intent_json = cached
+                answer = response.get("answer", "") if isinstance(response, dict) else ""
+                return response, IntentAnalysis(**intent_json), answer, degraded
+
+    intent, vector = await analyze_and_embed(req, vector, session, embed_query, intent_task)
+    chunks, apartments = await retrieve(req, intent, vector, lexical)
+
+    answer = ""
+    if not req.summarize:
+        response = chunks
+    else:
+        print("[AI] Generation du resume IA...")
+        with stage("response_build"):
+            payload = build_results_payload(req, intent, apartments)
+            if req.compact:
+                payload = compact_payload(payload)
+        answer = await commercial_answer(chunks, apartments, payload, req.query, req.conversation_history)
+        response = {"answer": answer, **payload, **degraded_fields(degraded)}
+
+    # Une réponse dégradée n'est pas mise en cache : la suivante aura peut-être la vraie réponse
+    if scope is not None and vector is not None and not degraded:
+        semantic_cache.set(vector, scope, (response, intent.model_dump()))
+    return response, intent, answer, degraded
 
-                # Elargir : retirer les filtres de ville ET augmenter le budget de 30%
-                fallback_filters = []
-                if req.type:
-                    fallback_filters.append(FieldCondition(key="type", match=MatchValue(value=req.type)))
+@app.post("/search")
+async def search(req: QueryRequest, http_response: Response):
+    try:
+        print(f"[SEARCH] Recherche recue: {req.query}")
+        admit(req)
+        sync_shared_indexes()
 
-                # Garder seulement les critères non-budget
-                if intent.criteria.furnished is not None:
-                    fallback_filters.append(FieldCondition(key="furnished", match=MatchValue(value=intent.criteria.furnished)))
-                if intent.criteria.rooms:
-                    fallback_filters.append(FieldCondition(key="rooms", match=MatchValue(value=intent.criteria.rooms)))
+        session = load_session(req)
 
-                fallback_filter = Filter(must=fallback_filters) if fallback_filters else None
+        async def lead():
+            # Durées du calcul partagé, reprises dans le Server-Timing des requêtes regroupées
+            return await run_search(req, session), current_timings()
 
-                # Nouvelle recherche élargie
-                fallback_results = qdrant.search(
-                    collection_name=COLLECTION_NAME,
-                    query_vector=vector,
-                    limit=20,
-                    with_payload=True,
-                    query_filter=fallback_filter
-                )
-                print(f"[FALLBACK] {len(fallback_results)} résultats trouvés après élargissement")
-
-                # Reconstruire apartments et chunks
-                apartments = []
-                chunks = []
-
-                # Elargir le budget de 30% si spécifié
-                expanded_budget = None
-                if intent.criteria.max_budget:
-                    expanded_budget = int(intent.criteria.max_budget * 1.3)
-                    print(f"[FALLBACK] Budget élargi de {intent.criteria.max_budget}â‚¬ à  {expanded_budget}â‚¬")
-
-                for r in fallback_results:
-                    payload = r.payload
-                    if payload.get("type") == "appartement":
-                        rent = payload.get("rent_cc_eur", 0)
-
-                        # Filtre budget élargi (ou pas de filtre si pas de budget)
-                        if expanded_budget and rent > expanded_budget:
-                            continue
-
-                        apartment_card = {
-                            "id": payload.get("apartment_id", ""),
-                            "typologie_id": payload.get("typologie_id", ""),
-                            "city": payload.get("city", ""),
-                            "rooms": payload.get("rooms", 1),
-                            "surface_m2": payload.get("surface_m2", 0),
-                            "surface_min": payload.get("surface_min", 0),
-                            "surface_max": payload.get("surface_max", 0),
-                            "furnished": payload.get("furnished", False),
-                            "rent_cc_eur": rent,
-                            "availability_date": payload.get("availability_date", ""),
-                            "energy_label": payload.get("energy_label", ""),
-                            "postal_code": payload.get("postal_code", ""),
-                            "floor": payload.get("floor", 0),
-                            "orientation": payload.get("orientation", "Nord"),
-                            "bed_size": payload.get("bed_size", 140),
-                            "has_ac": payload.get("has_ac", False),
-                            "application_fee": payload.get("application_fee", 100),
-                            "deposit_months": payload.get("deposit_months", 1),
-                            "is_typologie": payload.get("is_typologie", False),
-                            "content": payload["content"],
-                            "score": r.score
-                        }
-                        apartments.append(apartment_card)
-
-                        chunk_data = {
-                            "content": payload["content"],
-                            "url": payload.get("url", ""),
-                            "type": payload.get("type", ""),
-                            "score": r.score
-                        }
-                        chunks.append(chunk_data)
-
-            # Si on a des appartements, analyser les résidences disponibles
-            if apartments:
-                # Définir les ZONES géographiques
-                ZONE_MAPPING = {
-                    "Paris": ["Massy-Palaiseau", "Villejuif", "Noisy-le-Grand"],
-                    "Genève": ["Archamps"],
-                    "Lille": ["Lille"],
-                    "Bordeaux": ["Bordeaux"]
-                }
-
-                # Si l'utilisateur a choisi une ZONE, filtrer les appartements par villes de la zone
-                if intent.criteria.city and intent.criteria.city in ZONE_MAPPING:
-                    zone_cities = ZONE_MAPPING[intent.criteria.city]
-                    apartments = [apt for apt in apartments if apt['city'] in zone_cities]
-                    print(f"[INFO] Filtrage par zone '{intent.criteria.city}': {len(apartments)} typologies dans {zone_cities}")
-
-                # Extraire les villes uniques (après filtrage par zone si applicable)
-                cities = list(set([apt['city'] for apt in apartments]))
-
-                # Déterminer si l'utilisateur a choisi "flexible"
-                is_flexible = req.query.lower() in ["je suis flexible", "flexible"] or "flexible" in req.query.lower()
-
-                # Si plusieurs villes ET l'utilisateur n'a pas spécifié de ville/zone, proposer de choisir
-                if len(cities) > 1 and not intent.criteria.city:
-                    intro = generate_commercial_response(chunks, req.query, req.conversation_history)
-
-                    # Si l'utilisateur a dit "flexible", proposer les ZONES
-                    if is_flexible:
-                        quick_replies = [
-                            {"id": "paris", "label": "Paris", "value": "Paris"},
-                            {"id": "geneve", "label": "Genève", "value": "Genève"},
-                            {"id": "lille", "label": "Lille", "value": "Lille"},
-                            {"id": "bordeaux", "label": "Bordeaux", "value": "Bordeaux"}
-                        ]
-                        print(f"[SUCCESS] Agent commercial - Proposition des ZONES géographiques")
-                    else:
-                        # Sinon, proposer les villes individuelles + flexible
-                        quick_replies = [
-                            {"id": city.lower().replace("-", "_"), "label": city, "value": city}
-                            for city in sorted(cities)]
-                        # Ajouter l'option "Flexible"
-                        quick_replies.append({"id": "flexible", "label": "Je suis flexible", "value": "flexible"})
-                        print(f"[SUCCESS] Agent commercial - {len(cities)} résidences disponibles avec quick replies")
-
-                    return {
-                        "answer": intro,
-                        "quick_replies": quick_replies,
-                        "apartments": [],
-                        "has_apartments": False
-                    }
-                else:
-                    # Une seule ville ou ville spécifiée
-                    # NOUVEAU FLUX SIMPLIFIE : Afficher directement TOUTES les typologies
-                    # Le budget est visible sur les cards, l'utilisateur choisit ensuite
-
-                    intro = generate_commercial_response(chunks, req.query, req.conversation_history)
-
-                    # Afficher toutes les typologies de la résidence (sans filtre de budget ni de rooms)
-                    apartments_to_return = apartments
-
-                    print(f"[SUCCESS] Agent commercial - Affichage direct de {len(apartments_to_return)} typologies")
-                    return {
-                        "answer": intro,
-                        "apartments": apartments_to_return,
-                        "residences_available": [],
-                        "has_apartments": True
-                    }
-
-                    # ANCIEN CODE - On garde pour référence mais n'est plus exécuté
-                    if False and intent.criteria.max_budget is None:
-                        intro = generate_commercial_response(chunks, req.query, req.conversation_history)
-
-                        # Proposer des tranches de budget
-                        quick_replies = [
-                            {"id": "budget_600", "label": "Moins de 600â‚¬", "value": "600"},
-                            {"id": "budget_800", "label": "600-800â‚¬", "value": "800"},
-                            {"id": "budget_1000", "label": "800-1000â‚¬", "value": "1000"},
-                            {"id": "budget_1500", "label": "1000-1500â‚¬", "value": "1500"},
-                            {"id": "budget_plus", "label": "Plus de 1500â‚¬", "value": "9999"},
-                            {"id": "budget_flexible", "label": "Flexible", "value": "flexible"}
-                        ]
-
-                        print(f"[SUCCESS] Agent commercial - Demande du budget avant d'afficher les typologies")
-                        return {
-                            "answer": intro,
-                            "quick_replies": quick_replies,
-                            "apartments": [],
-                            "has_apartments": False
-                        }
-                    else:
-                        # Budget spécifié
-                        # Si l'utilisateur n'a PAS précisé de typologie, lui demander AVANT d'afficher les cards
-                        if intent.criteria.rooms is None:
-                            intro = generate_commercial_response(chunks, req.query, req.conversation_history)
-
-                            # Proposer les types de typologies disponibles dans cette ville/budget
-                            # Analyser les typologies disponibles dans le budget
-                            apartments_in_budget = [apt for apt in apartments if apt['rent_cc_eur'] <= intent.criteria.max_budget]
-
-                            # Extraire les types uniques (Studio, T1, T2, etc.)
-                            typologie_types = set()
-                            for apt in apartments_in_budget:
-                                rooms = apt['rooms']
-                                if rooms == 0:
-                                    typologie_types.add(("Colocation", 0, "ðŸ "))
-                                elif rooms == 1:
-                                    surface = apt.get('surface_m2', 0)
-                                    if surface < 23:
-                                        typologie_types.add(("Studio", 1, "ðŸ "))
-                                    else:
-                                        typologie_types.add(("T1", 1, "ðŸ "))
-                                else:
-                                    typologie_types.add((f"T{rooms}", rooms, "ðŸ "))
-
-                            # Créer les quick replies pour les typologies
-                            typologie_list = sorted(typologie_types, key=lambda x: x[1])
-                            quick_replies = [
-                                {"id": f"typo_{typ[0].lower()}", "label": typ[0], "value": typ[0]}
-                                for typ in typologie_list
-                            ]
-                            # Ajouter "Tous" pour voir toutes les typologies
-                            quick_replies.append({"id": "typo_all", "label": "Tous", "value": "all"})
-
-                            print(f"[SUCCESS] Agent commercial - Proposition de {len(quick_replies)-1} types de typologies")
-                            return {
-                                "answer": intro,
-                                "quick_replies": quick_replies,
-                                "apartments": [],
-                                "has_apartments": False
-                            }
-                        else:
-                            # Typologie spécifiée ou "Tous"
-                            # Vérifier si l'utilisateur a dit "Tous" ou "all"
-                            is_all = "tous" in req.query.lower() or "all" in req.query.lower()
-
-                            # Filtrer par budget
-                            apartments_to_return = [apt for apt in apartments if apt['rent_cc_eur'] <= intent.criteria.max_budget]
-
-                            # Filtrer par typologie si spécifié (sauf si "Tous")
-                            if not is_all and intent.criteria.rooms is not None:
-                                if intent.criteria.rooms == 1:
-                                    # Pour rooms=1, il faut distinguer Studio et T1 par la surface
-                                    # On laisse passer les deux, le frontend affichera correctement
-                                    pass
-                                else:
-                                    apartments_to_return = [apt for apt in apartments_to_return if apt['rooms'] == intent.criteria.rooms]
-
-                            excluded = len(apartments) - len(apartments_to_return)
-                            filter_desc = "toutes typologies" if is_all else f"typologie rooms={intent.criteria.rooms}"
-                            print(f"[INFO] Filtrage par budget {intent.criteria.max_budget}â‚¬ et {filter_desc}: {len(apartments_to_return)}/{len(apartments)} typologies affichées")
-
-                            intro = generate_commercial_response(chunks, req.query, req.conversation_history)
-                            print(f"[SUCCESS] Agent commercial - {len(apartments_to_return)} typologies affichées")
-                            return {
-                    "answer": intro,
-                                "apartments": apartments_to_return,
-                                "residences_available": [],
-                    "has_apartments": True
-                }
-            else:
-                # Agent commercial pour infos générales
-                answer = generate_commercial_response(chunks, req.query, req.conversation_history)
-                print("[SUCCESS] Agent commercial - infos générales")
-                return {
-                    "answer": answer,
-                    "residences_available": [],
-                    "has_apartments": False
-                }
-
-        return chunks
+        started = time.perf_counter()
+        ((response, intent, answer, degraded), leader_timings), coalesced = await search_flight.do(
+            search_key(req, session), lead
+        )
+        if coalesced:
+            share_timings(leader_timings, time.perf_counter() - started)
+            print("[SINGLE-FLIGHT] Résultat partagé avec une requête identique en cours")
+        if degraded:
+            # En-tête aussi pour summarize=False (réponse = liste de chunks)
+            degraded_responses["search"] += 1
+            http_response.headers["X-Degraded"] = ",".join(degraded)
+        # Chaque requête enregistre le tour dans sa propre session
+        await save_session(req, session, intent, answer)
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[ERROR] ERREUR: {str(e)}")
         import traceback
         traceback.print_exc()
         raise e
+
+def sse_event(event: str, data) -> str:
+    """Formater un événement Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/search/stream")
+async def search_stream(req: QueryRequest):
+    """
+    Variante SSE de /search, pour afficher quelque chose au plus vite :
+    1. event "intent"  : intention et critères extraits
+    2. event "results" : cards et quick replies dès le retour de Qdrant
+    3. event "token"   : réponse de l'agent commercial, token par token
+    4. event "done"    : réponse complète (avec "degraded" si une étape a été remplacée par son repli)
+    """
+    req.summarize = True
+    # Admission avant d'ouvrir le flux : une requête refusée reçoit un vrai 503
+    admit(req)
+    sync_shared_indexes()
+    # Session expirée (409) signalée avant d'ouvrir le flux
+    session = load_session(req)
+
+    async def events():
+        try:
+            print(f"[SEARCH-STREAM] Recherche recue: {req.query}")
+            degraded = track_degraded()
+
+            lexical = lexical_lookup(req)
+            embed_query = not skip_embedding(req, lexical)
+            intent, vector = await analyze_and_embed(req, session=session, embed_query=embed_query)
+            yield sse_event("intent", intent.model_dump())
+
+            chunks, apartments = await retrieve(req, intent, vector, lexical)
+            with stage("response_build"):
+                payload = build_results_payload(req, intent, apartments)
+                if req.compact:
+                    payload = compact_payload(payload)
+            yield sse_event("results", payload)
+
+            parts = []
+            async for token in stream_commercial_answer(chunks, apartments, payload, req.query, req.conversation_history):
+                parts.append(token)
+                yield sse_event("token", {"text": token})
+
+            answer = "".join(parts).strip()
+            await save_session(req, session, intent, answer)
+            if degraded:
+                degraded_responses["stream"] += 1
+            yield sse_event("done", {"answer": answer, **degraded_fields(degraded)})
+        except Exception as e:
+            print(f"[ERROR] ERREUR stream: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            yield sse_event("error", {"message": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,88 @@
+"""
+Cache sémantique des réponses de /search pour les premières questions (sans historique)
+Une nouvelle requête proche d'une requête déjà servie (similarité cosinus >= seuil)
+reçoit la réponse en cache, sans analyse d'intention ni réponse commerciale GPT
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.97"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "500"))
+
+
+class SemanticCache:
+    """
+    Réponses indexées par vecteur de requête, LRU avec TTL
+    `scope` sépare les réponses non interchangeables (résumé ou non, type, critères détectés localement)
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, ttl: float = SEMANTIC_CACHE_TTL,
+                 max_entries: int = SEMANTIC_CACHE_SIZE):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[int, tuple[str, np.ndarray, object, float]] = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def _normalize(vector: list[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def _purge_expired(self, now: float):
+        expired = [entry_id for entry_id, (_, _, _, expires_at) in self._entries.items() if expires_at <= now]
+        for entry_id in expired:
+            del self._entries[entry_id]
+
+    def get(self, vector: list[float], scope: str):
+        """Réponse en cache la plus proche de `vector` dans le même scope, ou None"""
+        if self.ttl <= 0:
+            return None
+        query = self._normalize(vector)
+        with self._lock:
+            self._purge_expired(time.time())
+            candidates = [(entry_id, entry[1]) for entry_id, entry in self._entries.items() if entry[0] == scope]
+            if candidates:
+                scores = np.stack([v for _, v in candidates]) @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry_id = candidates[best][0]
+                    self._entries.move_to_end(entry_id)
+                    self.stats["hits"] += 1
+                    return self._entries[entry_id][2]
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, vector: list[float], scope: str, response):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[self._next_id] = (scope, self._normalize(vector), response, time.time() + self.ttl)
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_stats(self) -> dict:
+        total = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / total, 3) if total else 0.0,
+            "entries": len(self),
+            "threshold": self.threshold,
+        }
@@ -0,0 +1,94 @@
+"""
+Sessions de conversation côté serveur, indexées par session_id
+Une session garde les critères de recherche déjà extraits et un historique compact :
+l'agent d'intention ne reçoit plus que la nouvelle question + les critères courants
+
+Backends (SESSION_BACKEND) :
+- "memory" (défaut) : LRU en mémoire avec TTL, propre au process
+- "sqlite" : fichier SQLite dans CACHE_DIR (survit aux redémarrages)
+Tout objet exposant get(key) / set(key, value: bytes) / update(key, fn) peut servir de backend
+(update : lecture-modification-écriture atomique, pour que deux requêtes simultanées n'effacent pas leurs tours)
+"""
+
+import json
+import os
+import time
+from typing import Optional
+
+from local_cache import MemoryCache, SqliteCache
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(2 * 3600)))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))
+SESSION_HISTORY_MESSAGES = int(os.getenv("SESSION_HISTORY_MESSAGES", "6"))
+SESSION_MESSAGE_CHARS = int(os.getenv("SESSION_MESSAGE_CHARS", "400"))
+
+
+def make_backend(name: str = SESSION_BACKEND):
+    if name == "memory":
+        return MemoryCache(max_entries=SESSION_MAX, ttl=SESSION_TTL)
+    if name == "sqlite":
+        return SqliteCache("sessions.sqlite3", max_entries=SESSION_MAX, ttl=SESSION_TTL)
+    raise ValueError(f"Backend de session inconnu: {name}")
+
+
+def new_session() -> dict:
+    return {"criteria": {}, "is_apartment_search": False, "history": [], "turns": 0, "updated_at": time.time()}
+
+
+class SessionStore:
+    """Sessions sérialisées en JSON dans le backend (aucun état partagé entre requêtes en mémoire)"""
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else make_backend()
+        self.stats = {"hits": 0, "misses": 0, "updates": 0}
+
+    @staticmethod
+    def _key(session_id: str) -> str:
+        return f"session:{session_id}"
+
+    def get(self, session_id: str) -> Optional[dict]:
+        blob = self.backend.get(self._key(session_id))
+        if blob is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return json.loads(blob)
+
+    def save(self, session_id: str, session: dict):
+        session["updated_at"] = time.time()
+        self.backend.set(self._key(session_id), json.dumps(session, ensure_ascii=False).encode("utf-8"))
+        self.stats["updates"] += 1
+
+    def record_turn(self, session_id: str, session: dict, query: str, answer: str,
+                    criteria: Optional[dict], is_apartment_search: bool):
+        """
+        Critères fusionnés du tour + historique compact (messages tronqués, derniers échanges seulement)
+        Le tour est ajouté à la version enregistrée (et non à `session`, lue en début de requête) : les tours
+        de requêtes simultanées sur la même session s'additionnent. criteria=None garde les critères enregistrés ;
+        une recherche d'appartement n'est pas oubliée par une question générale. `session` reçoit le résultat
+        """
+        def apply(blob: Optional[bytes]) -> bytes:
+            current = json.loads(blob) if blob is not None else dict(session)
+            if criteria is not None:
+                current["criteria"] = criteria
+            current["is_apartment_search"] = is_apartment_search or current["is_apartment_search"]
+            current["history"] = (current["history"] + [
+                {"role": "user", "content": query[:SESSION_MESSAGE_CHARS]},
+                {"role": "assistant", "content": answer[:SESSION_MESSAGE_CHARS]},
+            ])[-SESSION_HISTORY_MESSAGES:]
+            current["turns"] += 1
+            current["updated_at"] = time.time()
+            return json.dumps(current, ensure_ascii=False).encode("utf-8")
+
+        session.update(json.loads(self.backend.update(self._key(session_id), apply)))
+        self.stats["updates"] += 1
+
+    def get_stats(self) -> dict:
+        total = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / total, 3) if total else 0.0,
+            "backend": type(self.backend).__name__,
+            "sessions": len(self.backend),
+        }
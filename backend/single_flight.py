@@ -0,0 +1,47 @@
+"""
+Regroupement des requêtes identiques simultanées (single-flight)
+Pendant qu'un calcul est en cours pour une clé, les requêtes suivantes avec la même clé
+attendent son résultat au lieu de relancer intention, embedding, Qdrant et GPT
+"""
+
+import asyncio
+from typing import Awaitable, Callable
+
+
+class SingleFlight:
+    """Un seul calcul en vol par clé ; le résultat (ou l'exception) est partagé par tous les appelants"""
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Task] = {}
+        self.stats = {"leaders": 0, "coalesced": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable]):
+        """Retourne (résultat, coalesced) ; coalesced=True si le calcul d'une autre requête a été réutilisé"""
+        task = self._calls.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(task), True
+
+        # Tâche indépendante : l'annulation du premier appelant n'interrompt pas les suivants
+        task = asyncio.ensure_future(fn())
+        self._calls[key] = task
+        task.add_done_callback(lambda t: self._done(key, t))
+        self.stats["leaders"] += 1
+        return await asyncio.shield(task), False
+
+    def _done(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # Exception déjà transmise aux appelants : éviter l'avertissement asyncio
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def get_stats(self) -> dict:
+        total = self.stats["leaders"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "coalesced_rate": round(self.stats["coalesced"] / total, 3) if total else 0.0,
+            "in_flight": self.in_flight(),
+        }
@@ -1,21 +1,56 @@
 """
 Script de démarrage intelligent pour le backend
-Vérifie si les données existent dans Qdrant et les ingère si nécessaire
+Vérifie si les données existent dans Qdrant et les ingère si nécessaire,
+puis lance le serveur de recherche avec un worker par CPU disponible (SEARCH_WORKERS pour forcer)
 """
 
+import math
 import os
+import shutil
 import time
 import subprocess
 from qdrant_client import QdrantClient
 from qdrant_client.http.exceptions import UnexpectedResponse
 
-COLLECTION_NAME = "chunks"
+from catalog_index import clear_snapshot
+from local_cache import CACHE_DIR
+from qdrant_schema import all_collections
 
 # Configuration Qdrant adaptable (local vs cloud)
 QDRANT_URL = os.getenv("QDRANT_URL")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
 QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
 QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
+QDRANT_PATH = os.getenv("QDRANT_PATH")
+
+def container_cpus() -> int:
+    """CPUs réellement utilisables : affinité du process, bornée par le quota cgroup du conteneur"""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    try:
+        # cgroup v2 : "max 100000" (sans limite) ou "200000 100000" (2 CPUs)
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                quota = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+            if quota > 0:
+                cpus = min(cpus, math.ceil(quota / period))
+        except (OSError, ValueError):
+            pass
+    return max(1, cpus)
+
+def search_workers() -> int:
+    """Nombre de workers uvicorn : SEARCH_WORKERS, sinon un par CPU ; un seul avec Qdrant embarqué (fichier verrouillé)"""
+    if QDRANT_PATH:
+        return 1
+    configured = os.getenv("SEARCH_WORKERS")
+    return max(1, int(configured)) if configured else container_cpus()
 
 def wait_for_qdrant(max_attempts=60):
     """Attendre que Qdrant soit prêt"""
@@ -50,15 +85,15 @@ def wait_for_qdrant(max_attempts=60):
     
     raise Exception("❌ Impossible de se connecter à Qdrant après 2 minutes")
 
-def collection_exists(client):
+def collection_exists(client, collection_name):
     """Vérifier si la collection existe et contient des données"""
     try:
-        collection_info = client.get_collection(COLLECTION_NAME)
+        collection_info = client.get_collection(collection_name)
         points_count = collection_info.points_count
-        print(f"📊 Collection '{COLLECTION_NAME}' trouvée avec {points_count} points")
+        print(f"📊 Collection '{collection_name}' trouvée avec {points_count} points")
         return points_count > 0
     except UnexpectedResponse:
-        print(f"❌ Collection '{COLLECTION_NAME}' n'existe pas")
+        print(f"❌ Collection '{collection_name}' n'existe pas")
         return False
     except Exception as e:
         print(f"⚠️ Erreur lors de la vérification: {e}")
@@ -121,7 +156,8 @@ def main():
     client = wait_for_qdrant()
     
     # Vérifier si les données existent
-    if collection_exists(client):
+    # Une collection par type de contenu en layout partitionné (voir qdrant_schema.py)
+    if all(collection_exists(client, name) for name in all_collections()):
         print("\n✅ Les données sont déjà présentes dans Qdrant")
         print("🚀 Démarrage du serveur...")
     else:
@@ -130,8 +166,23 @@ def main():
         print("\n✅ Ingestion terminée !")
         print("🚀 Démarrage du serveur...\n")
     
+    workers = search_workers()
+    # Transmis aux workers : le régulateur partage les limites OpenAI du nœud entre eux
+    os.environ["SEARCH_WORKERS"] = str(workers)
+    if workers > 1:
+        # Sessions lues par n'importe quel worker : stockage SQLite commun (sauf choix explicite)
+        os.environ.setdefault("SESSION_BACKEND", "sqlite")
+        # Métriques Prometheus agrégées entre workers (voir metrics.py) ; fichiers du démarrage précédent supprimés
+        metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(CACHE_DIR, "prometheus"))
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+    # Catalogue reconstruit depuis Qdrant par le premier worker, puis partagé (voir catalog_index.py)
+    clear_snapshot(os.path.join(CACHE_DIR, "catalog"))
+    print(f"🧵 {workers} worker(s) uvicorn")
+
     # Démarrer Uvicorn
-    os.execvp("uvicorn", ["uvicorn", "search_server:app", "--host", "0.0.0.0", "--port", "8000"])
+    os.execvp("uvicorn", ["uvicorn", "search_server:app", "--host", "0.0.0.0", "--port", "8000",
+                          "--workers", str(workers)])
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,275 @@
+"""
+Script de test pour local_cache.py, embedding_cache.py et semantic_cache.py
+Pour tester : python test_cache.py
+"""
+
+import multiprocessing
+import sqlite3
+import sys
+import tempfile
+import time
+from array import array
+
+import local_cache
+
+
+def test_memory_lru():
+    """Test de l'éviction LRU du cache mémoire"""
+    print("\n🧪 Test 1: LRU mémoire")
+    print("-" * 50)
+
+    cache = local_cache.MemoryCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")  # "a" devient la plus récente
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    print("✅ L'entrée la moins récemment utilisée est évincée")
+
+
+def test_memory_ttl():
+    """Test de l'expiration des entrées en mémoire"""
+    print("\n🧪 Test 2: TTL mémoire")
+    print("-" * 50)
+
+    cache = local_cache.MemoryCache(max_entries=10, ttl=0.05)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    print("✅ Les entrées expirées ne sont plus servies")
+
+
+def test_sqlite_persistence():
+    """Test de la persistance et de la taille max du cache disque"""
+    print("\n🧪 Test 3: Cache SQLite")
+    print("-" * 50)
+
+    local_cache.CACHE_DIR = tempfile.mkdtemp()
+    cache = local_cache.SqliteCache("test.sqlite3", max_entries=2, evict_every=1)
+    cache.set("a", b"1")
+    cache.set("b", b"2")
+    cache.set("c", b"3")
+    cache.flush()
+    assert len(cache) == 2
+
+    # Une nouvelle instance relit le même fichier
+    reopened = local_cache.SqliteCache("test.sqlite3", max_entries=2)
+    assert reopened.get("c") == b"3"
+    print("✅ Les entrées survivent à la réouverture du fichier")
+
+
+def test_embedding_cache():
+    """Test du cache d'embeddings sur des requêtes normalisées"""
+    print("\n🧪 Test 4: Cache d'embeddings")
+    print("-" * 50)
+
+    local_cache.CACHE_DIR = tempfile.mkdtemp()
+    from embedding_cache import EmbeddingCache
+
+    cache = EmbeddingCache()
+    assert cache.get("model", "Paris") is None
+    cache.set("model", "Paris", [0.5, 0.25])
+
+    assert cache.get("model", "  paris ") == [0.5, 0.25]
+    assert cache.get("other-model", "Paris") is None
+
+    # Le niveau disque répond quand la mémoire est vide
+    cache.memory.clear()
+    assert cache.get("model", "PARIS") == [0.5, 0.25]
+
+    stats = cache.get_stats()
+    assert stats["memory_hits"] == 1 and stats["disk_hits"] == 1 and stats["misses"] == 2
+    print(f"✅ Statistiques: {stats}")
+
+
+def test_semantic_cache():
+    """Test du cache sémantique des réponses"""
+    print("\n🧪 Test 5: Cache sémantique")
+    print("-" * 50)
+
+    from semantic_cache import SemanticCache
+
+    cache = SemanticCache(threshold=0.95, ttl=60, max_entries=2)
+    cache.set([1.0, 0.0], "scope", {"answer": "ECLA"})
+
+    assert cache.get([0.99, 0.05], "scope") == {"answer": "ECLA"}
+    assert cache.get([0.99, 0.05], "other-scope") is None
+    assert cache.get([0.5, 0.5], "scope") is None
+
+    # Taille max : l'entrée la moins récemment servie est évincée
+    cache.set([0.0, 1.0], "scope", {"answer": "services"})
+    cache.get([1.0, 0.0], "scope")
+    cache.set([-1.0, 0.0], "scope", {"answer": "Lille"})
+    assert cache.get([0.0, 1.0], "scope") is None
+    assert cache.get([1.0, 0.0], "scope") == {"answer": "ECLA"}
+
+    cache.clear()
+    assert cache.get([1.0, 0.0], "scope") is None
+    print(f"✅ Statistiques: {cache.get_stats()}")
+
+
+def test_session_store():
+    """Test des sessions de conversation"""
+    print("\n🧪 Test 6: Sessions")
+    print("-" * 50)
+
+    from session_store import SessionStore, new_session
+
+    local_cache.CACHE_DIR = tempfile.mkdtemp()
+    for backend in (local_cache.MemoryCache(max_entries=2, ttl=60), local_cache.SqliteCache("sessions.sqlite3")):
+        store = SessionStore(backend)
+        assert store.get("abc") is None
+
+        session = new_session()
+        store.record_turn("abc", session, "T2 à Lille", "Voici les T2 à Lille", {"city": "Lille", "rooms": 2}, True)
+        for i in range(5):
+            store.record_turn("abc", session, f"question {i}", "x" * 1000, session["criteria"], True)
+
+        session = store.get("abc")
+        assert session["criteria"] == {"city": "Lille", "rooms": 2} and session["turns"] == 6
+        assert len(session["history"]) == 6 and len(session["history"][-1]["content"]) == 400
+    print(f"✅ Statistiques: {store.get_stats()}")
+
+
+def test_session_concurrent_turns():
+    """Test : tours simultanés sur la même session (threads, et deux workers sur le même fichier SQLite)"""
+    print("\n🧪 Test 7: Tours simultanés")
+    print("-" * 50)
+
+    from concurrent.futures import ThreadPoolExecutor
+    from session_store import SessionStore, new_session
+
+    local_cache.CACHE_DIR = tempfile.mkdtemp()
+    backends = [
+        (local_cache.MemoryCache(max_entries=10, ttl=60),) * 2,
+        (local_cache.SqliteCache("sessions.sqlite3"), local_cache.SqliteCache("sessions.sqlite3")),
+    ]
+    for workers in backends:
+        stores = [SessionStore(backend) for backend in workers]
+        # Chaque requête a lu la session (vide) avant que les autres n'enregistrent leur tour
+        sessions = [new_session() for _ in range(20)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(
+                lambda i: stores[i % 2].record_turn("abc", sessions[i], f"question {i}", "réponse", None, i == 3),
+                range(20)
+            ))
+
+        session = stores[0].get("abc")
+        assert session["turns"] == 20, session["turns"]
+        assert session["is_apartment_search"] and session["criteria"] == {}
+        assert len(session["history"]) == 6
+    print("✅ Aucun tour perdu")
+
+
+def _write_from_worker(cache_dir: str):
+    local_cache.CACHE_DIR = cache_dir
+    cache = local_cache.SqliteCache("shared.sqlite3")
+    cache.set("embedding", b"vecteur")
+    cache.flush()  # Process enfant terminé par os._exit : pas d'atexit
+
+
+def test_sqlite_shared_between_processes():
+    """Test du partage du cache disque entre workers (process distincts, même nœud)"""
+    print("\n🧪 Test 8: Cache SQLite partagé entre process")
+    print("-" * 50)
+
+    local_cache.CACHE_DIR = tempfile.mkdtemp()
+    cache = local_cache.SqliteCache("shared.sqlite3")
+    assert cache.get("embedding") is None
+
+    worker = multiprocessing.get_context("spawn").Process(target=_write_from_worker, args=(local_cache.CACHE_DIR,))
+    worker.start()
+    worker.join(timeout=30)
+    assert worker.exitcode == 0
+    # L'entrée écrite par l'autre process est lue sans réouverture
+    assert cache.get("embedding") == b"vecteur"
+    mode = cache._conn.execute("PRAGMA journal_mode").fetchone()[0]
+    assert mode == "wal", mode
+    print("✅ Entrée écrite par un autre worker lue directement (journal WAL)")
+
+
+def test_sqlite_writes_do_not_block():
+    """Test : verrou d'écriture tenu par un autre worker, get/set ne bloquent pas l'appelant"""
+    print("\n🧪 Test 9: Écritures hors de la boucle")
+    print("-" * 50)
+
+    local_cache.CACHE_DIR = tempfile.mkdtemp()
+    cache = local_cache.SqliteCache("busy.sqlite3")
+    cache.set("a", b"1")
+    cache.flush()
+
+    other_worker = sqlite3.connect(cache.path, isolation_level=None)
+    other_worker.execute("BEGIN IMMEDIATE")  # Verrou d'écriture tenu
+    start = time.perf_counter()
+    cache.set("b", b"2")
+    assert cache.get("a") == b"1" and cache.get("b") == b"2"
+    elapsed = time.perf_counter() - start
+    assert elapsed < 0.1, elapsed
+    other_worker.execute("COMMIT")
+    other_worker.close()
+
+    cache.flush()
+    assert local_cache.SqliteCache("busy.sqlite3").get("b") == b"2"
+    print(f"✅ get/set en {elapsed * 1000:.1f} ms malgré le verrou, écriture faite ensuite")
+
+
+def test_promotion_keeps_disk_expiry():
+    """Test : entrée remontée du disque vers la mémoire, elle expire en même temps que sur le disque"""
+    print("\n🧪 Test 10: Remontée en mémoire")
+    print("-" * 50)
+
+    local_cache.CACHE_DIR = tempfile.mkdtemp()
+    from embedding_cache import EmbeddingCache
+    from llm_cache import CompletionCache
+
+    embeddings = EmbeddingCache()
+    embeddings.disk.set("model:paris", array("f", [0.5]).tobytes(), ttl=0.2)
+    assert embeddings.get("model", "Paris") == [0.5]
+
+    completions = CompletionCache()
+    completions.disk.set("intent:paris", "réponse".encode("utf-8"), ttl=0.2)
+    assert completions.get("intent", "intent:paris") == "réponse"
+
+    time.sleep(0.3)
+    assert embeddings.get("model", "Paris") is None
+    assert completions.get("intent", "intent:paris") is None
+    print("✅ Plus servie par la mémoire après l'expiration sur le disque")
+
+
+def run_all_tests():
+    """Exécuter tous les tests"""
+    print("=" * 50)
+    print("🚀 Tests des caches locaux")
+    print("=" * 50)
+
+    tests = [
+        ("LRU mémoire", test_memory_lru),
+        ("TTL mémoire", test_memory_ttl),
+        ("Cache SQLite", test_sqlite_persistence),
+        ("Cache d'embeddings", test_embedding_cache),
+        ("Cache sémantique", test_semantic_cache),
+        ("Sessions", test_session_store),
+        ("Tours simultanés", test_session_concurrent_turns),
+        ("Cache SQLite partagé", test_sqlite_shared_between_processes),
+        ("Écritures hors de la boucle", test_sqlite_writes_do_not_block),
+        ("Remontée en mémoire", test_promotion_keeps_disk_expiry),
+    ]
+
+    failed = 0
+    for name, test_func in tests:
+        try:
+            test_func()
+        except Exception as e:
+            print(f"\n❌ Test '{name}' a échoué: {e!r}")
+            failed += 1
+
+    print(f"\n🎯 Score: {len(tests) - failed}/{len(tests)} tests réussis")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_all_tests())
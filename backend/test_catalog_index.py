@@ -0,0 +1,133 @@
+"""
+Script de test pour catalog_index.py (catalogue en mémoire et instantané partagé entre workers)
+Pour tester : python test_catalog_index.py
+"""
+
+import sys
+import tempfile
+
+import numpy as np
+from qdrant_client.models import Record
+
+from apartment_cards import apartment_payload, card_from_payload
+from catalog_index import ApartmentCatalog, claim_snapshot_build, clear_snapshot, release_snapshot_build, snapshot_generation
+
+ZONES = {"Paris": ["Villejuif", "Massy-Palaiseau"]}
+
+
+def make_points():
+    apartments = [
+        ("apt-1", "Villejuif", 1, 18, 650, [1.0, 0.0, 0.0]),
+        ("apt-2", "Massy-Palaiseau", 2, 40, 900, [0.0, 1.0, 0.0]),
+        ("apt-3", "Lille", 1, 25, 550, [0.6, 0.8, 0.0]),
+    ]
+    return [
+        Record(id=i, vector=vector, payload=apartment_payload({
+            "id": apartment_id, "text": f"{city} {rooms} pièces",
+            "metadata": {"city": city, "rooms": rooms, "surface_m2": surface, "rent_cc_eur": rent, "furnished": True},
+        }))
+        for i, (apartment_id, city, rooms, surface, rent, vector) in enumerate(apartments, start=1)
+    ]
+
+
+def test_search():
+    """Test des index par champ et du tri par similarité / loyer"""
+    print("\n🧪 Test 1: Recherche dans le catalogue")
+    print("-" * 50)
+
+    catalog = ApartmentCatalog(ZONES)
+    catalog.load(make_points())
+    assert [p.payload["apartment_id"] for p in catalog.search([0.0, 1.0, 0.0])] == ["apt-2", "apt-3", "apt-1"]
+    assert [p.payload["apartment_id"] for p in catalog.search(zone="Paris")] == ["apt-1", "apt-2"]
+    assert [p.payload["apartment_id"] for p in catalog.search(rooms=1, max_rent=600)] == ["apt-3"]
+    print("✅ Filtres et classements corrects")
+
+
+def test_shared_snapshot():
+    """Test de l'instantané : écrit par un worker, relu (vecteurs projetés en mémoire) par un autre"""
+    print("\n🧪 Test 2: Instantané partagé")
+    print("-" * 50)
+
+    directory = tempfile.mkdtemp()
+    builder = ApartmentCatalog(ZONES)
+    reader = ApartmentCatalog(ZONES)
+    assert not reader.load_snapshot(directory)
+
+    builder.load(make_points())
+    generation = builder.save_snapshot(directory)
+    assert snapshot_generation(directory) == generation
+
+    assert reader.load_snapshot(directory) and reader.generation == generation
+    assert isinstance(reader.vectors, np.memmap)
+    query = [0.6, 0.8, 0.0]
+    assert [(p.id, round(p.score, 4)) for p in reader.search(query)] == \
+           [(p.id, round(p.score, 4)) for p in builder.search(query)]
+
+    # Nouvelle génération publiée : les anciennes au-delà des deux dernières sont supprimées
+    for _ in range(3):
+        latest = builder.save_snapshot(directory)
+    assert reader.load_snapshot(directory) and reader.generation == latest
+
+    clear_snapshot(directory)
+    assert snapshot_generation(directory) is None
+    print(f"✅ Génération {latest} relue par un autre catalogue")
+
+
+def test_build_lock():
+    """Test du verrou de construction : un seul worker relit Qdrant"""
+    print("\n🧪 Test 3: Verrou de construction")
+    print("-" * 50)
+
+    directory = tempfile.mkdtemp()
+    assert claim_snapshot_build(directory)
+    assert not claim_snapshot_build(directory)
+    release_snapshot_build(directory)
+    assert claim_snapshot_build(directory)
+    print("✅ Verrou exclusif puis libéré")
+
+
+def test_card_schema():
+    """Test des champs des cards : identiques à ceux construits par la recherche avant les cards précalculées"""
+    print("\n🧪 Test 4: Champs des cards")
+    print("-" * 50)
+
+    primary = ["id", "typologie_id", "city", "rooms", "surface_m2", "furnished", "rent_cc_eur", "availability_date",
+               "energy_label", "postal_code", "floor", "orientation", "bed_size", "has_ac", "application_fee",
+               "deposit_months", "is_typologie"]
+    broadened = primary[:5] + ["surface_min", "surface_max"] + primary[5:]
+    payload = make_points()[0].payload
+    assert list(card_from_payload(payload)) == primary
+    assert list(card_from_payload(payload, broadened=True)) == broadened
+    # Point indexé avant les cards précalculées : converti à la volée, mêmes champs
+    legacy = {field: value for field, value in payload.items() if field != "card"}
+    assert list(card_from_payload(legacy)) == primary
+    print("✅ Recherche principale sans fourchette de surface, recherche élargie avec")
+
+
+def run_all_tests():
+    """Exécuter tous les tests"""
+    print("=" * 50)
+    print("🚀 Tests de catalog_index.py")
+    print("=" * 50)
+
+    tests = [
+        ("Recherche dans le catalogue", test_search),
+        ("Instantané partagé", test_shared_snapshot),
+        ("Verrou de construction", test_build_lock),
+        ("Champs des cards", test_card_schema),
+    ]
+
+    failed = 0
+    for name, test_func in tests:
+        try:
+            test_func()
+        except Exception as e:
+            print(f"\n❌ Test '{name}' a échoué: {e!r}")
+            failed += 1
+
+    print(f"\n🎯 Score: {len(tests) - failed}/{len(tests)} tests réussis")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_all_tests())
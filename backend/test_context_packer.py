@@ -0,0 +1,112 @@
+"""
+Script de test pour context_packer.py
+Pour tester : python test_context_packer.py
+"""
+
+import sys
+
+import context_packer
+from context_packer import count_tokens, pack_chunks, render_chunk
+
+
+def chunk(content, score):
+    return {"content": content, "url": "", "type": "service", "score": score}
+
+
+def test_dedup():
+    """Test de la suppression des quasi-doublons"""
+    print("\n🧪 Test 1: Dédoublonnage")
+    print("-" * 50)
+
+    chunks = [
+        chunk("Ecla propose des résidences étudiantes meublées à Massy, Villejuif et Noisy-le-Grand", 0.9),
+        chunk("Ecla propose des résidences étudiantes meublées à Massy, Villejuif et Noisy-le-Grand !", 0.89),
+        chunk("La salle de sport et la laverie sont accessibles à tous les résidents", 0.7),
+    ]
+    packed = pack_chunks(chunks, token_budget=1000)
+    assert [c["score"] for c in packed] == [0.9, 0.7]
+    print("✅ Le doublon le moins pertinent est retiré")
+
+
+def test_diversity_and_order():
+    """Test de la sélection MMR : un chunk différent passe devant un chunk redondant"""
+    print("\n🧪 Test 2: Diversité")
+    print("-" * 50)
+
+    base = "les appartements de la residence sont equipes d une cuisine d un bureau et d un lit double"
+    chunks = [
+        chunk(base, 0.90),
+        chunk(base + " et d une salle de bain privative", 0.88),
+        chunk("le coliving ecla organise des evenements chaque semaine pour les residents", 0.80),
+    ]
+    budget = count_tokens(render_chunk(chunks[0])) + count_tokens(render_chunk(chunks[2])) + 2
+    packed = pack_chunks(chunks, token_budget=budget, dedup_threshold=1.0)
+    assert [c["score"] for c in packed] == [0.90, 0.80]
+    print("✅ Sous-ensemble varié, ordonné par pertinence")
+
+
+def test_budget():
+    """Test du budget de tokens"""
+    print("\n🧪 Test 3: Budget de tokens")
+    print("-" * 50)
+
+    chunks = [chunk(f"information numero {i} " + "detail " * 40, 1 - i / 100) for i in range(20)]
+    budget = 150
+    packed = pack_chunks(chunks, token_budget=budget)
+    used = sum(count_tokens(render_chunk(c)) + 1 for c in packed)
+    assert 0 < len(packed) < len(chunks) and used <= budget
+
+    # Le chunk le plus pertinent est gardé même s'il dépasse le budget
+    assert pack_chunks(chunks[:1], token_budget=1) == chunks[:1]
+    assert pack_chunks([]) == []
+    print(f"✅ {len(packed)} chunks pour {used} tokens (budget {budget})")
+
+
+def test_tokenizer_unavailable():
+    """Test : fichier BPE non téléchargeable (conteneur hors ligne), estimation au lieu d'une erreur"""
+    print("\n🧪 Test 4: Tokenizer indisponible")
+    print("-" * 50)
+
+    class OfflineTiktoken:
+        @staticmethod
+        def encoding_for_model(model):
+            raise ConnectionError("pas de réseau")
+
+    original = context_packer.tiktoken
+    context_packer.tiktoken = OfflineTiktoken
+    try:
+        assert count_tokens("x" * 40, model="modele-hors-ligne") == 10
+        assert count_tokens("", model="modele-hors-ligne") == 0
+    finally:
+        context_packer.tiktoken = original
+        context_packer._encodings.pop("modele-hors-ligne", None)
+    print("✅ Estimation ~4 caractères par token")
+
+
+def run_all_tests():
+    """Exécuter tous les tests"""
+    print("=" * 50)
+    print("🚀 Tests de context_packer.py")
+    print("=" * 50)
+
+    tests = [
+        ("Dédoublonnage", test_dedup),
+        ("Diversité", test_diversity_and_order),
+        ("Budget", test_budget),
+        ("Tokenizer indisponible", test_tokenizer_unavailable),
+    ]
+
+    failed = 0
+    for name, test_func in tests:
+        try:
+            test_func()
+        except Exception as e:
+            print(f"\n❌ Test '{name}' a échoué: {e!r}")
+            failed += 1
+
+    print(f"\n🎯 Score: {len(tests) - failed}/{len(tests)} tests réussis")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_all_tests())
@@ -0,0 +1,112 @@
+"""
+Script de test pour fast_intent.py
+Pour tester : python test_fast_intent.py
+"""
+
+import sys
+
+from fast_intent import parse_intent
+
+
+def test_quick_replies():
+    """Test des valeurs de quick replies envoyées par le frontend"""
+    print("\n🧪 Test 1: Quick replies")
+    print("-" * 50)
+
+    assert parse_intent("Paris")["criteria"]["city"] == "Paris"
+    assert parse_intent("Genève")["criteria"]["city"] == "Genève"
+    assert parse_intent("Noisy-le-Grand")["criteria"]["city"] == "Noisy-le-Grand"
+    assert parse_intent("T2")["criteria"]["rooms"] == 2
+    assert parse_intent("Studio")["criteria"]["rooms"] == 1
+    assert parse_intent("800")["criteria"]["max_budget"] == 800
+
+    for value in ["flexible", "Je suis flexible", "all", "Tous"]:
+        result = parse_intent(value)
+        assert result["is_apartment_search"] and result["confidence"] == 1.0, value
+    print("✅ Quick replies analysées sans GPT")
+
+
+def test_simple_criteria():
+    """Test des phrases de critères simples"""
+    print("\n🧪 Test 2: Critères simples")
+    print("-" * 50)
+
+    criteria = parse_intent("T1 à Lyon moins de 600€")["criteria"]
+    assert criteria["rooms"] == 1 and criteria["city"] == "Lyon" and criteria["max_budget"] == 600
+
+    criteria = parse_intent("studio meublé entre 500 et 700 euros à Massy")["criteria"]
+    assert criteria["min_budget"] == 500 and criteria["max_budget"] == 700
+    assert criteria["furnished"] is True and criteria["city"] == "Massy-Palaiseau"
+
+    criteria = parse_intent("logement non meublé de moins de 30 m2")["criteria"]
+    assert criteria["furnished"] is False and criteria["max_surface"] == 30 and criteria["max_budget"] is None
+    print("✅ Critères extraits")
+
+
+def test_history_merge():
+    """Test de la fusion des critères avec l'historique"""
+    print("\n🧪 Test 3: Historique")
+    print("-" * 50)
+
+    history = [
+        {"role": "user", "content": "Archamps"},
+        {"role": "assistant", "content": "Quelle typologie vous intéresse ?"},
+    ]
+    criteria = parse_intent("t1 et 600€", history)["criteria"]
+    assert criteria["city"] == "Archamps" and criteria["rooms"] == 1 and criteria["max_budget"] == 600
+
+    # "Tous" remet la typologie à zéro
+    history = [{"role": "user", "content": "T2 à Lille"}]
+    criteria = parse_intent("Tous", history)["criteria"]
+    assert criteria["city"] == "Lille" and criteria["rooms"] is None
+    print("✅ Critères de l'historique conservés")
+
+    # Session serveur : critères déjà extraits, sans historique
+    session_criteria = {"city": "Archamps", "max_budget": 600, "rooms": None}
+    criteria = parse_intent("T1", base_criteria=session_criteria)["criteria"]
+    assert criteria["city"] == "Archamps" and criteria["rooms"] == 1 and criteria["max_budget"] == 600
+    assert parse_intent("800", base_criteria=session_criteria)["criteria"]["max_budget"] == 800
+    print("✅ Critères de la session complétés par la nouvelle question")
+
+
+def test_escalation():
+    """Test des requêtes laissées à GPT"""
+    print("\n🧪 Test 4: Escalade vers GPT")
+    print("-" * 50)
+
+    assert parse_intent("quels sont les services chez ECLA ?") is None
+    assert parse_intent("oui") is None
+    assert parse_intent("3 appartements")["confidence"] < 1.0
+
+    history = [{"role": "user", "content": "c'est quoi les forfaits ?"}]
+    assert parse_intent("Paris", history)["confidence"] == 0.0
+    print("✅ Les requêtes libres sont confiées à GPT")
+
+
+def run_all_tests():
+    """Exécuter tous les tests"""
+    print("=" * 50)
+    print("🚀 Tests de fast_intent.py")
+    print("=" * 50)
+
+    tests = [
+        ("Quick replies", test_quick_replies),
+        ("Critères simples", test_simple_criteria),
+        ("Historique", test_history_merge),
+        ("Escalade", test_escalation),
+    ]
+
+    failed = 0
+    for name, test_func in tests:
+        try:
+            test_func()
+        except Exception as e:
+            print(f"\n❌ Test '{name}' a échoué: {e!r}")
+            failed += 1
+
+    print(f"\n🎯 Score: {len(tests) - failed}/{len(tests)} tests réussis")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_all_tests())
@@ -0,0 +1,127 @@
+"""
+Script de test pour governor.py (régulation des appels OpenAI)
+Pour tester : python test_governor.py
+"""
+
+import asyncio
+import sys
+
+from governor import PRIORITY_FREE_TEXT, PRIORITY_QUICK_REPLY, Governor, Saturated, request_priority
+
+
+async def call(governor, model, order, name, priority=PRIORITY_FREE_TEXT, duration=0.02, cost=0.0):
+    request_priority.set(priority)
+    async with governor.slot(model, cost=cost):
+        order.append(name)
+        await asyncio.sleep(duration)
+    return name
+
+
+def test_concurrency_and_priority():
+    """Test de la limite d'appels simultanés et de la priorité aux quick replies"""
+    print("\n🧪 Test 1: Concurrence et priorité")
+    print("-" * 50)
+
+    async def scenario():
+        governor = Governor(concurrency={"gpt-4": 1}, tpm={}, queue_size=10, max_wait=2)
+        order = []
+        first = asyncio.create_task(call(governor, "gpt-4", order, "first"))
+        await asyncio.sleep(0.005)
+        tasks = [asyncio.create_task(call(governor, "gpt-4", order, f"texte-{i}")) for i in range(2)]
+        await asyncio.sleep(0.005)
+        tasks.append(asyncio.create_task(call(governor, "gpt-4", order, "quick", PRIORITY_QUICK_REPLY)))
+        await asyncio.gather(first, *tasks)
+        return governor, order
+
+    governor, order = asyncio.run(scenario())
+    assert order == ["first", "quick", "texte-0", "texte-1"], order
+    stats = governor.get_stats()["gpt-4"]
+    assert stats["admitted"] == 4 and stats["queued"] == 3 and stats["active"] == 0
+    print(f"✅ Ordre de passage: {order}")
+
+
+def test_shedding():
+    """Test des refus : file pleine et attente trop longue"""
+    print("\n🧪 Test 2: Refus rapides")
+    print("-" * 50)
+
+    async def scenario():
+        governor = Governor(concurrency={"gpt-4": 1}, tpm={}, queue_size=1, max_wait=0.05)
+        order = []
+        results = await asyncio.gather(
+            call(governor, "gpt-4", order, "a", duration=0.2),
+            call(governor, "gpt-4", order, "b"),
+            call(governor, "gpt-4", order, "c"),
+            return_exceptions=True
+        )
+        return governor, results
+
+    governor, results = asyncio.run(scenario())
+    errors = [r for r in results if isinstance(r, Saturated)]
+    assert results[0] == "a" and len(errors) == 2
+    assert {e.reason for e in errors} == {"queue_full", "timeout"} and all(e.retry_after >= 1 for e in errors)
+    stats = governor.get_stats()["gpt-4"]
+    assert stats["shed_queue_full"] == 1 and stats["shed_timeout"] == 1 and stats["queue_depth"] == 0
+    print(f"✅ Refus: {[(e.reason, e.retry_after) for e in errors]}")
+
+
+def test_token_bucket():
+    """Test du budget de tokens par minute"""
+    print("\n🧪 Test 3: Budget de tokens")
+    print("-" * 50)
+
+    async def scenario():
+        # 6000 tokens/min = 100 tokens/s : après 5990 tokens consommés, 20 tokens demandent ~0.1s de recharge
+        governor = Governor(concurrency={"emb": 10}, tpm={"emb": 6000}, queue_size=10, max_wait=2)
+        order = []
+        await call(governor, "emb", order, "a", duration=0, cost=5990)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await call(governor, "emb", order, "b", duration=0, cost=20)
+        return loop.time() - start
+
+    waited = asyncio.run(scenario())
+    assert 0.05 <= waited < 0.5, waited
+    print(f"✅ Attente du rechargement: {waited:.2f}s")
+
+
+def test_worker_share():
+    """Test du partage des limites du nœud entre workers"""
+    print("\n🧪 Test 4: Part de chaque worker")
+    print("-" * 50)
+
+    governor = Governor(concurrency={"gpt-4": 8}, tpm={"gpt-4": 40000}, default_concurrency=2, workers=3)
+    gate = governor.gate("gpt-4")
+    assert gate.concurrency == 2 and gate.bucket.capacity == 40000 / 3
+    # Jamais moins d'un appel simultané par worker
+    assert governor.gate("autre").concurrency == 1
+    print(f"✅ gpt-4 : {gate.concurrency} appels simultanés, {gate.bucket.capacity:.0f} tokens/min par worker")
+
+
+def run_all_tests():
+    """Exécuter tous les tests"""
+    print("=" * 50)
+    print("🚀 Tests de governor.py")
+    print("=" * 50)
+
+    tests = [
+        ("Concurrence et priorité", test_concurrency_and_priority),
+        ("Refus rapides", test_shedding),
+        ("Budget de tokens", test_token_bucket),
+        ("Part de chaque worker", test_worker_share),
+    ]
+
+    failed = 0
+    for name, test_func in tests:
+        try:
+            test_func()
+        except Exception as e:
+            print(f"\n❌ Test '{name}' a échoué: {e!r}")
+            failed += 1
+
+    print(f"\n🎯 Score: {len(tests) - failed}/{len(tests)} tests réussis")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_all_tests())
@@ -0,0 +1,156 @@
+"""
+Script de test pour hedging.py (appels doublés quand la réponse tarde)
+Pour tester : python test_hedging.py
+"""
+
+import asyncio
+import sys
+
+from hedging import Hedger
+
+
+def make_call(latencies):
+    """Fabrique d'appels dont la n-ième répond après latencies[n] secondes"""
+    calls = []
+
+    async def call():
+        attempt = len(calls)
+        calls.append(attempt)
+        await asyncio.sleep(latencies[attempt] if attempt < len(latencies) else 0.001)
+        return attempt
+
+    return call, calls
+
+
+def test_warmup_and_disabled():
+    """Test : pas de doublon désactivé, ni tant que l'historique de latences est trop court"""
+    print("\n🧪 Test 1: Désactivé et historique insuffisant")
+    print("-" * 50)
+
+    async def scenario():
+        disabled = Hedger(enabled=False, sites=["intent"])
+        call, calls = make_call([0.01])
+        await disabled.run("intent", "gpt-4o-mini", call)
+        assert calls == [0] and disabled.get_stats() == {}
+
+        hedger = Hedger(enabled=True, sites=["intent"], min_samples=3)
+        call, calls = make_call([0.01, 0.01])
+        await hedger.run("intent", "gpt-4o-mini", call)
+        await hedger.run("summary", "gpt-4", call)  # Site non concerné
+        return hedger, calls
+
+    hedger, calls = asyncio.run(scenario())
+    stats = hedger.get_stats()["intent:gpt-4o-mini"]
+    assert len(calls) == 2 and stats["calls"] == 1 and stats["fired"] == 0 and stats["delay_seconds"] is None
+    print(f"✅ Stats: {stats}")
+
+
+def test_hedge_wins():
+    """Test : l'appel lent est doublé après le percentile, le doublon gagne et l'original est annulé"""
+    print("\n🧪 Test 2: Doublon gagnant")
+    print("-" * 50)
+
+    async def scenario():
+        hedger = Hedger(enabled=True, sites=["embedding"], percentile=90, max_extra=0.5, min_samples=5, min_delay=0)
+        for _ in range(5):
+            call, _ = make_call([0.01])
+            await hedger.run("embedding", "emb", call)
+        call, calls = make_call([1.0, 0.01])
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        result = await hedger.run("embedding", "emb", call)
+        return hedger, result, calls, loop.time() - start
+
+    hedger, result, calls, elapsed = asyncio.run(scenario())
+    stats = hedger.get_stats()["embedding:emb"]
+    assert result == 1 and calls == [0, 1] and elapsed < 0.5, (result, calls, elapsed)
+    assert stats["fired"] == 1 and stats["won"] == 1 and stats["win_rate"] == 1.0
+    # Latence enregistrée : celle de l'appel principal abandonné (>= délai + doublon), pas celle du doublon
+    assert hedger._latencies["embedding:emb"][-1] >= 0.02, hedger._latencies["embedding:emb"][-1]
+    print(f"✅ Réponse du doublon en {elapsed:.3f}s, stats: {stats}")
+
+
+def test_extra_spend_cap():
+    """Test du plafond de surcoût : au-delà de max_extra, l'appel lent n'est plus doublé"""
+    print("\n🧪 Test 3: Plafond de surcoût")
+    print("-" * 50)
+
+    async def scenario():
+        hedger = Hedger(enabled=True, sites=["commercial"], percentile=50, max_extra=0.1, min_samples=2, min_delay=0)
+        for _ in range(2):
+            call, _ = make_call([0.005])
+            await hedger.run("commercial", "gpt-4", call)
+        call, calls = make_call([0.05, 0.001])
+        results = [await hedger.run("commercial", "gpt-4", call)]
+        return hedger, results, calls
+
+    hedger, results, calls = asyncio.run(scenario())
+    stats = hedger.get_stats()["commercial:gpt-4"]
+    # 3 appels, plafond 10% : aucun doublon autorisé
+    assert results == [0] and calls == [0] and stats["fired"] == 0 and stats["suppressed"] == 1
+    print(f"✅ Stats: {stats}")
+
+
+def test_errors():
+    """Test : l'échec du doublon n'empêche pas l'original de répondre ; double échec = erreur de l'original"""
+    print("\n🧪 Test 4: Erreurs")
+    print("-" * 50)
+
+    async def scenario():
+        hedger = Hedger(enabled=True, sites=["intent"], percentile=50, max_extra=1.0, min_samples=1, min_delay=0)
+        call, _ = make_call([0.005])
+        await hedger.run("intent", "m", call)
+
+        attempts = []
+
+        async def flaky():
+            attempts.append(len(attempts))
+            if len(attempts) == 1:
+                await asyncio.sleep(0.05)
+                return "original"
+            raise RuntimeError("doublon")
+
+        result = await hedger.run("intent", "m", flaky)
+
+        async def failing():
+            await asyncio.sleep(0.02)
+            raise ValueError("original")
+
+        try:
+            await hedger.run("intent", "m", failing)
+        except ValueError as e:
+            return result, str(e)
+        return result, None
+
+    result, error = asyncio.run(scenario())
+    assert result == "original" and error == "original", (result, error)
+    print("✅ Repli sur l'appel original, erreur remontée")
+
+
+def run_all_tests():
+    """Exécuter tous les tests"""
+    print("=" * 50)
+    print("🚀 Tests de hedging.py")
+    print("=" * 50)
+
+    tests = [
+        ("Désactivé et historique insuffisant", test_warmup_and_disabled),
+        ("Doublon gagnant", test_hedge_wins),
+        ("Plafond de surcoût", test_extra_spend_cap),
+        ("Erreurs", test_errors),
+    ]
+
+    failed = 0
+    for name, test_func in tests:
+        try:
+            test_func()
+        except Exception as e:
+            print(f"\n❌ Test '{name}' a échoué: {e!r}")
+            failed += 1
+
+    print(f"\n🎯 Score: {len(tests) - failed}/{len(tests)} tests réussis")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_all_tests())
@@ -0,0 +1,117 @@
+"""
+Script de test pour lexical_index.py (index BM25 des chunks, fusion par rangs réciproques)
+Pour tester : python test_lexical_index.py
+"""
+
+import os
+import sys
+import tempfile
+
+from lexical_index import LexicalIndex, chunk_id, reciprocal_rank_fusion, tokenize
+
+
+def make_index():
+    contents = [
+        ("La laverie de la résidence ECLA est ouverte 7j/7 au rez-de-chaussée.", "services"),
+        ("Les étudiants éligibles peuvent demander l'APL à la CAF dès leur arrivée chez ECLA.", "faq"),
+        ("Le dépôt de garantie (caution) correspond à un mois de loyer hors charges.", "faq"),
+        ("ECLA propose des appartements meublés du studio au T3.", "logement"),
+        ("Salle de sport, espaces de coworking et laverie connectée sont inclus dans les services.", "services"),
+        ("La résidence ECLA Massy-Palaiseau est à 10 minutes du plateau de Saclay.", "residence"),
+        ("Le bail étudiant est signé pour une durée de neuf mois, renouvelable.", "faq"),
+    ]
+    return LexicalIndex.from_chunks([
+        {"content": content, "metadata": {"type": doc_type, "url": f"https://ecla.com/{i}"}}
+        for i, (content, doc_type) in enumerate(contents)
+    ], "ecla")
+
+
+def test_tokenize():
+    """Test de la tokenisation : accents, élisions, mots vides et pluriels"""
+    print("\n🧪 Test 1: Tokenisation")
+    print("-" * 50)
+
+    assert tokenize("Éligibilité à l'APL") == ["eligibilite", "apl"]
+    assert tokenize("Les laveries") == tokenize("la laverie") == ["laverie"]
+    assert tokenize("Où sont les bureaux ?") == ["bureau"]
+    print("✅ Tokens normalisés")
+
+
+def test_ranking_and_confidence():
+    """Test du classement BM25 et de la confiance lexicale"""
+    print("\n🧪 Test 2: Classement et confiance")
+    print("-" * 50)
+
+    index = make_index()
+    hits, confidence = index.search("laverie")
+    assert [doc["type"] for doc, _ in hits] == ["services", "services"] and confidence == 1.0
+    assert hits[0][0]["id"] == chunk_id(hits[0][0]["content"], "ecla")
+    assert chunk_id(hits[0][0]["content"], "uxco") != hits[0][0]["id"]
+
+    hits, confidence = index.search("caution")
+    assert "garantie" in hits[0][0]["content"] and confidence == 1.0
+
+    # Terme présent presque partout, ou inconnu de l'index : pas de confiance
+    assert index.search("ECLA")[1] == 0.0
+    assert index.search("piscine") == ([], 0.0)
+
+    # Question rédigée : la confiance baisse avec le nombre de termes
+    _, confidence = index.search("est-ce que la laverie et la salle de sport sont inclus dans les services du loyer")
+    assert confidence < 0.8, confidence
+    print(f"✅ Confiance d'une question longue: {confidence}")
+
+
+def test_reciprocal_rank_fusion():
+    """Test de la fusion : un document bien classé dans les deux listes passe devant"""
+    print("\n🧪 Test 3: Fusion par rangs réciproques")
+    print("-" * 50)
+
+    dense = ["a", "b", "c"]
+    lexical = ["c", "d", "b"]
+    fused = reciprocal_rank_fusion([dense, lexical], key=lambda item: item, k=60)
+    assert [item for item, _ in fused] == ["c", "b", "a", "d"]
+    assert abs(fused[0][1] - (1 / 63 + 1 / 61)) < 1e-9
+    print(f"✅ Classement fusionné: {[item for item, _ in fused]}")
+
+
+def test_save_load():
+    """Test de l'index enregistré puis relu (même classement)"""
+    print("\n🧪 Test 4: Enregistrement et chargement")
+    print("-" * 50)
+
+    index = make_index()
+    path = os.path.join(tempfile.mkdtemp(), "lexical", "ecla.json")
+    index.save(path)
+    loaded = LexicalIndex.load(path)
+    assert len(loaded) == len(index)
+    assert loaded.search("APL éligible") == index.search("APL éligible")
+    print(f"✅ {len(loaded)} chunks relus")
+
+
+def run_all_tests():
+    """Exécuter tous les tests"""
+    print("=" * 50)
+    print("🚀 Tests de lexical_index.py")
+    print("=" * 50)
+
+    tests = [
+        ("Tokenisation", test_tokenize),
+        ("Classement et confiance", test_ranking_and_confidence),
+        ("Fusion par rangs réciproques", test_reciprocal_rank_fusion),
+        ("Enregistrement et chargement", test_save_load),
+    ]
+
+    failed = 0
+    for name, test_func in tests:
+        try:
+            test_func()
+        except Exception as e:
+            print(f"\n❌ Test '{name}' a échoué: {e!r}")
+            failed += 1
+
+    print(f"\n🎯 Score: {len(tests) - failed}/{len(tests)} tests réussis")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_all_tests())
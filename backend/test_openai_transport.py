@@ -0,0 +1,139 @@
+"""
+Script de test pour openai_transport.py (cassettes enregistrement / rejeu)
+Pour tester : python test_openai_transport.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+import httpx
+import openai
+
+import openai_transport
+from openai_transport import AsyncCassetteTransport, CassetteTransport, make_openai_client
+
+CHAT = {
+    "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "Bonjour"}, "finish_reason": "stop"}],
+}
+
+
+def fake_openai(request: httpx.Request) -> httpx.Response:
+    """Faux OpenAI : compte les appels"""
+    fake_openai.calls += 1
+    body = json.loads(request.content)
+    if body.get("stream"):
+        chunks = "".join(
+            f"data: {json.dumps({'id': 'c', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'gpt-4', 'choices': [{'index': 0, 'delta': {'content': t}, 'finish_reason': None}]})}\n\n"
+            for t in ["Bon", "jour"]
+        ) + "data: [DONE]\n\n"
+        return httpx.Response(200, text=chunks, headers={"content-type": "text/event-stream"})
+    return httpx.Response(200, json=CHAT)
+
+
+fake_openai.calls = 0
+
+
+def use_cassette_dir():
+    os.environ["OPENAI_CASSETTE_DIR"] = tempfile.mkdtemp()
+    os.environ["OPENAI_CASSETTE_LATENCY"] = "none"
+
+
+def client_for(transport) -> "openai_transport.OpenAI":
+    return openai_transport.OpenAI(api_key="test", http_client=httpx.Client(transport=transport), max_retries=0)
+
+
+def test_record_then_replay():
+    """Test d'un appel enregistré puis rejoué sans réseau"""
+    print("\n🧪 Test 1: Enregistrement puis rejeu")
+    print("-" * 50)
+    use_cassette_dir()
+
+    recorder = client_for(CassetteTransport("record", inner=httpx.MockTransport(fake_openai)))
+    messages = [{"role": "user", "content": "Bonjour"}]
+    recorded = recorder.chat.completions.create(model="gpt-4", messages=messages)
+
+    calls = fake_openai.calls
+    player = client_for(CassetteTransport("replay", inner=httpx.MockTransport(fake_openai)))
+    replayed = player.chat.completions.create(model="gpt-4", messages=messages)
+
+    assert replayed.choices[0].message.content == recorded.choices[0].message.content == "Bonjour"
+    assert fake_openai.calls == calls
+    print("✅ Réponse rejouée à l'identique, sans appel au serveur")
+
+
+def test_replay_miss():
+    """Test d'une requête absente des cassettes"""
+    print("\n🧪 Test 2: Requête inconnue")
+    print("-" * 50)
+    use_cassette_dir()
+
+    player = client_for(CassetteTransport("replay"))
+    try:
+        player.chat.completions.create(model="gpt-4", messages=[{"role": "user", "content": "inconnue"}])
+        raise AssertionError("Une requête sans cassette doit échouer")
+    except openai.NotFoundError as e:
+        assert "cassette" in str(e).lower(), e
+    print("✅ Erreur 404 explicite")
+
+
+def test_async_stream():
+    """Test du streaming avec le client asynchrone"""
+    print("\n🧪 Test 3: Streaming asynchrone")
+    print("-" * 50)
+    use_cassette_dir()
+
+    async def tokens(mode):
+        transport = AsyncCassetteTransport(mode, inner=httpx.MockTransport(fake_openai))
+        client = openai_transport.AsyncOpenAI(api_key="test", http_client=httpx.AsyncClient(transport=transport))
+        stream = await client.chat.completions.create(
+            model="gpt-4", messages=[{"role": "user", "content": "stream"}], stream=True
+        )
+        return [chunk.choices[0].delta.content async for chunk in stream]
+
+    recorded = asyncio.run(tokens("record"))
+    replayed = asyncio.run(tokens("replay"))
+    assert recorded == replayed == ["Bon", "jour"]
+    print("✅ Chunks rejoués dans le même ordre")
+
+
+def test_factory_off():
+    """Test du mode par défaut : client OpenAI standard"""
+    print("\n🧪 Test 4: Mode désactivé")
+    print("-" * 50)
+    os.environ.pop("OPENAI_CASSETTE_MODE", None)
+    client = make_openai_client(api_key="test")
+    assert not isinstance(client._client._transport, CassetteTransport)
+    print("✅ Aucun transport cassette sans OPENAI_CASSETTE_MODE")
+
+
+def run_all_tests():
+    """Exécuter tous les tests"""
+    print("=" * 50)
+    print("🚀 Tests de openai_transport.py")
+    print("=" * 50)
+
+    tests = [
+        ("Enregistrement puis rejeu", test_record_then_replay),
+        ("Requête inconnue", test_replay_miss),
+        ("Streaming asynchrone", test_async_stream),
+        ("Mode désactivé", test_factory_off),
+    ]
+
+    failed = 0
+    for name, test_func in tests:
+        try:
+            test_func()
+        except Exception as e:
+            print(f"\n❌ Test '{name}' a échoué: {e!r}")
+            failed += 1
+
+    print(f"\n🎯 Score: {len(tests) - failed}/{len(tests)} tests réussis")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_all_tests())
@@ -0,0 +1,152 @@
+"""
+Script de test pour resilience.py (deadline par requête, disjoncteurs)
+Pour tester : python test_resilience.py
+"""
+
+import asyncio
+import sys
+import time
+
+from resilience import CircuitBreaker, degraded_stats, is_degraded, mark_degraded, remaining, stage_budget, start_deadline, track_degraded
+
+
+def test_circuit_breaker():
+    """Test des transitions fermé -> ouvert -> semi-ouvert -> fermé"""
+    print("\n🧪 Test 1: Disjoncteur")
+    print("-" * 50)
+
+    breaker = CircuitBreaker("test", failures=2, reset_after=0.05)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.06)
+    # Semi-ouvert : une seule requête d'essai à la fois
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+    stats = breaker.get_stats()
+    assert stats["opened"] == 2 and stats["rejected"] == 2 and stats["failures"] == 3
+    print(f"✅ Stats: {stats}")
+
+
+def test_deadline_budget():
+    """Test du budget des étapes : limite propre, bornée par le temps restant"""
+    print("\n🧪 Test 2: Deadline et budgets")
+    print("-" * 50)
+
+    async def scenario():
+        # Hors requête (warm-up) : seulement la limite de l'étape
+        assert remaining() is None and stage_budget(4) == 4
+        start_deadline(2)
+        assert stage_budget(4) <= 1.5 and stage_budget(0.5) == 0.5
+        start_deadline(0.1)
+        await asyncio.sleep(0.15)
+        return stage_budget(4)
+
+    # Contexte propre à asyncio.run : la deadline ne fuit pas dans le test suivant
+    assert asyncio.run(scenario()) == 0.0
+    print("✅ Budget nul une fois la deadline dépassée")
+
+
+def test_degraded_tracking():
+    """Test du suivi des étapes dégradées, propre à chaque tâche"""
+    print("\n🧪 Test 3: Étapes dégradées")
+    print("-" * 50)
+
+    async def request(stage):
+        stages = track_degraded()
+        await asyncio.sleep(0)
+        mark_degraded(stage)
+        mark_degraded(stage)
+        return stages, is_degraded(stage)
+
+    async def scenario():
+        return await asyncio.gather(request("intent"), request("commercial"))
+
+    before = dict(degraded_stats)
+    (intent_stages, intent_flag), (commercial_stages, _) = asyncio.run(scenario())
+    assert intent_stages == ["intent"] and commercial_stages == ["commercial"] and intent_flag
+    assert degraded_stats["intent"] == before.get("intent", 0) + 1
+    print(f"✅ Étapes: {intent_stages}, {commercial_stages}")
+
+
+def test_cancelled_trial():
+    """Test : un essai semi-ouvert annulé (ou un streaming fermé) est libéré, le disjoncteur ne reste pas bloqué"""
+    print("\n🧪 Test 4: Essai annulé")
+    print("-" * 50)
+
+    breaker = CircuitBreaker("test", failures=1, reset_after=0.01)
+
+    async def trial():
+        assert breaker.allow()
+        with breaker.guard():
+            await asyncio.sleep(1)
+            breaker.record_success()
+
+    async def scenario():
+        breaker.record_failure()
+        await asyncio.sleep(0.02)
+        task = asyncio.create_task(trial())
+        await asyncio.sleep(0)
+        assert breaker.state == "half_open" and breaker.trial_in_flight
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert not breaker.trial_in_flight and breaker.allow()
+
+    async def stream():
+        with breaker.guard():
+            yield "token"
+            yield "token"
+
+    async def closed_stream():
+        breaker.record_failure()
+        await asyncio.sleep(0.02)
+        assert breaker.allow() and breaker.trial_in_flight
+        tokens = stream()
+        await anext(tokens)
+        await tokens.aclose()
+
+    asyncio.run(closed_stream())
+    assert not breaker.trial_in_flight and breaker.allow()
+    print(f"✅ Essais libérés, état: {breaker.state}")
+
+
+def run_all_tests():
+    """Exécuter tous les tests"""
+    print("=" * 50)
+    print("🚀 Tests de resilience.py")
+    print("=" * 50)
+
+    tests = [
+        ("Disjoncteur", test_circuit_breaker),
+        ("Deadline et budgets", test_deadline_budget),
+        ("Étapes dégradées", test_degraded_tracking),
+        ("Essai annulé", test_cancelled_trial),
+    ]
+
+    failed = 0
+    for name, test_func in tests:
+        try:
+            test_func()
+        except Exception as e:
+            print(f"\n❌ Test '{name}' a échoué: {e!r}")
+            failed += 1
+
+    print(f"\n🎯 Score: {len(tests) - failed}/{len(tests)} tests réussis")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_all_tests())
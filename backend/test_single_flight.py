@@ -0,0 +1,128 @@
+"""
+Script de test pour single_flight.py
+Pour tester : python test_single_flight.py
+"""
+
+import asyncio
+import sys
+
+import metrics
+from metrics import current_timings, share_timings, stage
+from single_flight import SingleFlight
+
+
+def test_coalescing():
+    """Test de requêtes identiques simultanées"""
+    print("\n🧪 Test 1: Requêtes identiques simultanées")
+    print("-" * 50)
+
+    calls = []
+
+    async def compute(value):
+        calls.append(value)
+        await asyncio.sleep(0.05)
+        return value * 2
+
+    async def scenario():
+        flight = SingleFlight()
+        results = await asyncio.gather(
+            *[flight.do("paris", lambda: compute(21)) for _ in range(5)],
+            flight.do("lille", lambda: compute(1)),
+        )
+        # Calcul terminé : une nouvelle requête relance le calcul
+        again = await flight.do("paris", lambda: compute(21))
+        return flight, results, again
+
+    flight, results, again = asyncio.run(scenario())
+    assert [r for r, _ in results] == [42] * 5 + [2]
+    assert [coalesced for _, coalesced in results].count(True) == 4
+    assert again == (42, False) and calls == [21, 1, 21]
+    assert flight.get_stats()["coalesced"] == 4 and flight.in_flight() == 0
+    print(f"✅ Statistiques: {flight.get_stats()}")
+
+
+def test_shared_error_and_cancel():
+    """Test de la propagation des erreurs et de l'annulation du premier appelant"""
+    print("\n🧪 Test 2: Erreurs et annulation")
+    print("-" * 50)
+
+    async def fail():
+        await asyncio.sleep(0.02)
+        raise ValueError("Qdrant indisponible")
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def scenario():
+        flight = SingleFlight()
+        errors = await asyncio.gather(flight.do("k", fail), flight.do("k", fail), return_exceptions=True)
+        assert all(isinstance(e, ValueError) for e in errors)
+
+        leader = asyncio.create_task(flight.do("s", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("s", slow))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(scenario()) == ("ok", True)
+    print("✅ Erreur partagée, calcul poursuivi malgré l'annulation du premier appelant")
+
+
+def test_shared_timings():
+    """Test du Server-Timing d'une requête regroupée : étapes du calcul partagé et marqueur "coalesced" """
+    print("\n🧪 Test 3: Durées partagées")
+    print("-" * 50)
+
+    async def compute():
+        with stage("qdrant_search"):
+            await asyncio.sleep(0.02)
+        return "ok", current_timings()
+
+    async def request(flight):
+        timings = {}
+        metrics._timings.set(timings)  # Comme le middleware, un dict par requête
+        started = asyncio.get_running_loop().time()
+        (result, leader_timings), coalesced = await flight.do("k", compute)
+        if coalesced:
+            share_timings(leader_timings, asyncio.get_running_loop().time() - started)
+        return timings
+
+    async def scenario():
+        flight = SingleFlight()
+        return await asyncio.gather(request(flight), request(flight))
+
+    leader, follower = asyncio.run(scenario())
+    assert list(leader) == ["qdrant_search"]
+    assert list(follower) == ["qdrant_search", "coalesced"]
+    assert follower["qdrant_search"] == leader["qdrant_search"] >= 0.02
+    print(f"✅ Requête regroupée: {follower}")
+
+
+def run_all_tests():
+    """Exécuter tous les tests"""
+    print("=" * 50)
+    print("🚀 Tests de single_flight.py")
+    print("=" * 50)
+
+    tests = [
+        ("Requêtes identiques simultanées", test_coalescing),
+        ("Erreurs et annulation", test_shared_error_and_cancel),
+        ("Durées partagées", test_shared_timings),
+    ]
+
+    failed = 0
+    for name, test_func in tests:
+        try:
+            test_func()
+        except Exception as e:
+            print(f"\n❌ Test '{name}' a échoué: {e!r}")
+            failed += 1
+
+    print(f"\n🎯 Score: {len(tests) - failed}/{len(tests)} tests réussis")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_all_tests())
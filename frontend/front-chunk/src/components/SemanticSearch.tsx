@@ -78,6 +78,10 @@ export default function SemanticSearch() {
     const [showUpsellModal, setShowUpsellModal] = useState(false);
     const messagesRef = useRef<HTMLDivElement>(null);
     const inputRef = useRef<HTMLInputElement>(null);
+    // Session serveur : le backend garde les critères déjà extraits (ville, budget, typologie)
+    const sessionId = useRef(crypto.randomUUID());
+    // Session établie (une réponse reçue) : seuls session_id et la nouvelle question sont envoyés
+    const sessionEstablished = useRef(false);
 
     useEffect(() => {
         if (messagesRef.current) {
@@ -91,6 +95,40 @@ export default function SemanticSearch() {
         }
     }, [isLoading]);
 
+    // Historique conversationnel (exclure le message en cours), envoyé seulement sans session serveur
+    const buildConversationHistory = () => messages
+        .filter(msg => msg.sender !== 'ai' || !msg.isStreaming)
+        .slice(-6)  // Garder les 6 derniers messages (3 échanges)
+        .map(msg => ({
+            role: msg.sender === 'user' ? 'user' : 'assistant',
+            content: msg.content
+        }));
+
+    const postSearch = async (apiUrl: string, body: Record<string, unknown>) => {
+        const send = (resume: boolean) => fetch(`${apiUrl}/search`, {
+            method: "POST",
+            headers: {
+                "Content-Type": "application/json",
+            },
+            body: JSON.stringify({
+                ...body,
+                session_id: sessionId.current,
+                ...(resume ? { resume_session: true } : { conversation_history: buildConversationHistory() }),
+            }),
+        });
+
+        let response = await send(sessionEstablished.current);
+        if (response.status === 409) {
+            // Session expirée côté serveur : l'historique est renvoyé une fois
+            sessionEstablished.current = false;
+            response = await send(false);
+        }
+        if (response.ok) {
+            sessionEstablished.current = true;
+        }
+        return response;
+    };
+
     const handleSendMessage = async () => {
         console.log('🚀🚀🚀 DEBUT handleSendMessage 🚀🚀🚀');
         if (!input.trim() || isLoading) return;
@@ -123,25 +161,9 @@ export default function SemanticSearch() {
             console.log("🌐 Mode DEV:", import.meta.env.DEV);
             console.log("🎯 URL utilisée:", apiUrl);
 
-            // Construire l'historique conversationnel (exclure le message en cours)
-            const conversationHistory = messages
-                .filter(msg => msg.sender !== 'ai' || !msg.isStreaming)
-                .slice(-6)  // Garder les 6 derniers messages (3 échanges)
-                .map(msg => ({
-                    role: msg.sender === 'user' ? 'user' : 'assistant',
-                    content: msg.content
-                }));
-
-            const response = await fetch(`${apiUrl}/search`, {
-                method: "POST",
-                headers: {
-                    "Content-Type": "application/json",
-                },
-                body: JSON.stringify({
-                    query: userMessage.content,
-                    summarize: true,
-                    conversation_history: conversationHistory,
-                }),
+            const response = await postSearch(apiUrl, {
+                query: userMessage.content,
+                summarize: true,
             });
 
             if (!response.ok) {
@@ -339,27 +361,10 @@ export default function SemanticSearch() {
 
             console.log('[DEBUG] Envoi de la requête vers:', `${apiUrl}/search`);
 
-            const conversationHistory = messages
-                .filter(msg => msg.sender !== 'ai' || !msg.isStreaming)
-                .slice(-6)
-                .map(msg => ({
-                    role: msg.sender === 'user' ? 'user' : 'assistant',
-                    content: msg.content
-                }));
-
-            console.log('[DEBUG] Conversation history:', conversationHistory);
-
-            const response = await fetch(`${apiUrl}/search`, {
-                method: "POST",
-                headers: {
-                    "Content-Type": "application/json",
-                },
-                body: JSON.stringify({
-                    query: reply.value === 'flexible' ? "Je suis flexible sur la ville" : `Montre moi les typologies disponibles à ${reply.value}`,
-                    summarize: true,
-                    conversation_history: conversationHistory,
-                    type: "appartement"
-                }),
+            const response = await postSearch(apiUrl, {
+                query: reply.value === 'flexible' ? "Je suis flexible sur la ville" : `Montre moi les typologies disponibles à ${reply.value}`,
+                summarize: true,
+                type: "appartement"
             });
 
             if (!response.ok) {